@@ -4,10 +4,11 @@
 # HUID: 21483389
 #####################################################
 
-from copy import deepcopy
 from router import Router
 from packet import Packet
-from json import dumps, loads
+from pacing import UpdatePacer
+from damping import FlapDamper
+from json import dumps
 
 
 """
@@ -15,18 +16,41 @@ Applies distance vector routing using the following rules:
 - Structures:
     - Distance vectors are (address, cost) maps
     - Next-hop neighbors are stored in (port, neighbor) maps
-- When a router wants to broadcast a message, send to every neighbor
-  via their associated port. Before sending, each neighbor's message
-  is trimmed so they don't get entries based on their own paths.
+    - Each neighbor keeps a "view": the copy of this router's distance
+      vector that neighbor should hold. Views are trimmed so neighbors
+      don't get entries based on their own paths.
+- Updates are versioned deltas. Each update carries this router's version,
+  the last version received from the neighbor (an ack), and only the view
+  entries that changed since the neighbor's last ack. Withdrawn entries are
+  sent with a cost of INF. Every FULL_REFRESH_HEARTBEATS heartbeats, and
+  for new neighbors, the whole view is sent instead.
+- Views are updated incrementally: only addresses whose cost or next hop
+  changed since the last broadcast ("dirty" addresses) are re-examined.
 - When a new link is added, that port is initialized as a Neighbor. If
   any new or optimal paths are discovered because of this addition, the
   new distance vector is broadcasted to all neighbors.
-- When a packet is received, if the update has no change or gives a cheaper
-  path somewhere, apply the update and notify neighbors. Otherwise, if the
-  update indicates a dropped link or increased cost, re-evaluate all paths
-  currently routing through the affected port and broadcast the new DV.
+- When a packet is received, only the entries it carries are examined. If
+  one gives a cheaper path somewhere, apply it and notify neighbors. If one
+  indicates a dropped or more expensive route that we currently use through
+  that neighbor, re-evaluate that destination across all neighbors and
+  broadcast the new DV.
 - When a link is removed, remove the neighbor entry and treat the event
   like bad news, recomputing and emitting the DV.
+- Triggered updates are paced (see pacing.py): changes that arrive within
+  UPDATE_MIN_HEARTBEATS of the last update are coalesced and sent together
+  from handleTime, and the interval doubles up to UPDATE_MAX_HEARTBEATS
+  while changes keep coming.
+- Multipath: for destinations that several neighbors offer at the same
+  lowest cost, every such neighbor's port is kept, and forwardPort spreads
+  traceroutes over them by a hash of their source and destination and our
+  address (Router.pickPort), so a pair's traceroutes always leave on the
+  same port. An equal-cost neighbor is strictly closer to the destination,
+  so it never routes back through us. Only the first (fwd_table) is used
+  for poisoning.
+- Links that keep flapping are damped (see damping.py): once a link's
+  penalty crosses the suppress threshold, it stays down when it comes back
+  up until the penalty decays, so its flaps stop reaching the rest of the
+  network.
 """
 
 
@@ -39,6 +63,18 @@ class Neighbor:
         self.port = port
         self.cost = cost
         self.dv = dv
+        # The trimmed copy of our distance vector this neighbor should hold
+        # : DistanceVector
+        self.view = {}
+        # The version of our update in which each view entry last changed
+        # : Dict[Addr, int]
+        self.changed = {}
+        # The last version of ours this neighbor acknowledged
+        self.acked = 0
+        # The last version of theirs we received
+        self.last_seen = 0
+        # Whether the next update must carry the whole view
+        self.needs_full = True
 
 
 class DVrouter(Router):
@@ -46,6 +82,20 @@ class DVrouter(Router):
 
     # A suitable value for infinity in the tested networks
     INF = 16
+    # Heartbeats between updates that carry the whole distance vector
+    FULL_REFRESH_HEARTBEATS = 5
+    # Heartbeats between triggered updates, at first and under sustained
+    # churn. 0 sends every update immediately
+    UPDATE_MIN_HEARTBEATS = 0.1
+    UPDATE_MAX_HEARTBEATS = 0.4
+    # Whether traceroutes are spread over all equal-cost next hops
+    USE_ECMP = True
+    # Whether links that keep going down are held down (see damping.py), the
+    # heartbeats a link's flap penalty takes to halve, and the most
+    # heartbeats it's held down after its last flap
+    USE_FLAP_DAMPING = True
+    DAMP_HALF_LIFE_HEARTBEATS = 2
+    DAMP_MAX_SUPPRESS_HEARTBEATS = 4
 
     def __init__(self, addr, heartbeatTime):
         """
@@ -55,6 +105,7 @@ class DVrouter(Router):
         Router.__init__(self, addr)  # initialize superclass - don't remove
         self.heartbeatTime = heartbeatTime
         self.last_time = 0
+        self.heartbeats = 0
 
         # Python3 types aren't supported by the course tests:
         # Cost = int, Addr = str, Port = int
@@ -62,10 +113,39 @@ class DVrouter(Router):
         #
         # self.my_dv: DistanceVector = {addr: 0}
         # self.fwd_table: Dict[Addr, Port] = {}
+        # self.multipath: Dict[Addr, Tuple[Port, ...]] = {}
         # self.neighbors: Dict[Port, Neighbor] = {}
+        # self.dirty: Set[Addr] = set()
         self.my_dv = {addr: 0}
         self.fwd_table = {}
+        # Ports of every equal-cost next hop, for destinations with more
+        # than one, and the addresses whose own route changed since they
+        # were last brought up to date
+        self.multipath = {}
+        self.multipath_stale = set()
         self.neighbors = {}
+        self.dirty = set()
+        self.version = 0
+        self.pacer = UpdatePacer(
+            self.UPDATE_MIN_HEARTBEATS * heartbeatTime,
+            self.UPDATE_MAX_HEARTBEATS * heartbeatTime)
+        self.damper = FlapDamper(
+            self.DAMP_HALF_LIFE_HEARTBEATS * heartbeatTime,
+            self.DAMP_MAX_SUPPRESS_HEARTBEATS * heartbeatTime)
+        # Links that came up while suppressed, by neighbor address
+        # : Dict[Addr, Tuple[Port, Cost]]
+        self.held = {}
+
+    def forwardPort(self, srcAddr, dstAddr, inPort):
+        """
+        Returns the port a traceroute to dstAddr leaves on, or None if there
+        is no route. Read-only, so the network can walk routes through the
+        forwarding tables directly.
+        """
+        ports = self.multipath.get(dstAddr)
+        if ports is not None:
+            return self.pickPort(srcAddr, dstAddr, ports)
+        return self.fwd_table.get(dstAddr)
 
     def handleNewLink(self, port, addr, cost):
         """
@@ -78,10 +158,10 @@ class DVrouter(Router):
         connecting to a router or client with address endpoint and link cost
         cost.
         """
-        neighbor = Neighbor(addr, port, cost, {addr: 0})
-        self.neighbors[port] = neighbor
-        if self.__update_better_path(neighbor):
-            self.__broadcast_dv()
+        if self.damper.is_suppressed(addr):
+            self.held[addr] = (port, cost)
+            return
+        self.__add_link(port, addr, cost)
 
     def handlePacket(self, port, packet):
         """
@@ -95,31 +175,45 @@ class DVrouter(Router):
         Methods and fields of the packet class are defined in packet.py
         """
         if packet.isTraceroute():
-            if packet.dstAddr in self.fwd_table:
-                self.send(self.fwd_table[packet.dstAddr], packet)
+            out_port = self.forwardPort(packet.srcAddr, packet.dstAddr, port)
+            if out_port is not None:
+                self.send(out_port, packet)
+            else:
+                self.countDrop(packet)
             return
 
         assert packet.isRouting()
-        parsed = loads(packet.content)
-        neighbor = self.neighbors[port]
-        assert self.neighbors[port].addr == parsed["addr"]
-        neighbor_old_dv = neighbor.dv
-        neighbor.dv = parsed["dv"]
-
-        # If a route through this neighbor is now more expensive or
-        # nonexistent, then we need to recompute all routes with
-        # that in mind. Without purging data related to this
-        # neighbor, bad news would be incorrectly ignored by the
-        # Bellman Ford inequality.
-        if self.__is_bad_news(neighbor_old_dv, neighbor.dv):
-            self.__wipe_port(port)
-            self.__broadcast_dv()
+        nb_addr, version, ack, full, entries = self.codec.decodeDV(
+            packet.content)
+        neighbor = self.neighbors.get(port)
+        if neighbor is None:
+            # Sent over a link we hold down
             return
+        assert neighbor.addr == nb_addr
+        if ack > neighbor.acked:
+            neighbor.acked = ack
+            neighbor.changed = {addr: v for addr, v
+                                in neighbor.changed.iteritems() if v > ack}
+        if version <= neighbor.last_seen:
+            # Reordered behind a newer update. We're done.
+            return
+        neighbor.last_seen = version
 
-        # Otherwise, if the update prompted a positive change in the routing
-        # table, share that update with neighbors.
-        if self.__update_better_path(neighbor):
-            self.__broadcast_dv()
+        changed, worse = self.__apply_update(neighbor, full, entries)
+
+        # If a route we use through this neighbor is now more expensive or
+        # nonexistent, then we need to recompute that destination with
+        # that in mind. Without purging it, bad news would be incorrectly
+        # ignored by the Bellman Ford inequality.
+        wiped = self.__wipe_routes(
+            [addr for addr in worse if self.fwd_table.get(addr) == port])
+
+        # If the update prompted any change in the routing table, share that
+        # update with neighbors.
+        better = self.__update_better_path(neighbor, changed)
+        self.__update_multipath(neighbor, changed)
+        if better or wiped:
+            self.__trigger_update()
 
     def handleRemoveLink(self, port):
         """
@@ -129,17 +223,38 @@ class DVrouter(Router):
         This method is called when the existing link on port number
         port is disconnected.
         """
-        del self.neighbors[port]
-        self.__wipe_port(port)
-        self.__broadcast_dv()
+        if port not in self.neighbors:
+            # A held link; it was down as far as routing was concerned
+            for addr, (held_port, _) in self.held.items():
+                if held_port == port:
+                    del self.held[addr]
+                    self.__flap(addr)
+            return
+        self.__flap(self.neighbors.pop(port).addr)
+        self.__wipe_routes([addr for addr, fwd_port
+                            in self.fwd_table.iteritems() if fwd_port == port])
+        for addr, ports in self.multipath.items():
+            if port in ports:
+                self.__set_multipath(addr, port, False)
+        self.__update_multipath(None, [])
+        self.__trigger_update()
 
     def handleTime(self, timeMillisecs):
         """
         This method is called regularly for sending routing packets at
         regular intervals.
         """
-        if self.last_time + self.heartbeatTime < timeMillisecs:
+        for addr in self.damper.tick(timeMillisecs):
+            if addr in self.held:
+                port, cost = self.held.pop(addr)
+                self.__add_link(port, addr, cost)
+        if self.pacer.tick(timeMillisecs):
+            self.countUpdates(0, 1)
             self.__broadcast_dv()
+        if self.last_time + self.heartbeatTime < timeMillisecs:
+            self.heartbeats += 1
+            self.__broadcast_dv(heartbeat=True)
+            self.pacer.sent()
             self.last_time = timeMillisecs
 
     def debugString(self):
@@ -149,71 +264,206 @@ class DVrouter(Router):
         Return any string that will be helpful for debugging.
         This method is for your own use and will not be graded.
         """
-        return dumps({"dv": self.my_dv, "fwd": self.fwd_table}, indent=4)
+        return dumps({"dv": self.my_dv, "fwd": self.fwd_table,
+                      "multipath": self.multipath, "version": self.version,
+                      "held": self.held},
+                     indent=4)
+
+    def __flap(self, addr):
+        """Adds to the flap penalty of the link to addr, which went down"""
+        if self.USE_FLAP_DAMPING:
+            self.damper.flap(addr)
+
+    def __add_link(self, port, addr, cost):
+        """Starts routing over a link that came up"""
+        neighbor = Neighbor(addr, port, cost, {addr: 0})
+        # Nothing routes through the new port yet, so nothing is trimmed
+        neighbor.view = dict(self.my_dv)
+        self.neighbors[port] = neighbor
+        self.__update_better_path(neighbor, [addr])
+        self.__update_multipath(neighbor, [addr])
+        self.__trigger_update()
+
+    def __trigger_update(self):
+        """
+        Broadcasts the changed routes now, or leaves them for handleTime
+        if the pacer holds the update back.
+        """
+        send = self.pacer.request()
+        self.countUpdates(1, int(send))
+        if send:
+            self.__broadcast_dv()
 
-    def __broadcast_dv(self):
+    def __broadcast_dv(self, heartbeat=False):
         """
-        Sends a routing payload to every next-hop
-        neighbor tracked in the neighbors dict
+        Sends a routing payload to every next-hop neighbor tracked in the
+        neighbors dict that has unacknowledged changes. Heartbeats go to
+        every neighbor, and every FULL_REFRESH_HEARTBEATS-th heartbeat
+        carries the whole view.
         """
+        self.__refresh_views()
+        self.version += 1
+        full_refresh = (heartbeat and
+                        self.heartbeats % self.FULL_REFRESH_HEARTBEATS == 0)
         for neighbor in self.neighbors.values():
-            copied_dv = deepcopy(self.my_dv)
-            # "Poison" any routes going through this neighbor
-            for addr, port in self.fwd_table.items():
-                if port == neighbor.port:
-                    del copied_dv[addr]
-            payload = dumps({
-                "dv": copied_dv,
-                "addr": self.addr,
-            })
+            full = full_refresh or neighbor.needs_full
+            if full:
+                entries = neighbor.view
+                neighbor.needs_full = False
+            else:
+                entries = {addr: neighbor.view.get(addr, self.INF)
+                           for addr, v in neighbor.changed.iteritems()
+                           if v > neighbor.acked}
+                if not entries and not heartbeat:
+                    continue
+            payload = self.codec.encodeDV(self.addr, self.version,
+                                          neighbor.last_seen, full, entries)
             packet = Packet(Packet.ROUTING, self.addr,
                             neighbor.addr, content=payload)
             self.send(neighbor.port, packet)
 
-    def __update_better_path(self, nb):
-        """Examines an incoming distance vector from a neighbor.
-        If any of the neighbor's entries offers a
-        better path than is currently available, update the distance
-        vector and forwarding table.
+    def __refresh_views(self):
+        """
+        Brings every neighbor's view up to date for the dirty addresses,
+        "poisoning" routes that go through that neighbor. Entries that change
+        are tagged with the version of the upcoming update.
+        """
+        for addr in self.dirty:
+            cost = self.my_dv.get(addr)
+            port = self.fwd_table.get(addr)
+            for neighbor in self.neighbors.values():
+                want = None if port == neighbor.port else cost
+                if neighbor.view.get(addr) == want:
+                    continue
+                if want is None:
+                    del neighbor.view[addr]
+                else:
+                    neighbor.view[addr] = want
+                neighbor.changed[addr] = self.version + 1
+        self.dirty = set()
+
+    def __apply_update(self, nb, full, entries):
+        """
+        Applies a full or delta update to the neighbor's cached distance
+        vector. Returns the addresses whose cost changed, and the subset of
+        those that got more expensive or unreachable.
+        """
+        changed = []
+        worse = []
+        if full:
+            new_dv = {addr: cost for addr, cost in entries.iteritems()
+                      if cost < self.INF}
+            for addr, cost in nb.dv.iteritems():
+                if addr not in new_dv or new_dv[addr] > cost:
+                    worse.append(addr)
+                if new_dv.get(addr) != cost:
+                    changed.append(addr)
+            changed.extend(addr for addr in new_dv if addr not in nb.dv)
+            nb.dv = new_dv
+            return changed, worse
+
+        for addr, cost in entries.iteritems():
+            old_cost = nb.dv.get(addr)
+            if cost >= self.INF:
+                if old_cost is None:
+                    continue
+                del nb.dv[addr]
+                worse.append(addr)
+            else:
+                if old_cost == cost:
+                    continue
+                nb.dv[addr] = cost
+                if old_cost is not None and cost > old_cost:
+                    worse.append(addr)
+            changed.append(addr)
+        return changed, worse
+
+    def __update_better_path(self, nb, addrs):
+        """Examines the given entries of a neighbor's distance vector.
+        If any of them offers a better path than is currently available,
+        update the distance vector and forwarding table.
         If an update occurred, returns True. Unless this is called
         in a loop, broadcast_div should be called when this returns
         True."""
         updated_my_dv = False
 
-        for addr, cost in nb.dv.items():
-            if addr not in self.my_dv:
-                self.my_dv[addr] = self.INF
+        for addr in addrs:
+            cost = nb.dv.get(addr)
+            if cost is None:
+                continue
             proposed_cost = cost + nb.cost
-            if self.my_dv[addr] <= proposed_cost:
+            # If there's no viable path, skip it.
+            if proposed_cost >= self.INF:
+                continue
+            if self.my_dv.get(addr, self.INF) <= proposed_cost:
                 continue
             self.my_dv[addr] = proposed_cost
             self.fwd_table[addr] = nb.port
-            # If there's no viable path, remove it.
-            if self.my_dv[addr] >= self.INF:
-                del self.my_dv[addr]
-                del self.fwd_table[addr]
+            self.dirty.add(addr)
+            self.multipath_stale.add(addr)
             updated_my_dv = True
 
         return updated_my_dv
 
-    def __is_bad_news(self, prev_dv, new_dv):
+    def __update_multipath(self, nb, addrs):
         """
-        Returns whether a distance vector update indicates an increase in
-        cost or a dropped link.
+        Brings the equal-cost next hops up to date. Addresses whose own
+        route changed are recomputed across all neighbors; for the others
+        in addrs, whose cost through nb changed, only nb's port can join or
+        leave.
         """
-        for addr, cost in prev_dv.items():
-            if addr not in new_dv or new_dv[addr] > prev_dv[addr]:
-                return True
-        return False
+        if not self.USE_ECMP:
+            self.multipath_stale = set()
+            return
+        for addr in addrs:
+            if addr in self.multipath_stale:
+                continue
+            member = self.__equal_cost(nb, addr)
+            ports = self.multipath.get(addr)
+            # Usually nb neither was nor is an equal-cost next hop
+            if (ports is None and not member or
+                    ports is not None and (nb.port in ports) == member):
+                continue
+            self.__set_multipath(addr, nb.port, member)
+        for addr in self.multipath_stale:
+            ports = tuple(sorted(nb.port for nb in self.neighbors.itervalues()
+                                 if self.__equal_cost(nb, addr)))
+            if len(ports) > 1:
+                self.multipath[addr] = ports
+            else:
+                self.multipath.pop(addr, None)
+        self.multipath_stale = set()
+
+    def __equal_cost(self, nb, addr):
+        """Returns whether nb offers our current cost to addr"""
+        cost = nb.dv.get(addr)
+        return cost is not None and cost + nb.cost == self.my_dv.get(addr)
+
+    def __set_multipath(self, addr, port, member):
+        """Adds port to or removes it from addr's equal-cost next hops"""
+        ports = self.multipath.get(addr)
+        if ports is None:
+            fwd_port = self.fwd_table.get(addr)
+            ports = () if fwd_port is None else (fwd_port,)
+        if (port in ports) == member:
+            return
+        ports = tuple(sorted(set(ports).symmetric_difference([port])))
+        if len(ports) > 1:
+            self.multipath[addr] = ports
+        else:
+            self.multipath.pop(addr, None)
 
-    def __wipe_port(self, port):
+    def __wipe_routes(self, addrs):
         """
-        Removes all routes using this port and recomputes alternate
-        routes using cached neighbor distance vectors.
+        Removes the routes to addrs and recomputes alternate routes
+        using cached neighbor distance vectors. Returns whether any
+        route was removed.
         """
-        for fwd_addr in list(self.fwd_table.keys()):
-            if self.fwd_table[fwd_addr] == port:
-                del self.fwd_table[fwd_addr]
-                del self.my_dv[fwd_addr]
+        for addr in addrs:
+            del self.fwd_table[addr]
+            del self.my_dv[addr]
+            self.dirty.add(addr)
+            self.multipath_stale.add(addr)
         for nb in self.neighbors.values():
-            self.__update_better_path(nb)
+            self.__update_better_path(nb, addrs)
+        return len(addrs) > 0
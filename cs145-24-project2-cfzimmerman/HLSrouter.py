@@ -0,0 +1,447 @@
+####################################################
+# HLSrouter.py
+# Hierarchical (area-based) link state routing
+#####################################################
+
+from router import Router
+from packet import Packet
+from lsdb import CompactSpt, Row, node_addr, node_id
+from LSrouter import LinkStatePayload
+
+
+"""
+Link state routing with OSPF-like areas. The network's "areas" config maps
+each router to an area (see topogen.py --areas); Network hands that map to
+every router as router.areas. Clients belong to the area of their router.
+A router with a link to a router in another area is a border router; the
+rest are interior routers.
+
+Three kinds of LSA are flooded, told apart by the first byte of the content:
+- Router LSAs ("R") list all of a router's neighbors and costs, like
+  LSrouter's. They are flooded only within the origin's area, so each
+  router holds the full topology of its own area and nothing else.
+- Backbone LSAs ("B") are originated by border routers and flooded to
+  every router. A border router's backbone LSA lists, as edges from
+  itself: its lowest cost within its area to every other border router and
+  every client of the area, and its links to other areas.
+- Summary LSAs ("S") are originated by border routers and flooded only
+  within their area. They list the border router's lowest cost anywhere in
+  the network to every client, leaving out its own clients, whose router
+  LSA edges already give that cost.
+
+Every router keeps its own area's edges in area_spt, and spt adds the
+edges it routes with, both CompactSpts (see lsdb.py):
+- A border router installs the backbone LSAs of other areas. Any path
+  splits into stretches within one area between border crossings; a
+  stretch in this router's area is made of real edges, and one in another
+  area is a single backbone edge, so its distances are the true lowest
+  costs.
+- An interior router installs its own area's summary LSAs. Its best path
+  to a client leaves the area (if at all) through some border router, and
+  that border router's summary holds the true cost from there.
+Both give every router true lowest costs, so hop-by-hop forwarding is loop
+free. Interior routers relay backbone LSAs without keeping their edges,
+so their database grows with their own area and its border routers, not
+with the whole network.
+
+Border routers send new backbone and summary LSAs at most every
+SUMMARY_HOLD_HEARTBEATS, like OSPF's MinLSInterval, so the burst of
+router LSAs after a change costs one of each, and withdraw them with empty
+ones when they stop being border routers. Without an areas map every
+router is in one area and this behaves like LSrouter. Refreshing, aging,
+and the database exchange with new neighbors follow LSrouter, except that
+each neighbor only gets the LSAs in its flooding scope.
+"""
+
+
+class LsaEntry:
+    """
+    An LSA accepted into one of the link state databases.
+    """
+
+    def __init__(
+        self,
+        packet_id,  # : int
+        content,  # : str, the tagged encoded payload, for resending
+        heartbeat,  # : int, the heartbeat count when it was accepted
+        neighbors  # : Dict[Addr, Cost], None if only relayed
+    ):
+        self.packet_id = packet_id
+        self.content = content
+        self.heartbeat = heartbeat
+        self.neighbors = neighbors
+
+
+class HLSrouter(Router):
+    """Area-partitioned link state routing protocol implementation."""
+
+    # Content tags of the kinds of LSA
+    ROUTER_LSA = "R"
+    BACKBONE_LSA = "B"
+    SUMMARY_LSA = "S"
+    # Heartbeats between LSAs when nothing changes
+    LSA_REFRESH_HEARTBEATS = 10
+    # Refresh intervals an LSA lasts without being refreshed
+    LSA_MAX_AGE_REFRESHES = 3
+    # Heartbeats between a border router's backbone and summary LSAs
+    SUMMARY_HOLD_HEARTBEATS = 0.5
+    # Maps router addresses to their area. Network replaces this with the
+    # config's "areas"; empty puts every router in one area
+    # : Dict[Addr, Area]
+    areas = {}
+
+    # the areas map is shared configuration, not routing state
+    RUNTIME_FIELDS = Router.RUNTIME_FIELDS + ("areas",)
+
+    def __init__(self, addr, heartbeatTime):
+        Router.__init__(self, addr)  # initialize superclass - don't remove
+        self.heartbeatTime = heartbeatTime
+        self.last_time = 0
+        self.heartbeats = 0
+        self.next_packet_id = 0
+
+        # This area's edges, and the shortest paths through them
+        self.area_spt = CompactSpt(addr)
+        # This area's edges plus backbone or summary LSA edges
+        self.spt = CompactSpt(addr)
+        # Whether spt holds backbone LSAs (this is a border router) rather
+        # than summary LSAs
+        self.border = False
+        # Maps directly connected neighbors to the port they're on
+        # : Dict[Addr, Port]
+        self.ports = {}
+        # Latest LSA accepted from each other origin, per kind: router
+        # LSAs from this area, backbone LSAs from everywhere, and summary
+        # LSAs from this area
+        # : Dict[Addr, LsaEntry]
+        self.lsdb = {}
+        self.backbone = {}
+        self.summaries = {}
+        # Edges and content of the last backbone and summary LSAs this
+        # router originated
+        # : Dict[Kind, Tuple[Dict[Addr, Cost], str]]
+        self.originated = {}
+        # Whether those may have changed since they were last checked, and
+        # when that was
+        self.summary_pending = False
+        self.summary_time = None
+        # Maps destination addresses to an outbound port
+        # : Dict[Addr, Port]
+        self.fwd_table = {}
+
+    def handlePacket(self, port, packet):
+        """
+        Process incoming packet.
+        port: the port number on which the packet arrived.
+        packet: the received packet instance.
+        """
+        if packet.isTraceroute():
+            out_port = self.forwardPort(packet.srcAddr, packet.dstAddr, port)
+            if out_port is not None:
+                self.send(out_port, packet)
+            else:
+                self.countDrop(packet)
+            return
+
+        assert packet.isRouting()
+        kind = packet.content[0]
+        ls_payload = LinkStatePayload.deserialize(packet.content[1:],
+                                                  self.codec)
+        origin = ls_payload.source_addr
+        if (kind != self.BACKBONE_LSA and
+                self.__area_of(origin) != self.__area_of(self.addr)):
+            # Out of its flooding scope
+            return
+        db = self.__db(kind)
+        old_entry = db.get(origin)
+        if (origin == self.addr or (old_entry is not None and
+                ls_payload.packet_id <= old_entry.packet_id)):
+            # Update is outdated or redundant. We're done.
+            return
+
+        installed = self.__installs(kind, origin)
+        neighbors = dict(ls_payload.ls_neighbors)
+        db[origin] = LsaEntry(ls_payload.packet_id, packet.content,
+                              self.heartbeats,
+                              neighbors if installed or
+                              kind != self.BACKBONE_LSA else None)
+        old_neighbors = {} if old_entry is None else old_entry.neighbors
+        if installed and neighbors != old_neighbors:
+            self.__install(kind, origin, old_neighbors, neighbors)
+        # Forward the update within its flooding scope
+        for nb_addr, nb_port in self.ports.items():
+            if nb_port != port and self.__floods_to(kind, nb_addr):
+                self.send(nb_port, packet)
+
+    def forwardPort(self, srcAddr, dstAddr, inPort):
+        """
+        Returns the port a traceroute to dstAddr leaves on, or None if there
+        is no route.
+        """
+        return self.fwd_table.get(dstAddr)
+
+    def handleNewLink(self, port, addr, cost):
+        """
+        Called when a new link is added for this router.
+        port: the port number on which the link was added.
+        endpoint: the address of the other endpoint of the link.
+        cost: the link cost.
+        """
+        self.ports[addr] = port
+        self.area_spt.set_edge(self.area_spt.root, node_id(addr), cost)
+        self.__update_fwd(self.spt.set_edge(self.spt.root, node_id(addr),
+                                            cost))
+        self.__update_border()
+        self.__broadcast_router_lsa()
+        # Bring the new neighbor's databases up to date
+        for kind in (self.ROUTER_LSA, self.BACKBONE_LSA, self.SUMMARY_LSA):
+            if not self.__floods_to(kind, addr):
+                continue
+            contents = [entry.content for entry in self.__db(kind).values()]
+            if kind in self.originated:
+                contents.append(self.originated[kind][1])
+            for content in contents:
+                self.send(port, Packet(Packet.ROUTING, self.addr, addr,
+                                       content=content))
+        self.summary_pending = True
+
+    def handleRemoveLink(self, port):
+        """
+        Handle removed link.
+        port: the port number on which the link was removed.
+        """
+        nb_addr = None
+        for addr, nb_port in self.ports.items():
+            if port == nb_port:
+                nb_addr = addr
+                break
+
+        assert nb_addr is not None
+        del self.ports[nb_addr]
+        self.area_spt.remove_edge(self.area_spt.root, node_id(nb_addr))
+        self.__update_fwd(self.spt.remove_edge(self.spt.root,
+                                               node_id(nb_addr)))
+        self.__update_border()
+        self.__broadcast_router_lsa()
+        self.summary_pending = True
+
+    def handleTime(self, timeMillisecs):
+        """
+        This method is called regularly for sending routing packets at
+        regular intervals.
+        """
+        if self.summary_pending and (self.summary_time is None or
+                timeMillisecs - self.summary_time >=
+                self.SUMMARY_HOLD_HEARTBEATS * self.heartbeatTime):
+            self.summary_pending = False
+            self.summary_time = timeMillisecs
+            self.__update_summaries()
+        if timeMillisecs - self.last_time >= self.heartbeatTime:
+            self.last_time = timeMillisecs
+            self.heartbeats += 1
+            if self.heartbeats % self.LSA_REFRESH_HEARTBEATS == 0:
+                self.__broadcast_router_lsa()
+                for kind, (edges, _) in self.originated.items():
+                    if edges:
+                        self.__originate(kind, edges)
+            self.__age()
+
+    def debugString(self):
+        """
+        This method is called by the network visualization to display current
+        router details
+        """
+        return str({
+            "area": self.__area_of(self.addr),
+            "border": self.border,
+            "fwd": self.fwd_table,
+            "dist": self.spt.distances(),
+            "lsdb": {origin: (entry.packet_id, entry.neighbors)
+                     for origin, entry in self.lsdb.items()},
+            "summaries": {origin: (entry.packet_id, entry.neighbors)
+                          for origin, entry in self.summaries.items()},
+        })
+
+    def __area_of(self, addr):
+        """The area of a router, None for clients or without areas"""
+        return self.areas.get(addr)
+
+    def __crosses_area(self, addr, nb_addr):
+        """Whether addr's neighbor nb_addr is a router in another area"""
+        nb_area = self.__area_of(nb_addr)
+        return nb_area is not None and nb_area != self.__area_of(addr)
+
+    def __is_border(self, addr, neighbors):
+        """Whether the router addr with neighbors has a link to another
+           area"""
+        return any(self.__crosses_area(addr, nb_addr)
+                   for nb_addr in neighbors)
+
+    def __db(self, kind):
+        """The database holding LSAs of kind"""
+        if kind == self.ROUTER_LSA:
+            return self.lsdb
+        if kind == self.BACKBONE_LSA:
+            return self.backbone
+        return self.summaries
+
+    def __floods_to(self, kind, nb_addr):
+        """Whether LSAs of kind are sent to neighbor nb_addr"""
+        if kind == self.BACKBONE_LSA:
+            # to every router; clients have no area
+            return self.__area_of(nb_addr) is not None
+        return self.__area_of(nb_addr) == self.__area_of(self.addr)
+
+    def __installs(self, kind, origin):
+        """Whether the edges of origin's LSA of kind belong in spt"""
+        if kind == self.ROUTER_LSA:
+            return True
+        if kind == self.BACKBONE_LSA:
+            return (self.border and
+                    self.__area_of(origin) != self.__area_of(self.addr))
+        return not self.border
+
+    def __broadcast_router_lsa(self):
+        """Floods this router's links to its area"""
+        ls_neighbors = [(nb_addr, self.__link_cost(nb_addr))
+                        for nb_addr in self.ports]
+        content = self.ROUTER_LSA + LinkStatePayload(
+            self.addr, self.next_packet_id, ls_neighbors).serialize(self.codec)
+        self.next_packet_id += 1
+        self.__flood(self.ROUTER_LSA, content)
+
+    def __originate(self, kind, edges):
+        """Floods a backbone or summary LSA listing edges"""
+        content = kind + LinkStatePayload(
+            self.addr, self.next_packet_id, edges.items()).serialize(self.codec)
+        self.next_packet_id += 1
+        self.originated[kind] = (edges, content)
+        self.__flood(kind, content)
+
+    def __flood(self, kind, content):
+        """Sends LSA content to every neighbor in its flooding scope"""
+        for nb_addr, nb_port in self.ports.items():
+            if self.__floods_to(kind, nb_addr):
+                self.send(nb_port, Packet(Packet.ROUTING, self.addr,
+                                          nb_addr, content=content))
+
+    def __backbone_edges(self):
+        """Edges of this border router's backbone LSA: its links to other
+           areas, and its costs within the area to the area's other border
+           routers and its clients"""
+        edges = {nb_addr: self.__link_cost(nb_addr)
+                 for nb_addr in self.ports
+                 if self.__crosses_area(self.addr, nb_addr)}
+        dist = self.area_spt.distances()
+        for origin, entry in self.lsdb.items():
+            if origin in dist and self.__is_border(origin, entry.neighbors):
+                edges[origin] = dist[origin]
+        for addr, d in dist.items():
+            if addr != self.addr and self.__area_of(addr) is None:
+                edges[addr] = d
+        return edges
+
+    def __summary_edges(self):
+        """Edges of this border router's summary LSA: its costs to every
+           client not attached to it"""
+        return {addr: d for addr, d in self.spt.distances().iteritems()
+                if self.__area_of(addr) is None and addr not in self.ports}
+
+    def __link_cost(self, nb_addr):
+        """The cost of the link to neighbor nb_addr"""
+        return self.area_spt.edge_cost(self.area_spt.root, node_id(nb_addr))
+
+    def __update_summaries(self):
+        """
+        Originates new backbone and summary LSAs where this router's
+        changed, empty ones if it is no longer a border router. Called at
+        most once per summary hold time.
+        """
+        for kind, summarize in ((self.BACKBONE_LSA, self.__backbone_edges),
+                                (self.SUMMARY_LSA, self.__summary_edges)):
+            edges = summarize() if self.border else {}
+            if edges != self.originated.get(kind, ({}, None))[0]:
+                self.__originate(kind, edges)
+
+    def __update_border(self):
+        """
+        Rebuilds spt with backbone instead of summary LSAs, or the other way
+        around, if this router just became or stopped being a border router.
+        """
+        border = self.__is_border(self.addr, self.ports)
+        if border == self.border:
+            return
+        self.border = border
+        self.spt = CompactSpt(self.addr)
+        # : Dict[NodeId, Dict[NodeId, Cost]]
+        edges = {self.spt.root: {node_id(nb_addr): self.__link_cost(nb_addr)
+                                 for nb_addr in self.ports}}
+        for kind in (self.ROUTER_LSA, self.BACKBONE_LSA, self.SUMMARY_LSA):
+            for origin, entry in self.__db(kind).items():
+                if not self.__installs(kind, origin):
+                    continue
+                if entry.neighbors is None:
+                    # a relayed backbone LSA, decoded now that it's needed
+                    entry.neighbors = dict(LinkStatePayload.deserialize(
+                        entry.content[1:], self.codec).ls_neighbors)
+                row = edges.setdefault(node_id(origin), {})
+                for addr, cost in entry.neighbors.items():
+                    row[node_id(addr)] = cost
+        self.fwd_table = {}
+        self.__update_fwd(self.spt.set_rows(
+            {u: Row(row.iteritems()) for u, row in edges.iteritems()}))
+
+    def __install(self, kind, origin, old_neighbors, new_neighbors):
+        """
+        Replaces origin's outgoing edges from an LSA of kind and patches the
+        forwarding table.
+        """
+        if kind == self.ROUTER_LSA:
+            self.__replace_edges(self.area_spt, origin, old_neighbors,
+                                 new_neighbors)
+        self.__update_fwd(self.__replace_edges(self.spt, origin,
+                                               old_neighbors, new_neighbors))
+        if self.border:
+            self.summary_pending = True
+
+    def __replace_edges(self, spt, origin, old_neighbors, new_neighbors):
+        """
+        Replaces origin's outgoing edges from old_neighbors with
+        new_neighbors in spt, keeping ones another LSA of origin's put
+        there. Returns the nodes whose next hop changed.
+        """
+        u = node_id(origin)
+        edges = spt.out_edges(u)
+        for addr in old_neighbors:
+            if addr not in new_neighbors:
+                edges.pop(node_id(addr), None)
+        for addr, cost in new_neighbors.items():
+            edges[node_id(addr)] = cost
+        return spt.set_row(u, Row(edges.iteritems()) if edges else None)
+
+    def __age(self):
+        """
+        Drops LSAs that haven't been refreshed within the max age, along
+        with their edges.
+        """
+        max_age = self.LSA_REFRESH_HEARTBEATS * self.LSA_MAX_AGE_REFRESHES
+        for kind in (self.ROUTER_LSA, self.BACKBONE_LSA, self.SUMMARY_LSA):
+            db = self.__db(kind)
+            for origin, entry in db.items():
+                if self.heartbeats - entry.heartbeat > max_age:
+                    del db[origin]
+                    if self.__installs(kind, origin):
+                        self.__install(kind, origin, entry.neighbors, {})
+
+    def __update_fwd(self, changed):
+        """
+        Rewrites the forwarding table entries of destinations whose
+        next hop changed.
+        """
+        for node in changed:
+            addr = node_addr(node)
+            next_hop = self.spt.next_hop[node]
+            if next_hop == -1:
+                self.fwd_table.pop(addr, None)
+            else:
+                self.fwd_table[addr] = self.ports[node_addr(next_hop)]
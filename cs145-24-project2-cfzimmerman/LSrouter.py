@@ -7,8 +7,9 @@
 
 from router import Router
 from packet import Packet
-from json import dumps, loads
-import networkx as nx
+from lsdb import CompactSpt, LinkStateDb, intern_lsa, node_addr, node_id
+from pacing import UpdatePacer
+from damping import FlapDamper
 # from typing import Dict, List, Tuple
 
 
@@ -20,16 +21,52 @@ import networkx as nx
 # LsNeighbors = List[Tuple[Addr, Cost]]
 
 """
-Each graph node may have the following fields:
-{
-    "port": int, optional,
-    "last_packet_id": int, optional,
-}
-
-Each graph edge may have the following fields:
-{
-    "weight": int, required
-}
+The link state database holds the latest LSA from each origin, and its
+edges are kept in a CompactSpt rooted at this router (see lsdb.py).
+An LSA carries the origin's complete neighbor list and replaces the
+origin's previous edges; the tree repairs only the shortest paths those
+edges affect, and the forwarding table is patched for destinations whose
+next hop changed. Received LSAs are interned, so routers simulated in one
+process share each LSA's decoded neighbor list between their databases
+and trees.
+
+Flooding follows OSPF:
+- A router originates an LSA only when its links change, plus a refresh
+  every LSA_REFRESH_HEARTBEATS heartbeats. Link changes within
+  UPDATE_MIN_HEARTBEATS of the last LSA are coalesced into one, sent from
+  handleTime, and the interval doubles up to UPDATE_MAX_HEARTBEATS while
+  they keep coming (see pacing.py).
+- A newer LSA whose neighbor list matches the stored one (a refresh) is
+  recorded and flooded but doesn't touch the shortest path tree.
+- When a link comes up, the whole database is sent to the new neighbor so
+  it learns LSAs that were flooded before the link existed.
+- LSAs not refreshed for LSA_MAX_AGE_REFRESHES refresh intervals age out
+  and their edges are removed.
+- Links that keep flapping are damped (see damping.py): once a link's
+  penalty crosses the suppress threshold, it stays out of this router's
+  LSAs when it comes back up until the penalty decays, so its flaps stop
+  being flooded.
+
+Shortest path runs are throttled like OSPF's SPF timers: a changed LSA goes
+into the database (and is flooded) at once, but the tree only takes it in
+the next run, SPF_DELAY_HEARTBEATS after the first change of a quiet
+period. Every LSA that arrives meanwhile joins that run, which repairs the
+tree for all of them at once (CompactSpt.set_rows), and while changes keep
+coming runs are held SPF_HOLD_HEARTBEATS apart, doubling up to
+SPF_MAX_HEARTBEATS. Changes to this router's own links still apply at once.
+
+Multipath: destinations with several shortest paths keep every equal-cost
+next hop, updated along with the tree (CompactSpt.update_equal_cost_hops),
+and forwardPort spreads traceroutes over them by a hash of their source and
+destination and this router's address (Router.pickPort).
+
+Fast reroute (USE_LFA, off by default): when one of this router's links
+goes down, destinations it reached over that link would move to the new
+shortest path's next hop, which may still route back here until it hears
+of the failure. Instead, those destinations go to their loop-free
+alternate (computed from the database as it was before the failure, see
+CompactSpt.alternates) until the next shortest path run installs the
+routes the rest of the network is converging on.
 """
 
 
@@ -49,27 +86,20 @@ class LinkStatePayload:
         self.packet_id = packet_id
         self.ls_neighbors = ls_neighbors
 
-    def serialize(self):  # -> str
+    def serialize(self, codec):  # -> str
         """
-        Returns this payload as a json string
+        Returns this payload as a string encoded by codec
         """
-        return dumps({
-            "source_addr": self.source_addr,
-            "packet_id": self.packet_id,
-            "ls_neighbors": self.ls_neighbors
-        })
+        return codec.encodeLS(
+            self.source_addr, self.packet_id, self.ls_neighbors)
 
     @staticmethod
-    def deserialize(msg):
+    def deserialize(msg, codec):
         """
-        Builds a LinkStatePayload object from a payload json string
+        Builds a LinkStatePayload object from a payload string
+        encoded by codec
         """
-        parsed = loads(msg)
-        return LinkStatePayload(
-            parsed["source_addr"],
-            parsed["packet_id"],
-            parsed["ls_neighbors"]
-        )
+        return LinkStatePayload(*codec.decodeLS(msg))
 
 
 class LSrouter(Router):
@@ -77,18 +107,81 @@ class LSrouter(Router):
 
     # A value of infinity suitable for the tested networks
     INF = 16
+    # Heartbeats between LSAs when this router's links don't change
+    LSA_REFRESH_HEARTBEATS = 10
+    # Refresh intervals an LSA lasts without being refreshed
+    LSA_MAX_AGE_REFRESHES = 3
+    # Heartbeats between LSAs originated for link changes, at first and
+    # under sustained churn. 0 sends every LSA immediately
+    UPDATE_MIN_HEARTBEATS = 0.1
+    UPDATE_MAX_HEARTBEATS = 0.8
+    # Heartbeats from the first changed LSA after a quiet period to the
+    # shortest path run that applies it, and between runs at first and under
+    # sustained churn. All 0 applies every LSA as it arrives
+    SPF_DELAY_HEARTBEATS = 0
+    SPF_HOLD_HEARTBEATS = 0.2
+    SPF_MAX_HEARTBEATS = 1.0
+    # Whether links that keep going down are held down (see damping.py), the
+    # heartbeats a link's flap penalty takes to halve, and the most
+    # heartbeats it's held down after its last flap
+    USE_FLAP_DAMPING = True
+    DAMP_HALF_LIFE_HEARTBEATS = 2
+    DAMP_MAX_SUPPRESS_HEARTBEATS = 4
+    # Whether traceroutes are spread over all equal-cost next hops
+    USE_ECMP = True
+    # Whether destinations behind a failed link move to loop-free alternates
+    # until the next shortest path run
+    USE_LFA = False
 
     def __init__(self, addr, heartbeatTime):
         Router.__init__(self, addr)  # initialize superclass - don't remove
         self.heartbeatTime = heartbeatTime
         self.last_time = 0
+        self.heartbeats = 0
         self.next_packet_id = 0
+        self.pacer = UpdatePacer(
+            self.UPDATE_MIN_HEARTBEATS * heartbeatTime,
+            self.UPDATE_MAX_HEARTBEATS * heartbeatTime)
+        # Neighbors dropped since the last LSA, advertised with a cost of INF
+        # : Set[Addr]
+        self.withdrawn = set()
+        self.spf_pacer = UpdatePacer(
+            self.SPF_HOLD_HEARTBEATS * heartbeatTime,
+            self.SPF_MAX_HEARTBEATS * heartbeatTime,
+            self.SPF_DELAY_HEARTBEATS * heartbeatTime)
+        # Rows the next shortest path run installs, by origin node id, None
+        # for origins whose LSA aged out
+        # : Dict[int, Optional[Lsa]]
+        self.spf_pending = {}
+        # Changed LSAs queued, and shortest path runs over them
+        self.spf_requests = 0
+        self.spf_runs = 0
+        self.damper = FlapDamper(
+            self.DAMP_HALF_LIFE_HEARTBEATS * heartbeatTime,
+            self.DAMP_MAX_SUPPRESS_HEARTBEATS * heartbeatTime)
+        # Links that came up while suppressed, by neighbor address
+        # : Dict[Addr, Tuple[Port, Cost]]
+        self.held = {}
 
         # Tracks current understanding of all weighted edges in the network
-        self.graph = nx.DiGraph()
+        # and the shortest paths through them, by node id
+        self.spt = CompactSpt(addr)
+        # Maps directly connected neighbors to the port they're on
+        # : Dict[Addr, Port]
+        self.ports = {}
+        # Latest LSA accepted from each other origin
+        self.lsdb = LinkStateDb()
         # Maps destination addresses to an outbound port
         # : Dict[Addr, Port]
         self.fwd_table = {}
+        # Ports of every equal-cost next hop, for destinations with more
+        # than one
+        # : Dict[Addr, Tuple[Port, ...]]
+        self.multipath = {}
+        # Destinations forwarded to their loop-free alternate after a link
+        # failure, with the alternate
+        # : Dict[Addr, Addr]
+        self.repairs = {}
 
     def handlePacket(self, port, packet):
         """
@@ -102,37 +195,43 @@ class LSrouter(Router):
         Methods and fields of the packet class are defined in packet.py
         """
         if packet.isTraceroute():
-            if packet.dstAddr in self.fwd_table:
-                self.send(self.fwd_table[packet.dstAddr], packet)
+            out_port = self.forwardPort(packet.srcAddr, packet.dstAddr, port)
+            if out_port is not None:
+                self.send(out_port, packet)
+            else:
+                self.countDrop(packet)
             return
 
         assert packet.isRouting()
-        ls_payload = LinkStatePayload.deserialize(packet.content)
+        lsa = intern_lsa(self.codec, packet.content, self.INF)
 
-        if (ls_payload.packet_id <=
-            self.__get_last_packet_id(ls_payload.source_addr)
-                or ls_payload.source_addr == self.addr):
+        origin = lsa.origin
+        if (origin == self.spt.root or
+                lsa.packet_id <= self.lsdb.seq(origin)):
             # Update is outdated or redundant. We're done.
             return
 
-        self.__set_last_packet_id(
-            ls_payload.source_addr, ls_payload.packet_id)
-
-        for (dest_addr, cost) in ls_payload.ls_neighbors:
-            if cost == self.INF:
-                self.graph.remove_edge(ls_payload.source_addr, dest_addr)
-            else:
-                self.graph.add_edge(ls_payload.source_addr,
-                                    dest_addr, weight=cost,
-                                    last_packet_id=ls_payload.packet_id)
-        self.__recompute_paths()
+        old_lsa = self.lsdb.get(origin)
+        self.lsdb.put(lsa, self.heartbeats)
+        if old_lsa is None or not lsa.same_edges(old_lsa):
+            self.__schedule_spf(origin, lsa)
         # Forward the update
-        for nb_addr in self.graph.neighbors(self.addr):
-            nb_port = self.__get_neighbor_port(nb_addr)
+        for nb_port in self.ports.values():
             if nb_port == port:
                 continue
             self.send(nb_port, packet)
 
+    def forwardPort(self, srcAddr, dstAddr, inPort):
+        """
+        Returns the port a traceroute to dstAddr leaves on, or None if there
+        is no route. Read-only, so the network can walk routes through the
+        forwarding tables directly.
+        """
+        ports = self.multipath.get(dstAddr)
+        if ports is not None and dstAddr not in self.repairs:
+            return self.pickPort(srcAddr, dstAddr, ports)
+        return self.fwd_table.get(dstAddr)
+
     def handleNewLink(self, port, addr, cost):
         """
         Called when a new link is added for this router.
@@ -140,10 +239,10 @@ class LSrouter(Router):
         endpoint: the address of the other endpoint of the link.
         cost: the link cost.
         """
-        self.graph.add_node(addr, port=port)
-        self.graph.add_edge(self.addr, addr, weight=cost)
-        self.__recompute_paths()
-        self.__broadcast_my_ls()
+        if self.damper.is_suppressed(addr):
+            self.held[addr] = (port, cost)
+            return
+        self.__add_link(port, addr, cost)
 
     def handleRemoveLink(self, port):
         """
@@ -154,28 +253,61 @@ class LSrouter(Router):
         """
         # Find the neighbor that got dropped.
         nb_addr = None
-        for addr in self.graph.neighbors(self.addr):
-            if port == self.__get_neighbor_port(addr):
+        for addr, nb_port in self.ports.items():
+            if port == nb_port:
                 nb_addr = addr
                 break
 
-        assert nb_addr is not None
-        # Broadcast with a cost of inf so others know to drop the
-        # edge. Then actually delete it.
-        self.__set_edge_cost(self.addr, nb_addr, self.INF)
-        self.__broadcast_my_ls()
-
-        self.graph.remove_edge(self.addr, nb_addr)
-        self.__recompute_paths()
+        if nb_addr is None:
+            # A held link; it was down as far as routing was concerned
+            for addr, (held_port, _) in self.held.items():
+                if held_port == port:
+                    del self.held[addr]
+                    self.__flap(addr)
+            return
+        self.__flap(nb_addr)
+        nb = node_id(nb_addr)
+        if self.USE_LFA:
+            # Alternates as of before the failure, and the destinations
+            # that need one
+            alternates = self.spt.alternates()
+            lost = [node for node, hop in enumerate(self.spt.next_hop)
+                    if hop == nb]
+        # Repairs through the lost link go back to the shortest path
+        stale = [addr for addr, alt in self.repairs.items()
+                 if alt == nb_addr]
+        for addr in stale:
+            del self.repairs[addr]
+        del self.ports[nb_addr]
+        self.__update_fwd(self.spt.remove_edge(self.spt.root, nb) |
+                          set(node_id(addr) for addr in stale))
+        if self.USE_LFA:
+            self.__repair(lost, alternates)
+        # Broadcast with a cost of inf so others know to drop the edge.
+        self.withdrawn.add(nb_addr)
+        self.__trigger_update()
 
     def handleTime(self, timeMillisecs):
         """
         This method is called regularly for sending routing packets at
         regular intervals.
         """
+        for addr in self.damper.tick(timeMillisecs):
+            if addr in self.held:
+                port, cost = self.held.pop(addr)
+                self.__add_link(port, addr, cost)
+        if self.spf_pacer.tick(timeMillisecs):
+            self.__run_spf()
+        if self.pacer.tick(timeMillisecs):
+            self.countUpdates(0, 1)
+            self.__broadcast_my_ls()
         if timeMillisecs - self.last_time >= self.heartbeatTime:
             self.last_time = timeMillisecs
-            self.__broadcast_my_ls()
+            self.heartbeats += 1
+            if self.heartbeats % self.LSA_REFRESH_HEARTBEATS == 0:
+                self.__broadcast_my_ls()
+                self.pacer.sent()
+            self.__age_lsdb()
 
     def debugString(self):
         """
@@ -184,77 +316,145 @@ class LSrouter(Router):
         """
         return str({
             "fwd": self.fwd_table,
-            "nodes": self.graph.nodes(data=True),
-            "edges": self.graph.edges(data=True)
+            "multipath": self.multipath,
+            "repairs": self.repairs,
+            "held": self.held,
+            "spf_pending": [node_addr(origin) for origin in self.spf_pending],
+            "dist": self.spt.distances(),
+            "lsdb": {node_addr(lsa.origin): (lsa.packet_id, {
+                node_addr(node): cost for node, cost in lsa.edges().items()})
+                for lsa in self.lsdb.values()}
         })
 
+    def __add_link(self, port, addr, cost):
+        """
+        Starts routing over a link that came up.
+        """
+        self.ports[addr] = port
+        self.__update_fwd(
+            self.spt.set_edge(self.spt.root, node_id(addr), cost))
+        self.__trigger_update()
+        # Bring the new neighbor's database up to date
+        for lsa in self.lsdb.values():
+            self.send(port, Packet(Packet.ROUTING, self.addr, addr,
+                                   content=lsa.content))
+
+    def __flap(self, addr):
+        """
+        Adds to the flap penalty of the link to addr, which went down.
+        """
+        if self.USE_FLAP_DAMPING:
+            self.damper.flap(addr)
+
+    def __trigger_update(self):
+        """
+        Originates an LSA for a link change now, or leaves it for
+        handleTime if the pacer holds it back.
+        """
+        send = self.pacer.request()
+        self.countUpdates(1, int(send))
+        if send:
+            self.__broadcast_my_ls()
+
     def __broadcast_my_ls(self):
         """
         Generates a LinkStatePayload from this router's current
-        state and sends an update to all neighbors.
+        state and sends an update to all neighbors. Neighbors withdrawn
+        since the last one are advertised with a cost of INF.
         """
         # : LsNeighbors
-        ls_neighbors = [(nb_addr, self.__get_edge_cost(self.addr, nb_addr))
-                        for nb_addr in self.graph.neighbors(self.addr)]
+        ls_neighbors = [
+            (nb_addr, self.spt.edge_cost(self.spt.root, node_id(nb_addr)))
+            for nb_addr in self.ports]
+        ls_neighbors.extend((nb_addr, self.INF) for nb_addr in self.withdrawn
+                            if nb_addr not in self.ports)
+        self.withdrawn = set()
 
         ls_payload_str = LinkStatePayload(
-            self.addr, self.next_packet_id, ls_neighbors).serialize()
+            self.addr, self.next_packet_id, ls_neighbors).serialize(self.codec)
         self.next_packet_id += 1
 
-        for nb_addr in self.graph.neighbors(self.addr):
+        for nb_addr, nb_port in self.ports.items():
             packet = Packet(Packet.ROUTING, self.addr,
                             nb_addr, content=ls_payload_str)
-            self.send(self.__get_neighbor_port(nb_addr), packet)
+            self.send(nb_port, packet)
 
-    def __recompute_paths(self):
+    def __age_lsdb(self):
         """
-        Runs Dijkstra's algorithm to compute shortest paths, and
-        rewrites the forwarding table to reflect the new connectivity
-        of the graph.
+        Drops LSAs that haven't been refreshed within the max age, along
+        with their edges.
         """
-        paths = nx.single_source_dijkstra_path(self.graph, self.addr)
-        new_fwd = {}
-        for addr, path in paths.items():
-            if len(path) < 2:
-                continue
-            next_hop = path[1]
-            new_fwd[addr] = self.__get_neighbor_port(next_hop)
-        self.fwd_table = new_fwd
+        max_age = self.LSA_REFRESH_HEARTBEATS * self.LSA_MAX_AGE_REFRESHES
+        for origin in self.lsdb.older_than(self.heartbeats - max_age):
+            self.lsdb.remove(origin)
+            self.__schedule_spf(origin, None)
 
-    def __get_edge_cost(self, e_start, e_end):
+    def __schedule_spf(self, origin, lsa):
         """
-        Retrieves the cost of the edge between e_start and e_end
-        from the graph. Panics if the edge is not present or
-        no cost is set.
+        Queues origin's new LSA (None to remove its edges) for the next
+        shortest path run, running it now if the throttle allows.
         """
-        return self.graph.edges[e_start, e_end]["weight"]
+        self.spf_pending[origin] = lsa
+        self.spf_requests += 1
+        if self.spf_pacer.request():
+            self.__run_spf()
 
-    def __set_edge_cost(self, e_start, e_end, cost):
+    def __run_spf(self):
         """
-        Sets the cost of an edge between e_start and e_end
+        Installs every queued LSA in the tree at once and patches the
+        forwarding table, returning repaired destinations to their
+        shortest path.
         """
-        nx.set_edge_attributes(
-            self.graph, {(e_start, e_end): {"weight": cost}})
-
-    def __get_neighbor_port(self, nb_addr):
+        pending = self.spf_pending
+        self.spf_pending = {}
+        self.spf_runs += 1
+        repaired = self.repairs
+        self.repairs = {}
+        self.__update_fwd(self.spt.set_rows(pending) |
+                          set(node_id(addr) for addr in repaired))
+
+    def __repair(self, lost, alternates):
         """
-        Retrieves the port between self and neighbor. Panics
-        if the port has not been set.
+        Forwards the destinations in lost, whose next hop's link just went
+        down, to their loop-free alternates until the next shortest path
+        run, unless the new shortest path already starts there.
         """
-        return self.graph.nodes[nb_addr]["port"]
+        for node in lost:
+            alt = alternates[node]
+            if alt == -1 or alt == self.spt.next_hop[node]:
+                continue
+            addr = node_addr(node)
+            self.repairs[addr] = node_addr(alt)
+            self.fwd_table[addr] = self.ports[node_addr(alt)]
 
-    def __get_last_packet_id(self, addr):
+    def __update_fwd(self, changed):
         """
-        Returns the last packet id if one exists. Else, -1.
+        Rewrites the forwarding table entries of destinations whose
+        next hop changed, except ones on a loop-free alternate.
         """
-        if not self.graph.has_node(addr):
-            return -1
-        return self.graph.nodes[addr].get("last_packet_id", -1)
+        for node in changed:
+            addr = node_addr(node)
+            if addr in self.repairs:
+                continue
+            next_hop = self.spt.next_hop[node]
+            if next_hop == -1:
+                self.fwd_table.pop(addr, None)
+            else:
+                self.fwd_table[addr] = self.ports[node_addr(next_hop)]
+        if self.USE_ECMP:
+            self.__update_multipath()
 
-    def __set_last_packet_id(self, addr, packet_id):
+    def __update_multipath(self):
         """
-        Sets the given packet id to the node at addr.
+        Updates the ports of the destinations whose equal-cost next hops
+        changed, keeping only those with more than one.
         """
-        if not self.graph.has_node(addr):
-            self.graph.add_node(addr)
-        self.graph.nodes[addr]["last_packet_id"] = packet_id
+        changed = self.spt.update_equal_cost_hops()
+        hops = self.spt.equal_cost_hops()
+        for node in changed:
+            addr = node_addr(node)
+            if len(hops[node]) > 1:
+                self.multipath[addr] = tuple(
+                    self.ports[node_addr(hop)] for hop in hops[node])
+            else:
+                self.multipath.pop(addr, None)
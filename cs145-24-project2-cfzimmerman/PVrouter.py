@@ -0,0 +1,282 @@
+####################################################
+# PVrouter.py
+# Path vector routing
+#####################################################
+
+from router import Router
+from packet import Packet
+from pacing import UpdatePacer
+from json import dumps
+
+
+"""
+Path vector routing, like BGP with every router its own AS:
+- Every route carries its path: the addresses it passes through after the
+  router advertising it, ending at the destination. A router prepends the
+  neighbor it learned a route from, and rejects any route whose path
+  already contains itself, so routes never loop and there is no infinity
+  to count to. A destination that becomes unreachable is withdrawn.
+- Each destination's route is the cheapest one offered by a neighbor,
+  then the one with the shortest path, then the one from the lowest
+  neighbor address.
+- Updates are versioned deltas acknowledged like DVrouter's: each one
+  carries every route change the neighbor hasn't acknowledged yet, with
+  None for withdrawals, so a change in an update overtaken by a newer one
+  still arrives. A new neighbor gets all our routes as changes. There is
+  no periodic full refresh; heartbeats resend unacknowledged changes and
+  acknowledge updates that haven't been answered.
+- A neighbor isn't sent routes whose paths contain it, which it would
+  reject. Clients never answer, so after its first update a neighbor that
+  hasn't sent one gets no more.
+- Triggered updates are paced like DVrouter's (see pacing.py).
+"""
+
+
+class Peer:
+    """A directly connected router or client and the routes exchanged with
+       it"""
+
+    def __init__(self, addr, port, cost):
+        """addr: str, port: int, cost: int"""
+        self.addr = addr
+        self.port = port
+        self.cost = cost
+        # The routes it offers, including itself at cost 0
+        # : Dict[Addr, Tuple[Cost, Path]]
+        self.routes = {addr: (0, ())}
+        # Our routes it should hold
+        # : Dict[Addr, Tuple[Cost, Path]]
+        self.view = {}
+        # The version of our update in which each unacknowledged view entry
+        # last changed
+        # : Dict[Addr, int]
+        self.changed = {}
+        # The last version of ours it acknowledged
+        self.acked = 0
+        # The last version of theirs we received
+        self.last_seen = 0
+        # Whether its view changed since we last sent it an update, whether
+        # it was ever sent one, and whether it sent routes we haven't
+        # acknowledged
+        self.pending = False
+        self.greeted = False
+        self.owes_ack = False
+
+
+class PVrouter(Router):
+    """Path vector routing protocol implementation."""
+
+    # Heartbeats between triggered updates, at first and under sustained
+    # churn. 0 sends every update immediately
+    UPDATE_MIN_HEARTBEATS = 0.1
+    UPDATE_MAX_HEARTBEATS = 0.4
+
+    def __init__(self, addr, heartbeatTime):
+        """
+        addr: str, the address of this router
+        heartbeatTime: how often to resend unacknowledged changes
+        """
+        Router.__init__(self, addr)  # initialize superclass - don't remove
+        self.heartbeatTime = heartbeatTime
+        self.last_time = 0
+
+        # Path = Tuple[Addr, ...], starting at the next hop
+        # self.routes: Dict[Addr, Tuple[Cost, Path]]
+        # self.fwd_table: Dict[Addr, Port]
+        # self.peers: Dict[Port, Peer]
+        # self.dirty: Set[Addr], destinations whose route changed since
+        #     the last update
+        self.routes = {addr: (0, ())}
+        self.fwd_table = {}
+        self.peers = {}
+        self.dirty = set()
+        self.version = 0
+        self.pacer = UpdatePacer(
+            self.UPDATE_MIN_HEARTBEATS * heartbeatTime,
+            self.UPDATE_MAX_HEARTBEATS * heartbeatTime)
+
+    def forwardPort(self, srcAddr, dstAddr, inPort):
+        """
+        Returns the port a traceroute to dstAddr leaves on, or None if there
+        is no route. Read-only, so the network can walk routes through the
+        forwarding tables directly.
+        """
+        return self.fwd_table.get(dstAddr)
+
+    def handleNewLink(self, port, addr, cost):
+        """
+        Handle new link.
+        port: the port number on which the link was added.
+        endpoint: the address of the other endpoint of the link.
+        cost: the link cost.
+        """
+        peer = Peer(addr, port, cost)
+        self.peers[port] = peer
+        for dst in self.routes:
+            self.__offer(peer, dst)
+        self.__select([addr])
+        self.__trigger_update()
+
+    def handlePacket(self, port, packet):
+        """
+        Process incoming packet.
+        port: the port number on which the packet arrived.
+        packet: the received packet instance.
+        """
+        if packet.isTraceroute():
+            out_port = self.forwardPort(packet.srcAddr, packet.dstAddr, port)
+            if out_port is not None:
+                self.send(out_port, packet)
+            else:
+                self.countDrop(packet)
+            return
+
+        assert packet.isRouting()
+        addr, version, ack, routes = self.codec.decodePV(packet.content)
+        peer = self.peers[port]
+        assert peer.addr == addr
+        if ack > peer.acked:
+            peer.acked = ack
+            peer.changed = {dst: v for dst, v in peer.changed.iteritems()
+                            if v > ack}
+        if version <= peer.last_seen:
+            # Reordered behind a newer update. We're done.
+            return
+        peer.last_seen = version
+        if not routes:
+            return
+        peer.owes_ack = True
+
+        changed = []
+        for dst, route in routes.iteritems():
+            if route is not None and self.addr in route[1]:
+                # Through us: as good as withdrawn
+                route = None
+            if peer.routes.get(dst) == route:
+                continue
+            if route is None:
+                del peer.routes[dst]
+            else:
+                peer.routes[dst] = route
+            changed.append(dst)
+        if self.__select(changed):
+            self.__trigger_update()
+
+    def handleRemoveLink(self, port):
+        """
+        Handle removed link.
+        port: the port number on which the link was removed.
+        """
+        peer = self.peers.pop(port)
+        self.__select(list(peer.routes))
+        self.__trigger_update()
+
+    def handleTime(self, timeMillisecs):
+        """
+        Sends paced updates that are due, and on heartbeats resends
+        unacknowledged changes.
+        """
+        if self.pacer.tick(timeMillisecs):
+            self.countUpdates(0, 1)
+            self.__broadcast()
+        if timeMillisecs - self.last_time >= self.heartbeatTime:
+            self.last_time = timeMillisecs
+            self.__broadcast(heartbeat=True)
+            self.pacer.sent()
+
+    def debugString(self):
+        """
+        This method is called by the network visualization to print current
+        router details.
+        """
+        return dumps({"routes": self.routes, "fwd": self.fwd_table,
+                      "version": self.version}, indent=4)
+
+    def __select(self, dsts):
+        """
+        Picks the best route offered to each of dsts. Returns whether any
+        route changed.
+        """
+        updated = False
+        for dst in dsts:
+            if dst == self.addr:
+                continue
+            best = None
+            for peer in self.peers.itervalues():
+                route = peer.routes.get(dst)
+                if route is None:
+                    continue
+                key = (peer.cost + route[0], len(route[1]), peer.addr)
+                if best is None or key < best[0]:
+                    best = (key, peer, route)
+            if best is None:
+                if dst not in self.routes:
+                    continue
+                del self.routes[dst]
+                del self.fwd_table[dst]
+            else:
+                (cost, _, _), peer, (_, path) = best
+                route = (cost, (peer.addr,) + path)
+                if (self.routes.get(dst) == route and
+                        self.fwd_table[dst] == peer.port):
+                    continue
+                self.routes[dst] = route
+                self.fwd_table[dst] = peer.port
+            self.dirty.add(dst)
+            updated = True
+        return updated
+
+    def __offer(self, peer, dst):
+        """
+        Brings peer's view of our route to dst up to date, leaving out
+        routes through peer. Changes are tagged with the version of the
+        upcoming update.
+        """
+        route = self.routes.get(dst)
+        if route is not None and peer.addr in route[1]:
+            route = None
+        if peer.view.get(dst) == route:
+            return
+        if route is None:
+            del peer.view[dst]
+        else:
+            peer.view[dst] = route
+        peer.changed[dst] = self.version + 1
+        peer.pending = True
+
+    def __trigger_update(self):
+        """
+        Sends the changed routes now, or leaves them for handleTime if the
+        pacer holds the update back.
+        """
+        send = self.pacer.request()
+        self.countUpdates(1, int(send))
+        if send:
+            self.__broadcast()
+
+    def __broadcast(self, heartbeat=False):
+        """
+        Sends every peer whose view changed its unacknowledged changes.
+        Heartbeats also resend them to peers that still haven't
+        acknowledged them, and acknowledge peers' unanswered updates.
+        """
+        for dst in self.dirty:
+            for peer in self.peers.itervalues():
+                self.__offer(peer, dst)
+        self.dirty = set()
+        self.version += 1
+        for peer in self.peers.itervalues():
+            if peer.greeted and peer.last_seen == 0:
+                # Silent so far, probably a client
+                continue
+            if not (peer.pending or heartbeat and
+                    (peer.changed or peer.owes_ack)):
+                continue
+            entries = {dst: peer.view.get(dst) for dst in peer.changed}
+            payload = self.codec.encodePV(self.addr, self.version,
+                                          peer.last_seen, entries)
+            self.send(peer.port, Packet(Packet.ROUTING, self.addr,
+                                        peer.addr, content=payload))
+            peer.pending = False
+            peer.greeted = True
+            peer.owes_ack = False
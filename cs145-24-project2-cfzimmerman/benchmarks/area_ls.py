@@ -0,0 +1,71 @@
+import sys
+import os
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))  # noqa: E402
+sys.path.insert(0, parent_dir)  # noqa: E402
+from lsdb import LinkStateDb
+import runner
+import topogen
+
+# python2 benchmarks/area_ls.py [config.json ...]
+# Runs flat LSrouter and area-based HLSrouter in virtual time on each config
+# (by default topogen.py topologies split into areas) and reports the link
+# state database each router ends up holding, as LSAs and edges (mean and
+# max over routers), and the routing messages and bytes each router sent.
+
+# topogen.py arguments for the default configs
+# (kept small enough to finish in minutes)
+TOPOLOGIES = [
+    ["grid", "--rows", "20", "--cols", "20", "--areas", "4", "--flaps", "5"],
+    ["geometric", "-n", "200", "--areas", "4", "--flaps", "5"],
+]
+
+
+def lsdbSize(router):
+    """Returns (LSAs, edges) held by an LSrouter or HLSrouter.  LSAs an
+       HLSrouter only relays count without edges"""
+    if isinstance(router.lsdb, LinkStateDb):
+        lsas = router.lsdb.values()
+        return len(lsas), sum(len(lsa.nodes) for lsa in lsas)
+    dbs = [router.lsdb] + [getattr(router, name) for name in
+                           ("backbone", "summaries") if hasattr(router, name)]
+    entries = [entry for db in dbs for entry in db.values()]
+    return len(entries), sum(len(entry.neighbors or ())
+                             for entry in entries)
+
+
+def run(config, name):
+    """Returns a result dict for one run of router class name"""
+    net = runner.runVirtual(config, name, metrics=True, oracle=True)
+    sizes = [lsdbSize(router) for router in net.routers.values()]
+    totals = net.metrics.report()["totals"]
+    n = float(len(net.routers))
+    return {
+        "routers": len(net.routers),
+        "lsas": sum(lsas for lsas, _ in sizes) / n,
+        "maxLsas": max(lsas for lsas, _ in sizes),
+        "edges": sum(edges for _, edges in sizes) / n,
+        "maxEdges": max(edges for _, edges in sizes),
+        "messages": totals["packets"] / n,
+        "bytes": totals["bytes"] / n,
+        "passed": net.allRoutesCorrect(),
+    }
+
+
+def main():
+    configs = sys.argv[1:] or topogen.writeConfigs(TOPOLOGIES)
+    print "{:<20}{:<5}{:>8}{:>8}{:>8}{:>9}{:>9}{:>10}{:>11}".format(
+        "config", "", "routers", "LSAs", "max", "edges", "max",
+        "msgs/rtr", "bytes/rtr")
+    for config in configs:
+        for name in ("LS", "HLS"):
+            r = run(config, name)
+            print "{:<20}{:<5}{:>8}{:>8.1f}{:>8}{:>9.1f}{:>9}{:>10.0f}{:>11.0f} {}".format(
+                os.path.basename(config), name, r["routers"], r["lsas"],
+                r["maxLsas"], r["edges"], r["maxEdges"], r["messages"],
+                r["bytes"], "" if r["passed"] else "FAIL")
+    print "(LSAs and edges: link state database per router at the end)"
+
+
+if __name__ == "__main__":
+    main()
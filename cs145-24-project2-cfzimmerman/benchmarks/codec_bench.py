@@ -0,0 +1,48 @@
+import sys
+import os
+import timeit
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))  # noqa: E402
+sys.path.insert(0, parent_dir)  # noqa: E402
+from codec import JsonCodec, StructCodec
+
+# python2 benchmarks/codec_bench.py [addresses] [ls degree]
+# Encode/decode ops/s and bytes per update for the DVrouter payload (a
+# distance vector covering every address) and the LSrouter payload (one
+# router's neighbors) with each codec.
+
+ITERATIONS = 2000
+
+
+def opsPerSec(fn):
+    return ITERATIONS / timeit.timeit(fn, number=ITERATIONS)
+
+
+def main():
+    numAddrs = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    degree = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    addrs = ["R%d" % i for i in range(numAddrs)]
+    dv = {addr: i % 16 for i, addr in enumerate(addrs)}
+    lsNeighbors = [(addr, 1 + i % 15) for i, addr in enumerate(addrs[:degree])]
+
+    print "{} addresses, LS degree {}".format(numAddrs, degree)
+    print "{:<12}{:<6}{:>14}{:>14}{:>8}".format(
+        "codec", "kind", "encode ops/s", "decode ops/s", "bytes")
+    for name, codec in (("json", JsonCodec()), ("struct", StructCodec(addrs))):
+        dvMsg = codec.encodeDV(addrs[0], 12345, 12340, True, dv)
+        lsMsg = codec.encodeLS(addrs[0], 12345, lsNeighbors)
+        assert codec.decodeDV(dvMsg) == (addrs[0], 12345, 12340, True, dv)
+        assert codec.decodeLS(lsMsg) == (addrs[0], 12345, lsNeighbors)
+        rows = (
+            ("DV", lambda: codec.encodeDV(addrs[0], 12345, 12340, True, dv),
+             lambda: codec.decodeDV(dvMsg), len(dvMsg)),
+            ("LS", lambda: codec.encodeLS(addrs[0], 12345, lsNeighbors),
+             lambda: codec.decodeLS(lsMsg), len(lsMsg)),
+        )
+        for kind, encode, decode, size in rows:
+            print "{:<12}{:<6}{:>14.0f}{:>14.0f}{:>8}".format(
+                name, kind, opsPerSec(encode), opsPerSec(decode), size)
+
+
+if __name__ == "__main__":
+    main()
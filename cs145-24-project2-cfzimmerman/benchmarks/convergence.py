@@ -0,0 +1,55 @@
+import sys
+import os
+import multiprocessing
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))  # noqa: E402
+sys.path.insert(0, parent_dir)  # noqa: E402
+import runner
+import topogen
+
+# python2 benchmarks/convergence.py [config.json ...]
+# Runs DVrouter and LSrouter in virtual time on each config (by default a
+# set of topologies made with topogen.py) and reports, per run: how long
+# routes took to converge at the start and after link changes, routing
+# messages and payload bytes per router, time spent in router handlers,
+# wall-clock time, and peak RSS. Each run gets a fresh process so peak RSS
+# is its own.
+
+# topogen.py arguments for the default configs
+# (kept small enough to finish in minutes; see topogen.py for larger ones)
+TOPOLOGIES = [
+    ["grid", "--rows", "10", "--cols", "10", "--flaps", "5"],
+    ["geometric", "-n", "150", "--flaps", "5"],
+    ["waxman", "-n", "100", "--flaps", "5"],
+    ["fattree", "-k", "6", "--flaps", "5"],
+]
+
+
+def run((config, name)):
+    """Runs one config with one router class. Returns a result dict"""
+    return runner.runScenario({"config": config, "router": name, "seed": 0,
+                               "latency": 100, "oracle": True})
+
+
+def main():
+    configs = sys.argv[1:] or topogen.writeConfigs(TOPOLOGIES)
+    # one process per run so each peak RSS is measured on its own
+    pool = multiprocessing.Pool(1, maxtasksperchild=1)
+    print "{:<26}{:<4}{:>8}{:>10}{:>10}{:>10}{:>11}{:>10}{:>8}{:>8}".format(
+        "config", "", "routers", "start ms", "change ms", "msgs/rtr",
+        "bytes/rtr", "handler s", "wall s", "RSS MB")
+    for config in configs:
+        for name in ("DV", "LS"):
+            r = pool.apply(run, ((config, name),))
+            print "{:<26}{:<4}{:>8}{:>10}{:>10}{:>10.0f}{:>11.0f}{:>10.2f}{:>8.1f}{:>8.1f} {}".format(
+                os.path.basename(r["config"]), r["router"], r["routers"],
+                r["startMs"], r["changeMs"], r["messages"], r["bytes"],
+                r["handlerSeconds"], r["wallSeconds"], r["peakRssMb"],
+                "" if r["passed"] else "FAIL")
+    pool.close()
+    print "(start ms: initial convergence; change ms: slowest convergence"
+    print " after a link change; see metrics.Metrics)"
+
+
+if __name__ == "__main__":
+    main()
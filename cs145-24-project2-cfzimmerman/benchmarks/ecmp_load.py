@@ -0,0 +1,62 @@
+import sys
+import os
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))  # noqa: E402
+sys.path.insert(0, parent_dir)  # noqa: E402
+from network import loadRouterClass
+import runner
+import topogen
+
+# python2 benchmarks/ecmp_load.py [config.json ...]
+# Runs DVrouter and LSrouter with single-path and equal-cost multipath
+# forwarding in virtual time on each config (by default topogen.py
+# fat-trees and a grid with unit link costs, so most client pairs have
+# several shortest paths), and reports how the traceroutes spread over the
+# router-to-router links: the links that carried any, the busiest link's
+# count, and its ratio to the mean over all of them.
+
+TOPOLOGIES = [
+    ["fattree", "-k", "4", "--max-cost", "1", "--clients", "16"],
+    ["fattree", "-k", "6", "--max-cost", "1", "--clients", "30"],
+    ["grid", "--rows", "6", "--cols", "6", "--max-cost", "1"],
+]
+
+
+def run(config, name, ecmp):
+    """Returns a result dict for one run"""
+    class Router(loadRouterClass(name)):
+        USE_ECMP = ecmp
+    net = runner.runVirtual(config, Router, metrics=True)
+    links = net.metrics.report()["links"]
+    loads = []
+    for (e1, e2) in net.links:
+        if e1 in net.routers and e2 in net.routers:
+            stats = links.get("{}-{}".format(e1, e2))
+            loads.append(stats["traceroutes"] if stats else 0)
+    mean = float(sum(loads)) / len(loads)
+    return {
+        "used": sum(1 for load in loads if load),
+        "links": len(loads),
+        "max": max(loads),
+        "ratio": max(loads) / mean if mean else 0,
+        "passed": net.allRoutesCorrect(),
+    }
+
+
+def main():
+    configs = sys.argv[1:] or topogen.writeConfigs(TOPOLOGIES)
+    print "{:<20}{:<4}{:<8}{:>12}{:>10}{:>10}".format(
+        "config", "", "paths", "links used", "max load", "max/mean")
+    for config in configs:
+        for name in ("DV", "LS"):
+            for ecmp in (False, True):
+                r = run(config, name, ecmp)
+                print "{:<20}{:<4}{:<8}{:>12}{:>10}{:>10.2f} {}".format(
+                    os.path.basename(config), name,
+                    "ECMP" if ecmp else "single",
+                    "{}/{}".format(r["used"], r["links"]), r["max"],
+                    r["ratio"], "" if r["passed"] else "FAIL")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import sys
+import os
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))  # noqa: E402
+sys.path.insert(0, parent_dir)  # noqa: E402
+from network import loadRouterClass
+import runner
+import topogen
+
+# python2 benchmarks/flap_damping.py [config.json ...]
+# Runs DVrouter and LSrouter with and without flap damping in virtual time
+# and oracle mode on each config (by default topogen.py topologies whose
+# flapped links go down REPEATS times in quick succession), and reports
+# routing messages and triggered updates per router, the links suppressed,
+# the slowest convergence after any change, and convergence after the last
+# one.
+
+REPEATS = 12
+TOPOLOGIES = [
+    ["grid", "--rows", "10", "--cols", "10", "--flaps", "10",
+     "--flap-repeats", str(REPEATS), "--flap-length", "8"],
+    ["geometric", "-n", "100", "--flaps", "10",
+     "--flap-repeats", str(REPEATS), "--flap-length", "8"],
+]
+
+
+def run(config, name, damping):
+    """Returns a result dict for one run"""
+    class Router(loadRouterClass(name)):
+        USE_FLAP_DAMPING = damping
+    net = runner.runVirtual(config, Router, oracle=True, metrics=True)
+    report = net.metrics.report()
+    converged = [change["convergedMs"] for change in report["changes"][1:]]
+    n = float(len(net.routers))
+    return {
+        "packets": report["totals"]["packets"] / n,
+        "triggered": sum(r["updatesSent"]
+                         for r in report["routers"].values()) / n,
+        # each suppression is counted at both ends of the link
+        "suppressed": sum(r.damper.suppressions
+                          for r in net.routers.values()) / 2,
+        "changeMs": runner.slowestChange(report),
+        "lastMs": (converged or [None])[-1],
+        "passed": net.allRoutesCorrect(),
+    }
+
+
+def main():
+    configs = sys.argv[1:] or topogen.writeConfigs(TOPOLOGIES)
+    print "{:<20}{:<4}{:<8}{:>9}{:>15}{:>12}{:>11}{:>9}".format(
+        "config", "", "damping", "msgs/rtr", "triggered/rtr", "suppressed",
+        "change ms", "last ms")
+    for config in configs:
+        for name in ("DV", "LS"):
+            for damping in (False, True):
+                r = run(config, name, damping)
+                print ("{:<20}{:<4}{:<8}{:>9.1f}{:>15.1f}{:>12}{:>11}{:>9} "
+                       "{}").format(
+                    os.path.basename(config), name, "on" if damping else "off",
+                    r["packets"], r["triggered"], r["suppressed"],
+                    "-" if r["changeMs"] is None else r["changeMs"],
+                    "-" if r["lastMs"] is None else r["lastMs"],
+                    "" if r["passed"] else "FAIL")
+
+
+if __name__ == "__main__":
+    main()
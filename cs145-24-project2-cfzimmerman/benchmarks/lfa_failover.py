@@ -0,0 +1,80 @@
+import sys
+import os
+import json
+import glob
+import tempfile
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))  # noqa: E402
+sys.path.insert(0, parent_dir)  # noqa: E402
+from LSrouter import LSrouter
+import runner
+import topogen
+
+# python2 benchmarks/lfa_failover.py [config.json ...]
+# Runs LSrouter with and without loop-free alternates in virtual time on each
+# config (by default the bundled _events configs and topogen.py topologies
+# with link flaps) and reports the traceroutes lost after link changes:
+# dropped (no route, or sent on a link that went down) and looped (arrived
+# after visiting a router twice), and the slowest convergence after a
+# change. Configs are copied with traceroutes sent every SEND_RATE rounds so
+# short failovers are sampled.
+
+TOPOLOGIES = [
+    ["grid", "--rows", "8", "--cols", "8", "--flaps", "10"],
+    ["geometric", "-n", "80", "--flaps", "10"],
+]
+SEND_RATE = 1
+
+
+def withSendRate(config, outDir):
+    """Returns a copy of config that sends traceroutes every SEND_RATE"""
+    with open(config) as f:
+        netJson = json.load(f)
+    netJson["clientSendRate"] = SEND_RATE
+    path = os.path.join(outDir, os.path.basename(config))
+    with open(path, "w") as f:
+        json.dump(netJson, f)
+    return path
+
+
+def run(config, useLfa):
+    """Returns a result dict for one run"""
+    class Router(LSrouter):
+        USE_LFA = useLfa
+    net = runner.runVirtual(config, Router, metrics=True)
+    report = net.metrics.report()
+    changes = report["changes"][1:]
+    return {
+        "changes": len(changes),
+        "dropped": sum(change["dropped"] for change in changes),
+        "looped": sum(change["looped"] for change in changes),
+        "changeMs": runner.slowestChange(report),
+        "passed": net.allRoutesCorrect(),
+    }
+
+
+def defaultConfigs(outDir):
+    """The bundled _events configs, and the TOPOLOGIES configs written to
+       outDir"""
+    return (sorted(glob.glob(os.path.join(parent_dir, "*_events.json"))) +
+            topogen.writeConfigs(TOPOLOGIES, outDir))
+
+
+def main():
+    outDir = tempfile.mkdtemp(prefix="lfa")
+    configs = sys.argv[1:] or defaultConfigs(outDir)
+    print "{:<26}{:<8}{:>8}{:>9}{:>8}{:>11}".format(
+        "config", "", "changes", "dropped", "looped", "change ms")
+    for config in configs:
+        config = withSendRate(config, outDir)
+        for useLfa in (False, True):
+            r = run(config, useLfa)
+            print "{:<26}{:<8}{:>8}{:>9}{:>8}{:>11} {}".format(
+                os.path.basename(config), "LFA" if useLfa else "no LFA",
+                r["changes"], r["dropped"], r["looped"],
+                "-" if r["changeMs"] is None else r["changeMs"],
+                "" if r["passed"] else "FAIL")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+import sys
+import os
+import time
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))  # noqa: E402
+sys.path.insert(0, parent_dir)  # noqa: E402
+from link import Link
+from packet import Packet
+from scheduler import DelayScheduler
+
+# python2 benchmarks/link_throughput.py [packets] [links]
+# Sends packets round-robin over links (latency 10ms) and measures how many
+# packets/s get delivered with a thread per packet versus the shared
+# DelayScheduler used by Network.
+
+LATENCY = 10
+
+
+def run(numPackets, numLinks, scheduler):
+    """Returns delivered packets/s for one configuration"""
+    links = [Link("A%d" % i, "B%d" % i, 1, 1, LATENCY, scheduler)
+             for i in range(numLinks)]
+    payload = "x" * 64
+    start = time.time()
+    for i in range(numPackets):
+        link = links[i % numLinks]
+        link.send(Packet(Packet.ROUTING, link.e1, link.e2, payload), link.e1)
+    while sum(link.q12.qsize() for link in links) < numPackets:
+        time.sleep(0.001)
+    return numPackets / (time.time() - start)
+
+
+def main():
+    numPackets = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    numLinks = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    threaded = run(numPackets, numLinks, None)
+    scheduler = DelayScheduler()
+    scheduler.start()
+    shared = run(numPackets, numLinks, scheduler)
+    scheduler.join()
+    print "{} packets over {} links".format(numPackets, numLinks)
+    print "thread per packet: {:>10.0f} packets/s".format(threaded)
+    print "DelayScheduler:    {:>10.0f} packets/s".format(shared)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+import sys
+import os
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))  # noqa: E402
+sys.path.insert(0, parent_dir)  # noqa: E402
+from network import Network
+from LSrouter import LSrouter
+
+# python2 benchmarks/ls_flood_overhead.py [config.json ...]
+# Runs LSrouter on each config in virtual time and reports routing messages
+# sent per router per simulated second, with an LSA originated every
+# heartbeat (the old behavior) and with refresh suppression.
+
+CONFIGS = ["03_pg244_net.json", "04_pg244_net_events.json",
+           "05_pg242_net.json", "06_pg242_net_events.json"]
+
+
+def counting(refreshHeartbeats):
+    """Returns an LSrouter subclass that counts the routing packets it sends"""
+    class CountingLSrouter(LSrouter):
+        LSA_REFRESH_HEARTBEATS = refreshHeartbeats
+        sent = 0
+
+        def send(self, port, packet):
+            if packet.isRouting():
+                CountingLSrouter.sent += 1
+            LSrouter.send(self, port, packet)
+    return CountingLSrouter
+
+
+def run(config, refreshHeartbeats):
+    """Returns (messages per router per second, all routes correct)"""
+    routerClass = counting(refreshHeartbeats)
+    net = Network(config, routerClass, virtual=True)
+    net.runVirtual(printRoutes=False)
+    seconds = net.scheduler.now() / float(1000)
+    rate = routerClass.sent / (len(net.routers) * seconds)
+    return rate, net.allRoutesCorrect()
+
+
+def main():
+    configs = sys.argv[1:] or [os.path.join(parent_dir, cfg) for cfg in CONFIGS]
+    print "{:<28}{:>16}{:>16}".format(
+        "config", "every heartbeat", "suppressed")
+    for config in configs:
+        before, okBefore = run(config, 1)
+        after, okAfter = run(config, LSrouter.LSA_REFRESH_HEARTBEATS)
+        print "{:<28}{:>11.2f} {:<4}{:>11.2f} {:<4}".format(
+            os.path.basename(config), before, "" if okBefore else "FAIL",
+            after, "" if okAfter else "FAIL")
+    print "(routing messages per router per second)"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import sys
+import os
+import multiprocessing
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))  # noqa: E402
+sys.path.insert(0, parent_dir)  # noqa: E402
+import runner
+import topogen
+
+# python2 benchmarks/lsdb_memory.py [config.json ...]
+# Runs LSrouter, whose database and shortest path tree are arrays of node ids
+# sharing interned LSAs (lsdb.py), and HLSrouter without areas, which keeps
+# its LSAs as dicts per router and builds its trees' rows from them, in
+# virtual time on each config, and reports the memory their routing state
+# holds per router.
+# Python 2 has no tracemalloc, so memory is the sys.getsizeof of everything
+# reachable from the routers' getState, counting objects shared between
+# routers once, split into per-router and shared bytes. HLSrouter also keeps
+# a tree for its area.
+
+TOPOLOGIES = [
+    ["grid", "--rows", "12", "--cols", "12"],
+    ["geometric", "-n", "200"],
+]
+
+
+def reachable(obj, skip):
+    """Returns {id: bytes} of obj and everything it references, except
+       objects whose ids are in skip"""
+    sizes = {}
+    stack = [obj]
+    while stack:
+        o = stack.pop()
+        if id(o) in skip or id(o) in sizes:
+            continue
+        sizes[id(o)] = sys.getsizeof(o)
+        if isinstance(o, dict):
+            stack.extend(o.iterkeys())
+            stack.extend(o.itervalues())
+        elif isinstance(o, (list, tuple, set, frozenset)):
+            stack.extend(o)
+        else:
+            if hasattr(o, "__dict__"):
+                stack.append(o.__dict__)
+            for cls in type(o).__mro__:
+                for name in getattr(cls, "__slots__", ()):
+                    if name != "__weakref__" and hasattr(o, name):
+                        stack.append(getattr(o, name))
+    return sizes
+
+
+def run((config, name)):
+    """Returns (routers, private bytes per router, shared bytes per router,
+       all routes correct)"""
+    net = runner.runVirtual(config, name, oracle=True)
+    states = [router.getState() for router in net.routers.values()]
+    # addresses, codecs and small ints everyone refers to aren't routing
+    # state
+    skip = set(id(addr) for addr in list(net.routers) + list(net.clients))
+    skip.update(id(router.codec) for router in net.routers.values())
+    skip.update(id(i) for i in range(-5, 257))
+    # objects reachable from more than one router are shared
+    sizes = {}
+    owners = {}
+    for i, state in enumerate(states):
+        for o, size in reachable(state, skip).iteritems():
+            sizes[o] = size
+            owners[o] = i if owners.get(o, i) == i else None
+    private = sum(sizes[o] for o, owner in owners.iteritems()
+                  if owner is not None)
+    shared = sum(sizes[o] for o, owner in owners.iteritems() if owner is None)
+    n = float(len(states))
+    return len(states), private / n, shared / n, net.allRoutesCorrect()
+
+
+def main():
+    configs = sys.argv[1:] or topogen.writeConfigs(TOPOLOGIES)
+    pool = multiprocessing.Pool(1, maxtasksperchild=1)
+    print "{:<20}{:<5}{:>8}{:>16}{:>15}".format(
+        "config", "", "routers", "private KB/rtr", "shared KB/rtr")
+    for config in configs:
+        for name in ("LS", "HLS"):
+            routers, private, shared, ok = pool.apply(run, ((config, name),))
+            print "{:<20}{:<5}{:>8}{:>16.1f}{:>15.1f} {}".format(
+                os.path.basename(config), name, routers, private / 1024,
+                shared / 1024, "" if ok else "FAIL")
+
+
+if __name__ == "__main__":
+    main()
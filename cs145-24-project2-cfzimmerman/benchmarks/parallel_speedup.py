@@ -0,0 +1,54 @@
+import sys
+import os
+import json
+import time
+import multiprocessing
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))  # noqa: E402
+sys.path.insert(0, parent_dir)  # noqa: E402
+import parallel
+import runner
+import topogen
+
+# python2 benchmarks/parallel_speedup.py [config.json ...]
+# Runs DVrouter and LSrouter on each config (by default a topogen.py grid) in
+# virtual time with 1, 2, 4, ... worker processes, up to the number of cores,
+# and reports wall time, speedup over one process, the lookahead window and
+# whether all routes came out correct.
+
+TOPOLOGY = ["grid", "--rows", "30", "--cols", "30", "--flaps", "5",
+            "--max-cost", "4"]
+
+
+def run(config, name, workers):
+    """Returns (wall seconds, all routes correct)"""
+    start = time.time()
+    net = runner.runVirtual(config, name, workers=workers)
+    return time.time() - start, net.allRoutesCorrect()
+
+
+def main():
+    configs = sys.argv[1:] or topogen.writeConfigs([TOPOLOGY])
+    counts = [1]
+    while counts[-1] * 2 <= multiprocessing.cpu_count():
+        counts.append(counts[-1] * 2)
+    print "{:<20}{:<4}{:>8}{:>12}{:>8}{:>9}".format(
+        "config", "", "workers", "window ms", "wall s", "speedup")
+    for config in configs:
+        with open(config) as f:
+            netJson = json.load(f)
+        for name in ("DV", "LS"):
+            base = None
+            for workers in counts:
+                window = parallel.lookahead(
+                    netJson, parallel.partition(netJson, workers), 100)
+                seconds, ok = run(config, name, workers)
+                base = base or seconds
+                print "{:<20}{:<4}{:>8}{:>12}{:>8.1f}{:>9.2f} {}".format(
+                    os.path.basename(config), name, workers,
+                    "-" if window is None else window, seconds,
+                    base / seconds, "" if ok else "FAIL")
+
+
+if __name__ == "__main__":
+    main()
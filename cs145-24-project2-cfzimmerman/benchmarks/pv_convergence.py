@@ -0,0 +1,80 @@
+import sys
+import os
+import glob
+import json
+import tempfile
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))  # noqa: E402
+sys.path.insert(0, parent_dir)  # noqa: E402
+import runner
+import topogen
+
+# python2 benchmarks/pv_convergence.py [config.json ...]
+# Runs DVrouter and PVrouter in virtual time and oracle mode on each config
+# (by default the bundled *_events configs and topogen.py topologies with
+# link flaps; in the sparse geometric one, flaps often leave DVrouter
+# counting to infinity over long detours), and reports routing messages
+# and bytes per router, the traceroutes dropped and looped, and the slowest
+# and mean convergence after a change.
+# Oracle mode walks routes without sending traceroutes, so routes are
+# checked every tick (clientSendRate 1) to time convergence finely.
+
+TOPOLOGIES = [
+    ["grid", "--rows", "10", "--cols", "10", "--flaps", "20"],
+    ["geometric", "-n", "150", "--flaps", "20"],
+    ["geometric", "-n", "150", "--radius", "0.09", "--flaps", "20"],
+    ["waxman", "-n", "150", "--flaps", "20"],
+]
+
+
+def run(config, name):
+    """Returns a result dict for one run"""
+    with open(config) as f:
+        netJson = json.load(f)
+    netJson["clientSendRate"] = 1
+    fd, path = tempfile.mkstemp(suffix=".json")
+    with os.fdopen(fd, "w") as f:
+        json.dump(netJson, f)
+    net = runner.runVirtual(path, name, oracle=True, metrics=True)
+    os.remove(path)
+    report = net.metrics.report()
+    totals = report["totals"]
+    converged = [change["convergedMs"] for change in report["changes"][1:]]
+    n = float(len(net.routers))
+    return {
+        "packets": totals["packets"] / n,
+        "bytes": totals["bytes"] / n,
+        "dropped": totals["traceroutesDropped"],
+        "looped": totals["traceroutesLooped"],
+        "changeMs": runner.slowestChange(report),
+        "meanMs": (None if None in converged or not converged
+                   else sum(converged) / len(converged)),
+        "passed": net.allRoutesCorrect(),
+    }
+
+
+def defaultConfigs():
+    """Returns the bundled *_events configs, and writes the TOPOLOGIES
+       configs to a temporary directory"""
+    return (sorted(glob.glob(os.path.join(parent_dir, "*_events.json"))) +
+            topogen.writeConfigs(TOPOLOGIES))
+
+
+def main():
+    configs = sys.argv[1:] or defaultConfigs()
+    print "{:<26}{:<4}{:>9}{:>11}{:>9}{:>8}{:>11}{:>9}".format(
+        "config", "", "msgs/rtr", "bytes/rtr", "dropped", "looped",
+        "change ms", "mean ms")
+    for config in configs:
+        for name in ("DV", "PV"):
+            r = run(config, name)
+            print "{:<26}{:<4}{:>9.1f}{:>11.0f}{:>9}{:>8}{:>11}{:>9} {}".format(
+                os.path.basename(config), name, r["packets"], r["bytes"],
+                r["dropped"], r["looped"],
+                "-" if r["changeMs"] is None else r["changeMs"],
+                "-" if r["meanMs"] is None else r["meanMs"],
+                "" if r["passed"] else "FAIL")
+
+
+if __name__ == "__main__":
+    main()
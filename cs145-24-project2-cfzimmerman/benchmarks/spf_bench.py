@@ -0,0 +1,105 @@
+import sys
+import os
+import random
+import time
+
+import networkx as nx
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))  # noqa: E402
+sys.path.insert(0, parent_dir)  # noqa: E402
+from lsdb import CompactSpt, node_addr, node_id
+
+# python2 benchmarks/spf_bench.py [routers] [avg degree] [lsas]
+# Replays a stream of random LSAs against one router's link state database
+# and compares the time per LSA of the networkx full recompute LSrouter used
+# to run with the incremental CompactSpt. Half the LSAs are refreshes
+# that change nothing, like heartbeats; the rest change, remove, or re-add
+# one edge.
+
+
+def randomGraph(numRouters, degree, rng):
+    """Returns {(u, v): cost} for a random connected graph, both directions"""
+    edges = {}
+    for v in range(1, numRouters):
+        u = rng.randrange(v)
+        edges[(u, v)] = edges[(v, u)] = rng.randint(1, 10)
+    while len(edges) < numRouters * degree:
+        u, v = rng.randrange(numRouters), rng.randrange(numRouters)
+        if u != v:
+            edges[(u, v)] = edges[(v, u)] = rng.randint(1, 10)
+    return edges
+
+
+def lsaStream(edges, count, rng):
+    """Yields (u, v, cost) updates, with a cost of None for removals"""
+    keys = sorted(edges)
+    removed = set()
+    for _ in range(count):
+        u, v = rng.choice(keys)
+        kind = rng.random()
+        if kind < 0.5:
+            yield u, v, (None if (u, v) in removed else edges[(u, v)])
+        elif kind < 0.8:
+            removed.discard((u, v))
+            edges[(u, v)] = rng.randint(1, 10)
+            yield u, v, edges[(u, v)]
+        elif (u, v) in removed:
+            removed.discard((u, v))
+            yield u, v, edges[(u, v)]
+        else:
+            removed.add((u, v))
+            yield u, v, None
+
+
+def fullRecompute(graph, root):
+    """What LSrouter.__recompute_paths did on every accepted LSA"""
+    paths = nx.single_source_dijkstra_path(graph, root)
+    return {addr: path[1] for addr, path in paths.items() if len(path) > 1}
+
+
+def main():
+    numRouters = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    degree = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    numLsas = int(sys.argv[3]) if len(sys.argv) > 3 else 1000
+    edges = randomGraph(numRouters, degree, random.Random(145))
+    updates = list(lsaStream(dict(edges), numLsas, random.Random(146)))
+
+    graph = nx.DiGraph()
+    spt = CompactSpt("0")
+    # the tree numbers nodes by address
+    ids = [node_id(str(u)) for u in range(numRouters)]
+    for (u, v), cost in edges.items():
+        graph.add_edge(u, v, weight=cost)
+        spt.set_edge(ids[u], ids[v], cost)
+
+    start = time.time()
+    for u, v, cost in updates:
+        if cost is None:
+            if graph.has_edge(u, v):
+                graph.remove_edge(u, v)
+        else:
+            graph.add_edge(u, v, weight=cost)
+        nxHops = fullRecompute(graph, 0)
+    nxTime = time.time() - start
+
+    start = time.time()
+    for u, v, cost in updates:
+        if cost is None:
+            spt.remove_edge(ids[u], ids[v])
+        else:
+            spt.set_edge(ids[u], ids[v], cost)
+    sptTime = time.time() - start
+
+    dist = nx.single_source_dijkstra_path_length(graph, 0)
+    assert {str(u): d for u, d in dist.items()} == spt.distances()
+    assert set(nxHops) == set(int(node_addr(node)) for node, hop
+                              in enumerate(spt.next_hop) if hop != -1)
+
+    print "{} routers, {} edges, {} LSAs".format(
+        numRouters, len(edges), numLsas)
+    print "networkx full SPF:    {:>10.1f} us/LSA".format(1e6 * nxTime / numLsas)
+    print "incremental SPT:      {:>10.1f} us/LSA".format(1e6 * sptTime / numLsas)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import sys
+import os
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))  # noqa: E402
+sys.path.insert(0, parent_dir)  # noqa: E402
+from LSrouter import LSrouter
+import runner
+import topogen
+
+# python2 benchmarks/spf_throttle.py [config.json ...]
+# Runs LSrouter with every changed LSA applied to its shortest path tree as
+# it arrives and with throttled, batched shortest path runs, in virtual time
+# and oracle mode on each config (by default topogen.py topologies with
+# bursts of link flaps), and reports per router the changed LSAs, shortest
+# path runs and handler time, and the slowest convergence after a change.
+
+TOPOLOGIES = [
+    ["grid", "--rows", "12", "--cols", "12", "--flaps", "30",
+     "--flap-window", "20", "--flap-length", "5"],
+    ["geometric", "-n", "150", "--flaps", "30", "--flap-window", "20",
+     "--flap-length", "5"],
+]
+
+
+def run(config, throttle):
+    """Returns a result dict for one run"""
+    class Router(LSrouter):
+        if not throttle:
+            SPF_DELAY_HEARTBEATS = 0
+            SPF_HOLD_HEARTBEATS = 0
+            SPF_MAX_HEARTBEATS = 0
+    net = runner.runVirtual(config, Router, oracle=True, metrics=True)
+    report = net.metrics.report()
+    n = float(len(net.routers))
+    return {
+        "lsas": sum(r.spf_requests for r in net.routers.values()) / n,
+        "runs": sum(r.spf_runs for r in net.routers.values()) / n,
+        "handlerMs": report["totals"]["handlerSeconds"] * 1000 / n,
+        "changeMs": runner.slowestChange(report),
+        "passed": net.allRoutesCorrect(),
+    }
+
+
+def main():
+    configs = sys.argv[1:] or topogen.writeConfigs(TOPOLOGIES)
+    print "{:<20}{:<10}{:>9}{:>10}{:>12}{:>11}".format(
+        "config", "SPF", "LSAs/rtr", "runs/rtr", "handler ms", "change ms")
+    for config in configs:
+        for throttle in (False, True):
+            r = run(config, throttle)
+            print "{:<20}{:<10}{:>9.1f}{:>10.1f}{:>12.1f}{:>11} {}".format(
+                os.path.basename(config),
+                "throttled" if throttle else "each LSA", r["lsas"], r["runs"],
+                r["handlerMs"], "-" if r["changeMs"] is None else r["changeMs"],
+                "" if r["passed"] else "FAIL")
+
+
+if __name__ == "__main__":
+    main()
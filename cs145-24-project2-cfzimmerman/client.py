@@ -1,5 +1,6 @@
 import time
 import sys
+import random
 import Queue
 from packet import Packet
 
@@ -8,24 +9,39 @@ class Client:
     """Client class sends periodic "traceroute" packets and returns routes that
        these packets take back to the network object."""
 
+    # Milliseconds between ("time", timeMillisecs) inbox entries, which
+    # the network schedules to drive handleTime (see Router)
+    HANDLE_TIME_INTERVAL = 100
 
-    def __init__(self, addr, allClients, sendRate, updateFunction):
-        """Inititaliza parameters"""
+
+    def __init__(self, addr, allClients, sendRate, updateFunction,
+                 sample=None):
+        """Inititaliza parameters.  If sample is set, each round of
+           traceroutes goes to only that many randomly chosen clients"""
         self.addr = addr
         self.allClients = allClients
+        self.sample = sample
         self.sendRate = sendRate
         self.lastTime = 0
         self.link = None
         self.updateFunction = updateFunction
         self.sending = True
-        self.linkChanges = Queue.Queue()
+        self.inbox = Queue.Queue()
+        self.inboxCallback = None  # called after each inbox put if set
         self.keepRunning = True
 
 
     def changeLink(self, change):
         """Add a link to the client.
            The change argument should be a tuple ('add', link)"""
-        self.linkChanges.put(change)
+        self.putInbox(("change", change))
+
+
+    def putInbox(self, item):
+        """Queue a link change or arriving packet for the main loop"""
+        self.inbox.put(item)
+        if self.inboxCallback:
+            self.inboxCallback()
 
 
     def handlePacket(self, packet):
@@ -33,12 +49,16 @@ class Client:
            If it's a "traceroute" packet, update the network object with it's
            route"""
         if packet.kind == Packet.TRACEROUTE:
-            self.updateFunction(packet.srcAddr, packet.dstAddr, packet.route)
+            self.updateFunction(packet.srcAddr, packet.dstAddr, packet.getRoute())
 
 
     def sendTraceroutes(self):
-        """Send "traceroute" packets to every other client in the network"""
-        for dstClient in self.allClients:
+        """Send "traceroute" packets to every other client in the network,
+           or to a random sample of them"""
+        dstClients = self.allClients
+        if self.sample is not None and self.sample < len(dstClients):
+            dstClients = random.sample(dstClients, self.sample)
+        for dstClient in dstClients:
             packet = Packet(Packet.TRACEROUTE, self.addr, dstClient)
             if self.link:
                 self.link.send(packet, self.addr)
@@ -53,21 +73,54 @@ class Client:
 
 
     def runClient(self):
-        """Main loop of client"""
+        """Main loop of client.  Blocks on the inbox until a link change,
+           packet, or handleTime deadline arrives, then handles everything
+           pending"""
         while self.keepRunning:
-            time.sleep(0.1)
-            timeMillisecs = int(round(time.time() * 1000))
+            self.handleInboxItem(self.inbox.get())
+            self.drainInbox()
+
+
+    def drainInbox(self):
+        """Handle every pending link change and packet.  Called by runClient,
+           or by the network in virtual-time mode"""
+        while True:
             try:
-                change = self.linkChanges.get_nowait()
-                if change[0] == "add":
-                    self.link = change[1]
+                item = self.inbox.get_nowait()
             except Queue.Empty:
-                pass
-            if self.link:
-                packet = self.link.recv(self.addr)
-                if packet:
-                    self.handlePacket(packet)
-            self.handleTime(timeMillisecs)
+                return
+            self.handleInboxItem(item)
+
+
+    def handleInboxItem(self, item):
+        """Dispatch one inbox entry to the link change, packet or time
+           handlers"""
+        if item[0] == "time":
+            self.handleTime(item[1])
+        elif item[0] == "change":
+            change = item[1]
+            if change[0] == "add":
+                self.attachLink(change[1])
+        elif item[0] == "packet":
+            self.handlePacket(item[1])
+
+
+    def attachLink(self, link):
+        """Send and receive packets on link"""
+        self.link = link
+        self.link.setReceiver(self.addr, lambda packet:
+                              self.putInbox(("packet", packet)))
+
+
+    def getState(self):
+        """Returns the traceroute schedule as a picklable dict, for network
+           snapshots"""
+        return {"lastTime": self.lastTime, "sending": self.sending}
+
+
+    def setState(self, state):
+        """Restore state from getState"""
+        self.__dict__.update(state)
 
 
     def lastSend(self):
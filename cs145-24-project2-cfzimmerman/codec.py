@@ -0,0 +1,155 @@
+import struct
+from json import dumps, loads
+
+
+"""
+Codecs turn routing payloads into packet content strings and back.
+Every codec has the same methods:
+
+- encodeDV(addr, version, ack, full, dv) / decodeDV(msg)
+    -> (addr, version, ack, full, dv)
+    for distance vector updates, dv is a {addr: cost} dict holding either
+    the whole vector (full) or only changed entries
+- encodeLS(sourceAddr, packetId, lsNeighbors) / decodeLS(msg)
+    -> (sourceAddr, packetId, lsNeighbors)
+    for link state updates, lsNeighbors is a list of (addr, cost) pairs
+- encodePV(addr, version, ack, routes) / decodePV(msg)
+    -> (addr, version, ack, routes)
+    for path vector updates, routes is a {dst: (cost, path)} dict whose
+    paths are tuples of the addresses after addr on the way to dst, with
+    None for withdrawn routes
+
+JsonCodec is readable and needs no setup. StructCodec is compact but needs
+every address up front; Network builds one from the config's routers and
+clients and gives it to each router as router.codec.
+"""
+
+
+class JsonCodec:
+    """Encodes payloads as json strings"""
+
+    def encodeDV(self, addr, version, ack, full, dv):
+        return dumps({"addr": addr, "version": version, "ack": ack,
+                      "full": full, "dv": dv})
+
+    def decodeDV(self, msg):
+        parsed = loads(msg)
+        return (parsed["addr"], parsed["version"], parsed["ack"],
+                parsed["full"], parsed["dv"])
+
+    def encodeLS(self, sourceAddr, packetId, lsNeighbors):
+        return dumps({
+            "source_addr": sourceAddr,
+            "packet_id": packetId,
+            "ls_neighbors": lsNeighbors
+        })
+
+    def decodeLS(self, msg):
+        parsed = loads(msg)
+        return (parsed["source_addr"], parsed["packet_id"],
+                [tuple(nb) for nb in parsed["ls_neighbors"]])
+
+    def encodePV(self, addr, version, ack, routes):
+        return dumps({"addr": addr, "version": version, "ack": ack,
+                      "routes": routes})
+
+    def decodePV(self, msg):
+        parsed = loads(msg)
+        routes = {dst: None if route is None else (route[0], tuple(route[1]))
+                  for dst, route in parsed["routes"].iteritems()}
+        return parsed["addr"], parsed["version"], parsed["ack"], routes
+
+
+class StructCodec:
+    """Encodes payloads as packed binary strings.  Addresses are sent as
+       2 byte indexes into an address table shared by every router, and
+       costs as 2 byte unsigned ints"""
+
+    # (addr id, version, ack, full, entry count) for DV,
+    # (source id, packet id, entry count) for LS,
+    # (addr id, version, ack, route count) for PV
+    DV_HEADER = struct.Struct("!HIIBH")
+    LS_HEADER = struct.Struct("!HIH")
+    PV_HEADER = struct.Struct("!HIIH")
+    # (dst id, cost, path length) before each PV route's path of addr ids.
+    # A withdrawn route has a path length of WITHDRAWN and no path
+    PV_ROUTE = struct.Struct("!HHH")
+    WITHDRAWN = 0xffff
+
+    def __init__(self, addrs):
+        """addrs: every address that can appear in a payload"""
+        self.addrs = sorted(addrs)
+        self.ids = {addr: i for i, addr in enumerate(self.addrs)}
+        # Struct objects for n (addr id, cost) pairs, built as needed
+        self.entryStructs = {}
+
+    def entryStruct(self, n):
+        """Returns a Struct packing n (addr id, cost) pairs"""
+        s = self.entryStructs.get(n)
+        if s is None:
+            s = struct.Struct("!" + "HH" * n)
+            self.entryStructs[n] = s
+        return s
+
+    def packEntries(self, addrs, costs):
+        """Packs the (addrs[i], costs[i]) pairs"""
+        flat = [0] * (2 * len(costs))
+        flat[0::2] = map(self.ids.__getitem__, addrs)
+        flat[1::2] = costs
+        return self.entryStruct(len(costs)).pack(*flat)
+
+    def unpackEntries(self, msg, offset, n):
+        """Unpacks n (addr, cost) pairs starting at offset"""
+        flat = self.entryStruct(n).unpack_from(msg, offset)
+        return zip(map(self.addrs.__getitem__, flat[0::2]), flat[1::2])
+
+    def encodeDV(self, addr, version, ack, full, dv):
+        return (self.DV_HEADER.pack(self.ids[addr], version, ack, full,
+                                    len(dv)) +
+                self.packEntries(dv.keys(), dv.values()))
+
+    def decodeDV(self, msg):
+        addrId, version, ack, full, n = self.DV_HEADER.unpack_from(msg)
+        entries = self.unpackEntries(msg, self.DV_HEADER.size, n)
+        return self.addrs[addrId], version, ack, bool(full), dict(entries)
+
+    def encodeLS(self, sourceAddr, packetId, lsNeighbors):
+        return (self.LS_HEADER.pack(self.ids[sourceAddr], packetId,
+                                    len(lsNeighbors)) +
+                self.packEntries([addr for addr, _ in lsNeighbors],
+                                 [cost for _, cost in lsNeighbors]))
+
+    def decodeLS(self, msg):
+        sourceId, packetId, n = self.LS_HEADER.unpack_from(msg)
+        entries = self.unpackEntries(msg, self.LS_HEADER.size, n)
+        return self.addrs[sourceId], packetId, entries
+
+    def encodePV(self, addr, version, ack, routes):
+        parts = [self.PV_HEADER.pack(self.ids[addr], version, ack,
+                                     len(routes))]
+        for dst, route in routes.iteritems():
+            if route is None:
+                parts.append(self.PV_ROUTE.pack(self.ids[dst], 0,
+                                                self.WITHDRAWN))
+                continue
+            cost, path = route
+            parts.append(self.PV_ROUTE.pack(self.ids[dst], cost, len(path)))
+            parts.append(struct.pack("!%dH" % len(path),
+                                     *map(self.ids.__getitem__, path)))
+        return "".join(parts)
+
+    def decodePV(self, msg):
+        addrId, version, ack, n = self.PV_HEADER.unpack_from(msg)
+        offset = self.PV_HEADER.size
+        routes = {}
+        for _ in xrange(n):
+            dstId, cost, length = self.PV_ROUTE.unpack_from(msg, offset)
+            offset += self.PV_ROUTE.size
+            if length == self.WITHDRAWN:
+                routes[self.addrs[dstId]] = None
+                continue
+            path = struct.unpack_from("!%dH" % length, msg, offset)
+            offset += 2 * length
+            routes[self.addrs[dstId]] = (
+                cost, tuple(map(self.addrs.__getitem__, path)))
+        return self.addrs[addrId], version, ack, routes
@@ -0,0 +1,69 @@
+class FlapDamper:
+    """Route flap damping (RFC 2439) for a router's links.
+
+       Each time a link goes down its penalty grows by PENALTY, and the
+       penalty decays exponentially, halving every half_life.  A link whose
+       penalty exceeds SUPPRESS is suppressed: when it comes back up the
+       router keeps treating it as down, so its flaps stop setting off
+       updates across the network, until the penalty has decayed below
+       REUSE.  Penalties are capped so that no link stays suppressed longer
+       than max_suppress after its last flap.  Links are keyed by the
+       neighbor's address.
+
+       Like UpdatePacer, the damper only knows the time of the latest tick
+       (handleTime)."""
+
+    PENALTY = 1000
+    SUPPRESS = 2000
+    REUSE = 750
+
+    def __init__(self, half_life, max_suppress):
+        """Times are in milliseconds"""
+        self.half_life = half_life
+        self.ceiling = self.REUSE * 2 ** (float(max_suppress) / half_life)
+        self.now = 0
+        # Penalty of each link that flapped recently, as of when it was
+        # last updated
+        # : Dict[Addr, Tuple[float, int]]
+        self.penalties = {}
+        # : Set[Addr]
+        self.suppressed = set()
+        # Flaps recorded, and the times a link got suppressed
+        self.flaps = 0
+        self.suppressions = 0
+
+    def penalty(self, key):
+        """Returns key's penalty, decayed to now"""
+        if key not in self.penalties:
+            return 0.0
+        penalty, since = self.penalties[key]
+        return penalty * 0.5 ** (float(self.now - since) / self.half_life)
+
+    def flap(self, key):
+        """Records that key's link went down"""
+        self.flaps += 1
+        penalty = min(self.penalty(key) + self.PENALTY, self.ceiling)
+        self.penalties[key] = (penalty, self.now)
+        if penalty > self.SUPPRESS and key not in self.suppressed:
+            self.suppressed.add(key)
+            self.suppressions += 1
+
+    def is_suppressed(self, key):
+        """Returns whether key's link should be treated as down"""
+        return key in self.suppressed
+
+    def tick(self, now):
+        """Advances the clock to now.  Returns the keys whose suppression
+           ended"""
+        self.now = now
+        reused = []
+        for key in self.penalties.keys():
+            penalty = self.penalty(key)
+            if key in self.suppressed:
+                if penalty < self.REUSE:
+                    self.suppressed.remove(key)
+                    reused.append(key)
+            elif penalty < self.REUSE / 2:
+                # Small enough to forget
+                del self.penalties[key]
+        return reused
@@ -0,0 +1,89 @@
+import heapq
+import time
+
+
+class EventScheduler:
+    """Discrete-event scheduler driven by a virtual clock.
+       Events are (time, callback, args) entries kept in a heap and run in
+       time order; events scheduled for the same time run in the order they
+       were scheduled.  Time is in milliseconds, like the threaded simulator"""
+
+    def __init__(self, startTime=0):
+        """Create an empty event heap with the clock set to startTime"""
+        self.currentTime = startTime
+        self.events = []
+        self.counter = 0
+
+
+    def now(self):
+        """Returns the current virtual time in milliseconds"""
+        return self.currentTime
+
+
+    def schedule(self, delay, callback, *args):
+        """Run callback(*args) delay milliseconds from now"""
+        self.scheduleAt(self.currentTime + delay, callback, *args)
+
+
+    def scheduleAt(self, eventTime, callback, *args):
+        """Run callback(*args) at virtual time eventTime.  Events in the
+           past are run at the current time instead"""
+        eventTime = max(eventTime, self.currentTime)
+        heapq.heappush(self.events, (eventTime, self.counter, callback, args))
+        self.counter += 1
+
+
+    def schedulePeriodic(self, period, callback, *args):
+        """Run callback(*args) every period milliseconds, starting one
+           period from now"""
+        def fire():
+            callback(*args)
+            self.schedule(period, fire)
+        self.schedule(period, fire)
+
+
+    def runUntil(self, endTime):
+        """Run all events scheduled up to and including endTime, then
+           advance the clock to endTime"""
+        while self.events and self.events[0][0] <= endTime:
+            eventTime, _, callback, args = heapq.heappop(self.events)
+            self.currentTime = eventTime
+            callback(*args)
+        self.currentTime = max(self.currentTime, endTime)
+
+
+    def runBefore(self, endTime):
+        """Run all events scheduled before endTime, leaving the clock at the
+           last one run.  Events at endTime stay queued, so others can still
+           be scheduled for it"""
+        while self.events and self.events[0][0] < endTime:
+            eventTime, _, callback, args = heapq.heappop(self.events)
+            self.currentTime = eventTime
+            callback(*args)
+
+
+    def pending(self):
+        """Returns the number of events waiting to run"""
+        return len(self.events)
+
+
+class RealTimeEventLoop(EventScheduler):
+    """EventScheduler whose clock follows wall-clock time.  runUntil sleeps
+       until each event is due before running it, so the scheduled callbacks
+       run in real time, one at a time, on the calling thread"""
+
+    def runUntil(self, endTime):
+        """Run all events scheduled up to and including endTime as each
+           comes due, then wait until endTime"""
+        origin = time.time()*1000 - self.currentTime
+        while self.events and self.events[0][0] <= endTime:
+            waitTime = origin + self.events[0][0] - time.time()*1000
+            if waitTime > 0:
+                time.sleep(waitTime/float(1000))
+            eventTime, _, callback, args = heapq.heappop(self.events)
+            self.currentTime = eventTime
+            callback(*args)
+        waitTime = origin + endTime - time.time()*1000
+        if waitTime > 0:
+            time.sleep(waitTime/float(1000))
+        self.currentTime = max(self.currentTime, endTime)
@@ -11,10 +11,16 @@ class Link:
        handles sending and receiving packets using
        threadsafe queues"""
 
-    def __init__(self, e1, e2, l12, l21, latency):
+    def __init__(self, e1, e2, l12, l21, latency, scheduler=None,
+                 metrics=None):
         """Create queues. e1 & e2 are addresses of the 2 endpoints of
            the link. l12 and l21 are the latencies (in ms) in the
-           e1->e2 and e2->e1 directions, respectively"""
+           e1->e2 and e2->e1 directions, respectively.  If scheduler is
+           given (a scheduler.DelayScheduler, or an eventsim.EventScheduler
+           for virtual time), packets are delivered by callbacks scheduled on
+           it instead of by a sleeping thread per packet.  If metrics (a
+           metrics.Metrics) is given, routing packets and traceroutes sent are
+           counted in it"""
         self.q12 = Queue.Queue()
         self.q21 = Queue.Queue()
         self.l12 = l12*latency
@@ -22,6 +28,11 @@ class Link:
         self.latencyMultiplier = latency
         self.e1 = e1
         self.e2 = e2
+        self.scheduler = scheduler
+        self.metrics = metrics
+        # callbacks that take arriving packets instead of q12/q21,
+        # indexed by receiving endpoint
+        self.receivers = {}
 
 
     def send_helper(self, packet, src):
@@ -31,12 +42,12 @@ class Link:
             packet.addToRoute(self.e2)
             packet.animateSend(self.e1, self.e2, self.l12)
             time.sleep(self.l12/float(1000))
-            self.q12.put(packet)
+            self.deliver(packet, self.e2)
         elif src == self.e2:
             packet.addToRoute(self.e1)
             packet.animateSend(self.e2, self.e1, self.l21)
             time.sleep(self.l21/float(1000))
-            self.q21.put(packet)
+            self.deliver(packet, self.e1)
         sys.stdout.flush()
 
 
@@ -47,7 +58,50 @@ class Link:
         if packet.content:
             assert type(packet.content) is StringType, "Packet content must be a string"
         p = packet.copy()
-        thread.start_new_thread(self.send_helper, (p, src))
+        if self.metrics is not None:
+            self.metrics.countSend(self, src, p)
+        if self.scheduler is not None:
+            self.schedule_send(p, src)
+        else:
+            thread.start_new_thread(self.send_helper, (p, src))
+
+
+    def schedule_send(self, packet, src):
+        """Sends packet on link FROM src by scheduling its arrival on the
+           scheduler after the appropriate latency"""
+        if src == self.e1:
+            packet.addToRoute(self.e2)
+            packet.animateSend(self.e1, self.e2, self.l12)
+            self.scheduler.schedule(self.l12, self.deliver, packet, self.e2)
+        elif src == self.e2:
+            packet.addToRoute(self.e1)
+            packet.animateSend(self.e2, self.e1, self.l21)
+            self.scheduler.schedule(self.l21, self.deliver, packet, self.e1)
+
+
+    def deliver(self, packet, dst):
+        """Hands an arriving packet to dst's receiver callback if it set one,
+           else queues it to be picked up by recv"""
+        receiver = self.receivers.get(dst)
+        if receiver:
+            receiver(packet)
+            return
+        # nobody picks up packets after the link is taken down
+        if self.metrics is not None and packet.isTraceroute():
+            self.metrics.countDrop()
+        if dst == self.e2:
+            self.q12.put(packet)
+        elif dst == self.e1:
+            self.q21.put(packet)
+
+
+    def setReceiver(self, dst, receiver):
+        """Have packets arriving at dst passed to receiver(packet) as soon
+           as they arrive.  A receiver of None goes back to queueing them"""
+        if receiver:
+            self.receivers[dst] = receiver
+        else:
+            self.receivers.pop(dst, None)
 
 
     def recv(self, dst, timeout=None):
@@ -0,0 +1,661 @@
+import heapq
+import sys
+import threading
+import weakref
+from array import array
+from itertools import izip
+
+
+"""
+Compact link state database for LSrouter.
+
+Addresses are numbered once per process (node_id), so everything a router
+keeps per node is a flat array indexed by node id rather than a dict:
+
+- Rows: a node's outgoing edges are two arrays, neighbor ids and costs (one
+  row of a compressed sparse row adjacency). Rows are never modified; a
+  change replaces the whole row.
+- Lsa: an LSA decoded into its origin's row. LSAs are interned by content
+  (intern_lsa), so every router in the process that accepts the same flooded
+  LSA shares one Lsa and its row instead of decoding its own copy.
+- LinkStateDb: one router's latest Lsa, sequence number, and arrival
+  heartbeat for each origin.
+- CompactSpt: shortest paths from one router over node ids, for LSrouter
+  and HLSrouter. Its graph is the rows it is given, shared with the
+  database, and its tree is kept in arrays: distance, parent, next hop, and
+  first child / sibling links. It also finds loop-free alternate next hops
+  (RFC 5286) for fast reroute, and every equal-cost next hop for multipath
+  forwarding, kept up to date incrementally like the tree once they're
+  first asked for.
+
+Row changes repair only the part of the tree they affect instead of
+rerunning Dijkstra over the whole graph. An edge that gets cheaper (or is
+added) can only shorten paths, so a Dijkstra search runs outward from its
+head, relaxing only nodes whose distance drops. A tree edge that gets more
+expensive (or is removed) detaches the subtree below it; each detached node
+is seeded with its best distance through a node still in the tree, and a
+Dijkstra search settles them again. Each change returns the nodes whose
+next hop changed (or that became unreachable), so callers can patch a
+forwarding table in place.
+
+Node ids differ between processes, so the database and the tree pickle by
+address and rebuild their arrays when unpickled. The numbering and the
+interned LSAs are shared by every router thread in the process, so both are
+added to under a lock.
+"""
+
+
+# Every address seen in this process, numbered in order of appearance
+_ids = {}
+_addrs = []
+# Held while numbering an address or interning an Lsa. Lookups of ones
+# already there don't take it
+_lock = threading.Lock()
+
+
+def node_id(addr):
+    """Returns addr's node id, numbering it if it's new"""
+    i = _ids.get(addr)
+    if i is None:
+        with _lock:
+            i = _ids.get(addr)
+            if i is None:
+                # listed before it's looked up by address, so node_addr
+                # works for any id another thread can see
+                _addrs.append(addr)
+                i = _ids[addr] = len(_addrs) - 1
+    return i
+
+
+def node_addr(i):
+    """Returns the address numbered i"""
+    return _addrs[i]
+
+
+class Row(object):
+    """A node's outgoing edges, sorted by neighbor id. Never modified"""
+
+    __slots__ = ("nodes", "costs")
+
+    def __init__(self, edges):
+        """edges: (node id, cost) pairs"""
+        edges = sorted(edges)
+        self.nodes = array("i", [node for node, _ in edges])
+        self.costs = array("l", [cost for _, cost in edges])
+
+    def cost(self, node):
+        """Returns the cost of the edge to node, or None"""
+        try:
+            return self.costs[self.nodes.index(node)]
+        except ValueError:
+            return None
+
+    def edges(self):
+        """Returns a {node id: cost} dict"""
+        return dict(izip(self.nodes, self.costs))
+
+    def same_edges(self, other):
+        return self.nodes == other.nodes and self.costs == other.costs
+
+    def __reduce__(self):
+        return (_restore_row, ([(node_addr(node), cost) for node, cost
+                                in izip(self.nodes, self.costs)],))
+
+
+def _restore_row(edges):
+    return Row((node_id(addr), cost) for addr, cost in edges)
+
+
+class Lsa(Row):
+    """An LSA's origin, packet id and content, and the origin's row of
+       neighbors advertised with a cost below INF"""
+
+    __slots__ = ("codec", "content", "origin", "packet_id", "__weakref__")
+
+    def __init__(self, codec, content, origin, packet_id, edges):
+        Row.__init__(self, edges)
+        # Kept so the codec's id in the intern key can't be reused
+        self.codec = codec
+        self.content = content
+        self.origin = origin
+        self.packet_id = packet_id
+
+    def __reduce__(self):
+        return (_restore_lsa, (
+            self.content, node_addr(self.origin), self.packet_id,
+            [(node_addr(node), cost) for node, cost
+             in izip(self.nodes, self.costs)]))
+
+
+# Lsas by (id(codec), content). The same bytes can mean different
+# addresses to different StructCodecs
+_interned = weakref.WeakValueDictionary()
+
+
+def intern_lsa(codec, content, inf):
+    """Returns the Lsa for an LSA encoded by codec, decoding it only if no
+       router in this process holds it. Neighbors at cost inf or more are
+       withdrawn and left out of the row"""
+    key = (id(codec), content)
+    lsa = _interned.get(key)
+    if lsa is None:
+        origin, packet_id, ls_neighbors = codec.decodeLS(content)
+        lsa = _intern(key, Lsa(codec, content, node_id(origin), packet_id,
+                               [(node_id(addr), cost) for addr, cost
+                                in ls_neighbors if cost < inf]))
+    return lsa
+
+
+def _restore_lsa(content, origin, packet_id, edges):
+    """Unpickles an Lsa. Codecs don't pickle, so restored Lsas are interned
+       apart from ones decoded since"""
+    key = (id(None), content)
+    lsa = _interned.get(key)
+    if lsa is None:
+        lsa = _intern(key, Lsa(None, content, node_id(origin), packet_id,
+                               [(node_id(addr), cost)
+                                for addr, cost in edges]))
+    return lsa
+
+
+def _intern(key, lsa):
+    """Interns lsa under key, or returns the Lsa another thread interned
+       there while lsa was being decoded"""
+    with _lock:
+        interned = _interned.get(key)
+        if interned is None:
+            _interned[key] = interned = lsa
+    return interned
+
+
+class LinkStateDb:
+    """One router's link state database: the latest Lsa accepted from each
+       origin, with its packet id and the heartbeat count when it arrived,
+       in arrays indexed by origin id"""
+
+    def __init__(self):
+        # : List[Optional[Lsa]]
+        self.lsas = []
+        # -1 where there is no Lsa
+        self.seqs = array("l")
+        self.heard = array("l")
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def __grow(self, i):
+        missing = i + 1 - len(self.lsas)
+        if missing > 0:
+            self.lsas.extend([None] * missing)
+            self.seqs.extend([-1] * missing)
+            self.heard.extend([-1] * missing)
+
+    def get(self, origin):
+        """Returns origin's Lsa, or None"""
+        return self.lsas[origin] if origin < len(self.lsas) else None
+
+    def seq(self, origin):
+        """Returns the packet id of origin's Lsa, or -1"""
+        return self.seqs[origin] if origin < len(self.seqs) else -1
+
+    def put(self, lsa, heartbeat):
+        """Stores lsa as its origin's latest"""
+        self.__grow(lsa.origin)
+        if self.lsas[lsa.origin] is None:
+            self.count += 1
+        self.lsas[lsa.origin] = lsa
+        self.seqs[lsa.origin] = lsa.packet_id
+        self.heard[lsa.origin] = heartbeat
+
+    def remove(self, origin):
+        if self.get(origin) is not None:
+            self.count -= 1
+            self.lsas[origin] = None
+            self.seqs[origin] = -1
+            self.heard[origin] = -1
+
+    def values(self):
+        """Returns the stored Lsas"""
+        return [lsa for lsa in self.lsas if lsa is not None]
+
+    def older_than(self, heartbeat):
+        """Returns the origins whose Lsa arrived before heartbeat"""
+        return [origin for origin, lsa in enumerate(self.lsas)
+                if lsa is not None and self.heard[origin] < heartbeat]
+
+    def __getstate__(self):
+        return [(lsa, self.heard[lsa.origin]) for lsa in self.values()]
+
+    def __setstate__(self, state):
+        self.__init__()
+        for lsa, heartbeat in state:
+            self.put(lsa, heartbeat)
+
+
+# Distance of nodes outside the tree
+UNREACHABLE = sys.maxint
+
+
+class CompactSpt:
+    """Shortest paths from root over rows of node ids that change one row at
+       a time, repairing the tree incrementally"""
+
+    def __init__(self, root):
+        """root: the address every path starts from"""
+        self.root = node_id(root)
+        # : List[Optional[Row]], by node id
+        self.rows = []
+        # Each node's predecessors, None if it has none
+        # : List[Optional[array]]
+        self.preds = []
+        # Shortest path tree, UNREACHABLE or -1 for nodes outside it
+        self.dist = array("l")
+        self.parent = array("i")
+        self.next_hop = array("i")
+        self.first_child = array("i")
+        self.next_sibling = array("i")
+        self.prev_sibling = array("i")
+        # Loop-free alternate of each node, None until asked for after the
+        # graph changes
+        self.lfa = None
+        # Every equal-cost next hop of each node, None until first asked
+        # for. From then on the nodes whose distance changed, and the ones
+        # with an incoming edge that changed, are noted for the next update
+        self.ecmp = None
+        self.moved = set()
+        self.retied = set()
+        self.__grow()
+        self.dist[self.root] = 0
+
+    def __grow(self):
+        """Makes room for every node id numbered so far"""
+        missing = len(_addrs) - len(self.rows)
+        if missing <= 0:
+            return
+        self.rows.extend([None] * missing)
+        self.preds.extend([None] * missing)
+        self.dist.extend([UNREACHABLE] * missing)
+        if self.ecmp is not None:
+            self.ecmp.extend([()] * missing)
+        for a in (self.parent, self.next_hop, self.first_child,
+                  self.next_sibling, self.prev_sibling):
+            a.extend([-1] * missing)
+
+    def edge_cost(self, u, v):
+        """Returns the cost of the edge u -> v, or None"""
+        row = self.rows[u] if u < len(self.rows) else None
+        return None if row is None else row.cost(v)
+
+    def out_edges(self, u):
+        """Returns a {node: cost} dict of u's outgoing edges"""
+        row = self.rows[u] if u < len(self.rows) else None
+        return {} if row is None else row.edges()
+
+    def distances(self):
+        """Returns a {addr: distance} dict of the reachable nodes"""
+        return {node_addr(node): d for node, d in enumerate(self.dist)
+                if d != UNREACHABLE}
+
+    def set_edge(self, u, v, cost):
+        """
+        Adds the edge u -> v or changes its cost, copying u's row. Returns
+        the set of nodes whose next hop changed.
+        """
+        self.__grow()
+        edges = self.rows[u].edges() if self.rows[u] is not None else {}
+        if edges.get(v) == cost:
+            return set()
+        edges[v] = cost
+        return self.set_row(u, Row(edges.iteritems()))
+
+    def remove_edge(self, u, v):
+        """
+        Removes the edge u -> v if present, copying u's row. Returns the set
+        of nodes whose next hop changed.
+        """
+        if self.edge_cost(u, v) is None:
+            return set()
+        edges = self.rows[u].edges()
+        del edges[v]
+        return self.set_row(u, Row(edges.iteritems()))
+
+    def set_row(self, u, row):
+        """
+        Replaces u's outgoing edges with row, or removes them if row is
+        None. Returns the set of nodes whose next hop changed.
+        """
+        return self.set_rows({u: row})
+
+    def set_rows(self, rows):
+        """
+        Replaces the outgoing edges of every node in the {node: row} dict
+        rows at once, removing them where the row is None, and repairs the
+        tree in one pass. Returns the set of nodes whose next hop changed.
+        """
+        self.__grow()
+        self.lfa = None
+        worse = []
+        better = []
+        for u, row in rows.iteritems():
+            old = self.rows[u]
+            old_edges = {} if old is None else old.edges()
+            new_edges = {} if row is None else row.edges()
+            self.rows[u] = row
+            for v, cost in old_edges.iteritems():
+                if v not in new_edges:
+                    preds = self.preds[v]
+                    preds.remove(u)
+                    if not preds:
+                        self.preds[v] = None
+                if new_edges.get(v, UNREACHABLE) > cost:
+                    worse.append((u, v))
+            for v, cost in new_edges.iteritems():
+                if v not in old_edges:
+                    if self.preds[v] is None:
+                        self.preds[v] = array("i")
+                    self.preds[v].append(u)
+                if cost < old_edges.get(v, UNREACHABLE):
+                    better.append((u, v, cost))
+            if self.ecmp is not None:
+                self.retied.update(v for v in set(old_edges) | set(new_edges)
+                                   if old_edges.get(v) != new_edges.get(v))
+        # Worse edges first: the tree stays an upper bound on distances
+        # that the cheaper edges then shorten
+        changed = set()
+        for u, v in worse:
+            changed |= self.__increase(u, v)
+        for u, v, cost in better:
+            changed |= self.__decrease(u, v, cost)
+        return changed
+
+    def distances_from(self, source):
+        """Returns an array of every node's distance from source, by a full
+           Dijkstra over the rows"""
+        dist = array("l", [UNREACHABLE]) * len(self.rows)
+        dist[source] = 0
+        heap = [(0, source)]
+        while heap:
+            d, node = heapq.heappop(heap)
+            if d > dist[node]:
+                continue
+            row = self.rows[node]
+            if row is None:
+                continue
+            for nxt, cost in izip(row.nodes, row.costs):
+                if d + cost < dist[nxt]:
+                    dist[nxt] = d + cost
+                    heapq.heappush(heap, (d + cost, nxt))
+        return dist
+
+    def alternates(self):
+        """
+        Returns an array of each node's loop-free alternate: the root's
+        neighbor, other than the node's next hop, with the cheapest path to
+        the node among those whose shortest path there doesn't lead back
+        through the root (dist(N, D) < dist(N, root) + dist(root, D)), or -1.
+        Such a neighbor's path survives the loss of the next hop's link, so
+        the root can send to it before anyone else has heard of the failure
+        without looping. Computed with a Dijkstra per neighbor on the first
+        call after the graph changes.
+        """
+        if self.lfa is not None:
+            return self.lfa
+        self.__grow()
+        n = len(self.rows)
+        lfa = array("i", [-1]) * n
+        own = self.rows[self.root]
+        if own is not None:
+            best = array("l", [UNREACHABLE]) * n
+            for nb, cost in izip(own.nodes, own.costs):
+                dist_nb = self.distances_from(nb)
+                back = dist_nb[self.root]
+                for node in xrange(n):
+                    d = dist_nb[node]
+                    if (d == UNREACHABLE or self.next_hop[node] in (-1, nb)
+                            or d >= back + self.dist[node]
+                            or cost + d >= best[node]):
+                        continue
+                    best[node] = cost + d
+                    lfa[node] = nb
+        self.lfa = lfa
+        return lfa
+
+    def equal_cost_hops(self):
+        """
+        Returns a list of each node's next hops on all of its shortest
+        paths, as a sorted tuple (empty for the root and unreachable
+        nodes).
+        """
+        self.update_equal_cost_hops()
+        return self.ecmp
+
+    def update_equal_cost_hops(self):
+        """
+        Brings the equal-cost next hops up to date. Returns the nodes whose
+        hops changed since the last call, or every node on the first call,
+        which computes them all in one pass over the edges in distance
+        order. After that, only nodes whose distance or incoming edges
+        changed are recomputed from their predecessors, in distance order,
+        and the change spreads on to their successors only where a node's
+        distance or hops did change.
+        """
+        self.__grow()
+        if self.ecmp is None:
+            self.__compute_ecmp()
+            return set(xrange(len(self.rows)))
+        dist = self.dist
+        ecmp = self.ecmp
+        moved = self.moved
+        queued = moved | self.retied
+        heap = [(dist[node], node) for node in queued]
+        heapq.heapify(heap)
+        self.moved = set()
+        self.retied = set()
+        changed = set()
+        while heap:
+            _, node = heapq.heappop(heap)
+            queued.discard(node)
+            hops = self.__equal_cost_hops(node)
+            if hops != ecmp[node]:
+                ecmp[node] = hops
+                changed.add(node)
+            elif node not in moved:
+                continue
+            moved.discard(node)
+            row = self.rows[node]
+            if row is None:
+                continue
+            # A successor can be closer than a node whose distance grew, so
+            # it may come up again if one of its predecessors changes later
+            for nxt in row.nodes:
+                if nxt not in queued and dist[nxt] != UNREACHABLE:
+                    queued.add(nxt)
+                    heapq.heappush(heap, (dist[nxt], nxt))
+        return changed
+
+    def __equal_cost_hops(self, node):
+        """Returns node's equal-cost next hops from those of its
+           predecessors on a shortest path, which must be up to date"""
+        d = self.dist[node]
+        if d == UNREACHABLE or node == self.root:
+            return ()
+        hops = ()
+        for p in self.preds[node] or ():
+            if (self.dist[p] == UNREACHABLE or
+                    self.dist[p] + self.rows[p].cost(node) != d):
+                continue
+            more = (node,) if p == self.root else self.ecmp[p]
+            # usually there's one such predecessor
+            if not hops:
+                hops = more
+            elif more != hops:
+                hops = tuple(sorted(set(hops).union(more)))
+        return hops
+
+    def __compute_ecmp(self):
+        """Computes every node's equal-cost next hops from scratch"""
+        self.moved = set()
+        self.retied = set()
+        hops = [()] * len(self.rows)
+        reached = sorted((d, node) for node, d in enumerate(self.dist)
+                         if d != UNREACHABLE)
+        for d, node in reached:
+            row = self.rows[node]
+            if row is None:
+                continue
+            for nxt, cost in izip(row.nodes, row.costs):
+                if d + cost != self.dist[nxt]:
+                    continue
+                if node == self.root:
+                    hops[nxt] = (nxt,)
+                elif not hops[nxt]:
+                    hops[nxt] = hops[node]
+                else:
+                    hops[nxt] = tuple(sorted(set(hops[nxt] + hops[node])))
+        self.ecmp = hops
+
+    def __decrease(self, u, v, cost):
+        """Repairs the tree after the edge u -> v got cheaper"""
+        if self.dist[u] == UNREACHABLE:
+            return set()
+        new_dist = self.dist[u] + cost
+        if new_dist >= self.dist[v]:
+            return set()
+        self.__attach(v, u, new_dist)
+        changed = set()
+        self.__settle([(new_dist, v)], changed)
+        return changed
+
+    def __increase(self, u, v):
+        """Repairs the tree after the edge u -> v got more expensive"""
+        if self.parent[v] != u:
+            return set()
+        # Detach the subtree below v
+        self.__unlink(v)
+        detached = []
+        stack = [v]
+        while stack:
+            node = stack.pop()
+            detached.append(node)
+            child = self.first_child[node]
+            while child != -1:
+                stack.append(child)
+                child = self.next_sibling[child]
+        old_hops = {node: self.next_hop[node] for node in detached}
+        if self.ecmp is not None:
+            self.moved.update(detached)
+        for node in detached:
+            self.dist[node] = UNREACHABLE
+            self.parent[node] = -1
+            self.next_hop[node] = -1
+            self.first_child[node] = -1
+            self.next_sibling[node] = -1
+            self.prev_sibling[node] = -1
+        # Seed each detached node with its best path through the tree
+        heap = []
+        for node in detached:
+            best = None
+            for p in self.preds[node] or ():
+                if self.dist[p] == UNREACHABLE:
+                    continue
+                d = self.dist[p] + self.rows[p].cost(node)
+                if best is None or d < best[0]:
+                    best = (d, p)
+            if best is not None:
+                self.__attach(node, best[1], best[0])
+                heap.append((best[0], node))
+        heapq.heapify(heap)
+        settled = set()
+        self.__settle(heap, settled)
+        # Detached nodes left out of the tree are unreachable. Nodes still in
+        # the tree can only have moved through edges of a new row that got
+        # cheaper
+        return {node for node in detached
+                if self.next_hop[node] != old_hops[node]} | (
+            settled.difference(old_hops))
+
+    def __settle(self, heap, changed):
+        """
+        Runs Dijkstra from the (dist, node) entries in heap, relaxing only
+        edges that shorten a path. Nodes are settled in distance order, so a
+        node's parent has its final next hop before the node takes it.
+        """
+        dist = self.dist
+        while heap:
+            d, node = heapq.heappop(heap)
+            if d > dist[node]:
+                continue
+            parent = self.parent[node]
+            hop = node if parent == self.root else self.next_hop[parent]
+            if self.next_hop[node] != hop:
+                self.next_hop[node] = hop
+                changed.add(node)
+            row = self.rows[node]
+            if row is None:
+                continue
+            for nxt, cost in izip(row.nodes, row.costs):
+                if d + cost < dist[nxt]:
+                    self.__attach(nxt, node, d + cost)
+                    heapq.heappush(heap, (d + cost, nxt))
+                elif self.parent[nxt] == node:
+                    # Unchanged distance, but the next hop may follow ours
+                    if self.next_hop[nxt] != hop:
+                        heapq.heappush(heap, (dist[nxt], nxt))
+
+    def __attach(self, node, parent, d):
+        """Makes parent the tree parent of node at distance d"""
+        if self.parent[node] != -1:
+            self.__unlink(node)
+        self.parent[node] = parent
+        first = self.first_child[parent]
+        self.next_sibling[node] = first
+        if first != -1:
+            self.prev_sibling[first] = node
+        self.first_child[parent] = node
+        if self.ecmp is not None and self.dist[node] != d:
+            self.moved.add(node)
+        self.dist[node] = d
+
+    def __unlink(self, node):
+        """Removes node from its parent's children"""
+        prev = self.prev_sibling[node]
+        nxt = self.next_sibling[node]
+        if prev != -1:
+            self.next_sibling[prev] = nxt
+        else:
+            self.first_child[self.parent[node]] = nxt
+        if nxt != -1:
+            self.prev_sibling[nxt] = prev
+        self.prev_sibling[node] = -1
+        self.next_sibling[node] = -1
+        self.parent[node] = -1
+
+    def __getstate__(self):
+        """Rows and tree parents by address, so the same tree is restored
+           and callers' forwarding state still matches it"""
+        return (node_addr(self.root),
+                [(node_addr(node), row) for node, row in enumerate(self.rows)
+                 if row is not None],
+                [(node_addr(node), node_addr(parent), self.dist[node])
+                 for node, parent in enumerate(self.parent) if parent != -1])
+
+    def __setstate__(self, state):
+        root, rows, tree = state
+        self.__init__(root)
+        for addr, row in rows:
+            u = node_id(addr)
+            self.__grow()
+            self.rows[u] = row
+            for v in row.nodes:
+                if self.preds[v] is None:
+                    self.preds[v] = array("i")
+                self.preds[v].append(u)
+        self.__grow()
+        # Parents are closer to the root, so they get their next hop first
+        for d, addr, parent_addr in sorted((d, addr, parent_addr)
+                                           for addr, parent_addr, d in tree):
+            node, parent = node_id(addr), node_id(parent_addr)
+            self.__attach(node, parent, d)
+            self.next_hop[node] = (node if parent == self.root
+                                   else self.next_hop[parent])
@@ -0,0 +1,218 @@
+import csv
+import json
+import threading
+from collections import defaultdict
+
+
+class Metrics:
+    """Convergence and overhead measurements for one network run.
+
+       Network timestamps every link change here and reports every
+       traceroute result, links count the routing packets and traceroutes
+       they carry (the traceroutes show how multipath forwarding spreads
+       load; walked routes in oracle mode aren't counted), and routers
+       time their handlePacket and handleTime calls.  Times are in
+       milliseconds from when the Metrics was created, on the network's
+       clock (virtual or real).
+
+       The network counts as converged once every (src, dst) pair in
+       correctRoutes has had a correct traceroute arrive, and no incorrect
+       one, since the latest link change.  Detection is only as fine as
+       the traceroute interval, and a traceroute already in flight when a
+       link changes can count toward the next convergence.  Traceroutes
+       dropped (no route, or sent on a link that went down), and ones that
+       arrive after visiting a node twice (in oracle mode, walked routes
+       that loop), are counted against the latest change."""
+
+    def __init__(self, clock, pairs):
+        """clock returns the current time in milliseconds.  pairs are the
+           (src, dst) client pairs whose routes must be correct"""
+        self.clock = clock
+        self.origin = clock()
+        self.lock = threading.Lock()
+        self.routerPackets = defaultdict(int)
+        self.routerBytes = defaultdict(int)
+        self.linkPackets = defaultdict(int)
+        self.linkBytes = defaultdict(int)
+        self.linkTraceroutes = defaultdict(int)
+        # routing updates each router asked to send, and ones it sent
+        self.updateRequests = defaultdict(int)
+        self.updatesSent = defaultdict(int)
+        # indexed by (addr, handler name)
+        self.handlerCalls = defaultdict(int)
+        self.handlerSeconds = defaultdict(float)
+        # the start of the run counts as the first change
+        self.changes = [{"timeMs": 0, "change": "start", "link": None,
+                         "convergedMs": None, "dropped": 0,
+                         "looped": 0}]
+        self.pairs = set(pairs)
+        self.satisfied = set()
+
+
+    def now(self):
+        return self.clock() - self.origin
+
+
+    def markStart(self, change):
+        """Start measuring over from now, as a run resumed from a snapshot
+           does, with change naming the new start"""
+        with self.lock:
+            self.changes = [{"timeMs": self.now(), "change": change,
+                             "link": None, "convergedMs": None,
+                             "dropped": 0, "looped": 0}]
+            self.satisfied = set()
+
+
+    def countSend(self, link, src, packet):
+        """Count a routing packet or traceroute sent by src on link"""
+        linkName = "{}-{}".format(link.e1, link.e2)
+        if packet.isTraceroute():
+            with self.lock:
+                self.linkTraceroutes[linkName] += 1
+            return
+        if not packet.isRouting():
+            return
+        size = len(packet.content) if packet.content else 0
+        with self.lock:
+            self.routerPackets[src] += 1
+            self.routerBytes[src] += size
+            self.linkPackets[linkName] += 1
+            self.linkBytes[linkName] += size
+
+
+    def countUpdates(self, addr, requests, sent):
+        """Count routing updates a router asked to send and ones it sent.
+           Requests its update pacing coalesced are saved updates"""
+        with self.lock:
+            self.updateRequests[addr] += requests
+            self.updatesSent[addr] += sent
+
+
+    def recordHandler(self, addr, name, seconds):
+        """Add one call of a router's handler that took seconds"""
+        with self.lock:
+            self.handlerCalls[(addr, name)] += 1
+            self.handlerSeconds[(addr, name)] += seconds
+
+
+    def countDrop(self):
+        """Count a traceroute dropped since the latest change"""
+        with self.lock:
+            self.changes[-1]["dropped"] += 1
+
+
+    def recordChange(self, change, target):
+        """Timestamp a link going up or down"""
+        with self.lock:
+            self.changes.append({"timeMs": self.now(), "change": change,
+                                 "link": list(target[:2]),
+                                 "convergedMs": None, "dropped": 0,
+                                 "looped": 0})
+            self.satisfied = set()
+
+
+    def recordRoute(self, src, dst, route, isGood):
+        """Note a traceroute result.  Empty routes (traceroutes just sent)
+           are ignored"""
+        if not route:
+            return
+        # a client's traceroute to itself ends where it started
+        if len(set(route[1:])) < len(route) - 1:
+            with self.lock:
+                self.changes[-1]["looped"] += 1
+        if (src, dst) not in self.pairs:
+            return
+        with self.lock:
+            if isGood:
+                self.satisfied.add((src, dst))
+            else:
+                self.satisfied.discard((src, dst))
+            if len(self.satisfied) == len(self.pairs):
+                self.markConverged()
+
+
+    def markConverged(self):
+        """Set the convergence time of every change still waiting for it"""
+        timeMs = self.now()
+        for change in reversed(self.changes):
+            if change["convergedMs"] is not None:
+                break
+            change["convergedMs"] = timeMs - change["timeMs"]
+
+
+    def report(self):
+        """Returns every measurement as a dict of plain types"""
+        with self.lock:
+            routers = sorted(set(self.routerPackets) |
+                             set(self.updateRequests) |
+                             set(addr for addr, _ in self.handlerCalls))
+            handlers = {}
+            for (addr, name), calls in self.handlerCalls.iteritems():
+                handlers.setdefault(addr, {})[name] = {
+                    "calls": calls,
+                    "seconds": self.handlerSeconds[(addr, name)]}
+            return {
+                "changes": [dict(change) for change in self.changes],
+                "routers": {addr: {"packets": self.routerPackets[addr],
+                                   "bytes": self.routerBytes[addr],
+                                   "updateRequests": self.updateRequests[addr],
+                                   "updatesSent": self.updatesSent[addr],
+                                   "savedUpdates": self.updateRequests[addr] -
+                                       self.updatesSent[addr],
+                                   "handlers": handlers.get(addr, {})}
+                            for addr in routers},
+                "links": {name: {"packets": self.linkPackets[name],
+                                 "bytes": self.linkBytes[name],
+                                 "traceroutes": self.linkTraceroutes[name]}
+                          for name in set(self.linkPackets) |
+                          set(self.linkTraceroutes)},
+                "totals": {"packets": sum(self.routerPackets.values()),
+                           "bytes": sum(self.routerBytes.values()),
+                           "savedUpdates": sum(self.updateRequests.values()) -
+                               sum(self.updatesSent.values()),
+                           "handlerSeconds":
+                               sum(self.handlerSeconds.values()),
+                           "traceroutesDropped": sum(
+                               change["dropped"] for change in self.changes),
+                           "traceroutesLooped": sum(
+                               change["looped"] for change in self.changes)},
+            }
+
+
+    def writeReport(self, path):
+        """Write the report as json, or as csv if path ends in .csv"""
+        report = self.report()
+        if not path.endswith(".csv"):
+            with open(path, "w") as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+            return
+        with open(path, "wb") as f:
+            # one (section, name, metric, value) row per measurement
+            writer = csv.writer(f)
+            writer.writerow(["section", "name", "metric", "value"])
+            for i, change in enumerate(report["changes"]):
+                link = "-".join(change["link"]) if change["link"] else ""
+                writer.writerow(["change", i, "change",
+                                 "{} {}".format(change["change"], link).strip()])
+                writer.writerow(["change", i, "timeMs", change["timeMs"]])
+                writer.writerow(["change", i, "convergedMs",
+                                 change["convergedMs"]])
+                writer.writerow(["change", i, "dropped", change["dropped"]])
+                writer.writerow(["change", i, "looped", change["looped"]])
+            for addr, stats in sorted(report["routers"].items()):
+                writer.writerow(["router", addr, "packets", stats["packets"]])
+                writer.writerow(["router", addr, "bytes", stats["bytes"]])
+                for metric in ("updateRequests", "updatesSent", "savedUpdates"):
+                    writer.writerow(["router", addr, metric, stats[metric]])
+                for name, timing in sorted(stats["handlers"].items()):
+                    writer.writerow(["router", addr, name + "Calls",
+                                     timing["calls"]])
+                    writer.writerow(["router", addr, name + "Seconds",
+                                     timing["seconds"]])
+            for name, stats in sorted(report["links"].items()):
+                writer.writerow(["link", name, "packets", stats["packets"]])
+                writer.writerow(["link", name, "bytes", stats["bytes"]])
+                writer.writerow(["link", name, "traceroutes",
+                                 stats["traceroutes"]])
+            for metric, value in sorted(report["totals"].items()):
+                writer.writerow(["total", "", metric, value])
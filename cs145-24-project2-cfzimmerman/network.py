@@ -2,17 +2,39 @@ import sys
 import threading
 import json
 import pickle
+import hashlib
 import signal
 import time
 import os.path
+import random
 import Queue
 from collections import defaultdict
 from client import Client
+from codec import StructCodec
+from eventsim import EventScheduler, RealTimeEventLoop
 from link import Link
+from metrics import Metrics
 from router import Router
-# DVRouter and LSRouter imports placed in main and conditioned by DV|LS
-# argument so a syntax error in one of the files will not prevent the other
-# from being tested
+from routestore import RouteStore
+from scheduler import DelayScheduler
+# DVRouter, LSRouter, HLSrouter and PVrouter imports placed in
+# loadRouterClass and conditioned by DV|LS|HLS|PV argument so a syntax error
+# in one of the files will not prevent the others from being tested
+
+# router classes selectable by name: name -> (module, class)
+ROUTER_CLASSES = {
+    "DV": ("DVrouter", "DVrouter"),
+    "LS": ("LSrouter", "LSrouter"),
+    "HLS": ("HLSrouter", "HLSrouter"),
+    "PV": ("PVrouter", "PVrouter"),
+}
+
+
+def loadRouterClass(name):
+    """Import and return the router class registered as name"""
+    moduleName, className = ROUTER_CLASSES[name]
+    return getattr(__import__(moduleName), className)
+
 
 def json_load_byteified(file_handle):
     return _byteify(
@@ -40,25 +62,89 @@ def _byteify(data, ignore_dicts = False):
 class Network:
     """Network class maintains all clients, routers, links, and confguration"""
 
-    def __init__(self, netJsonFilepath, routerClass, visualize=False):
+    def __init__(self, netJsonFilepath, routerClass, visualize=False,
+                 virtual=False, eventLoop=False, jsonPayloads=False,
+                 metrics=False, oracle=False, traceSample=1,
+                 latencyMultiplier=100, workers=1, seed=None):
         """Create a new network from the parameters in the file at
            netJsonFilepath.  routerClass determines whether to use DVrouter,
-           LSrouter, or the default Router"""
+           LSrouter, or the default Router.  If virtual is set, the network
+           runs on a discrete-event virtual clock instead of in real time.
+           If eventLoop is set, it runs in real time but on a single-threaded
+           event loop instead of a thread per router and client.  Routing
+           payloads are packed binary unless jsonPayloads is set.  If
+           metrics is set, self.metrics (a metrics.Metrics) records link
+           change times, convergence, routing traffic and handler times.
+           If oracle is set, routes are checked by walking the routers'
+           forwarding state (see checkRoutes) every clientSendRate, and each
+           client sends traceroute packets to only traceSample clients per
+           round.  Link costs, endTime, clientSendRate and change times are
+           scaled to milliseconds by latencyMultiplier.  If workers is more
+           than 1, a virtual-time run is split across that many processes
+           (see parallel.py).  If seed is set, each router and client starts
+           its handleTime ticks at a phase drawn from it, instead of every
+           node ticking at the same moments (see scheduleHandleTime)"""
 
         # parse configuration details
         netJsonFile = open(netJsonFilepath, 'r')
         netJson = json_load_byteified(netJsonFile)
-        self.latencyMultiplier = 100
+        # snapshots only restore into the config they were taken from
+        netJsonFile.seek(0)
+        self.configHash = hashlib.sha1(netJsonFile.read()).hexdigest()
+        self.netJsonFilepath = netJsonFilepath
+        self.routerClass = routerClass
+        self.jsonPayloads = jsonPayloads
+        self.workers = workers
+        self.seed = seed
+        self.latencyMultiplier = latencyMultiplier
         self.endTime = netJson["endTime"] * self.latencyMultiplier
         self.visualize = visualize
         if visualize:
             self.latencyMultiplier *= netJson["visualize"]["timeMultiplier"]
         self.clientSendRate = netJson["clientSendRate"]*self.latencyMultiplier
+        self.virtual = virtual
+        self.eventLoop = eventLoop
+        self.oracle = oracle
+        self.traceSample = traceSample
+        # all links share one scheduler for packets in flight
+        if virtual:
+            self.scheduler = EventScheduler()
+        elif eventLoop:
+            self.scheduler = RealTimeEventLoop()
+        else:
+            self.scheduler = DelayScheduler()
+
+        # parse correct routes first so metrics knows the pairs to check.
+        # Only the threaded network needs locks around the routes; on a
+        # single thread routes are recorded in order
+        singleThread = virtual or eventLoop
+        self.routeStore = RouteStore(
+            self.parseCorrectRoutes(netJson["correctRoutes"]),
+            netJson["clients"], locking=not singleThread,
+            ordered=singleThread)
+        self.metrics = None
+        if metrics:
+            self.metrics = Metrics(self.currentTime, self.routeStore.pairs())
 
         # parse and create routers, clients, and links
         self.routers = self.parseRouters(netJson["routers"], routerClass)
+        if not jsonPayloads:
+            codec = StructCodec(netJson["routers"] + netJson["clients"])
+            for router in self.routers.values():
+                router.codec = codec
+        # area-based routers learn the config's areas
+        if "areas" in netJson and hasattr(routerClass, "areas"):
+            for router in self.routers.values():
+                router.areas = netJson["areas"]
         self.clients = self.parseClients(netJson["clients"], self.clientSendRate)
         self.links = self.parseLinks(netJson["links"])
+        # the router and router port each client hangs off
+        self.clientPorts = {}
+        for (addr1, addr2), (p1, p2, _, _, _) in self.links.iteritems():
+            if addr1 in self.clients:
+                self.clientPorts[addr1] = (addr2, p2)
+            if addr2 in self.clients:
+                self.clientPorts[addr2] = (addr1, p1)
 
         # parse link changes
         if "changes" in netJson:
@@ -66,12 +152,14 @@ class Network:
         else:
             self.changes = None
 
-        # parse correct routes and create some tracking fields
-        self.correctRoutes = self.parseCorrectRoutes(netJson["correctRoutes"])
+        # create some tracking fields
         self.threads = []
-        self.routes = {}
-        #self.routesLock = thread.allocate_lock()
-        self.routesLock = threading.Lock()
+        self.warmStart = None  # snapshot to resume from, see loadSnapshot
+        # routes of the sampled traceroute packets in oracle mode
+        self.sampledRoutes = RouteStore(self.routeStore.correctRoutes,
+                                        netJson["clients"],
+                                        locking=not singleThread,
+                                        ordered=singleThread)
         netJsonFile.close()
 
 
@@ -81,6 +169,7 @@ class Network:
         for addr in routerParams:
             #print "Router {}".format(addr)
             routers[addr] = routerClass(addr, heartbeatTime=self.latencyMultiplier*10)
+            routers[addr].metrics = self.metrics
         return routers
 
 
@@ -89,7 +178,13 @@ class Network:
         clients = {}
         for addr in clientParams:
             #print "Client {}".format(addr)
-            clients[addr] = Client(addr, clientParams, clientSendRate, self.updateRoute)
+            if self.oracle:
+                clients[addr] = Client(addr, clientParams, clientSendRate,
+                                       self.updateSampledRoute,
+                                       self.traceSample)
+            else:
+                clients[addr] = Client(addr, clientParams, clientSendRate,
+                                       self.updateRoute)
         return clients
 
 
@@ -99,7 +194,8 @@ class Network:
         for addr1, addr2, p1, p2, c12, c21 in linkParams:
             #print "{}:{} --cost:{}--> {}:{} --cost:{}--> {}:{}".format(
                    #addr1, p1, c12, addr2, p2, c21, addr1, p1)
-            link = Link(addr1, addr2, c12, c21, self.latencyMultiplier)
+            link = Link(addr1, addr2, c12, c21, self.latencyMultiplier,
+                        self.scheduler, self.metrics)
             links[(addr1,addr2)] = (p1, p2, c12, c21, link)
         return links
 
@@ -113,19 +209,32 @@ class Network:
         return changes
 
 
-    def parseCorrectRoutes(self, routesParams):
-        """parse correct routes, from routesParams dict"""
-        correctRoutes = defaultdict(list)
+    @staticmethod
+    def parseCorrectRoutes(routesParams):
+        """parse correct routes, from routesParams dict, into sets of
+           route tuples"""
+        correctRoutes = defaultdict(set)
         for route in routesParams:
             src, dst = route[0], route[-1]
-            correctRoutes[(src,dst)].append(route)
-        return correctRoutes
+            correctRoutes[(src,dst)].add(tuple(route))
+        return dict(correctRoutes)
 
 
     def run(self):
         """Run the network.  Start threads for each client and router. Start
            thread to track link changes.  If not visualizing, wait until
            end time and then print final routes"""
+        if self.virtual:
+            self.runVirtual()
+            return
+        if self.eventLoop:
+            self.runAsync()
+            return
+        self.scheduler.start()
+        self.scheduleHandleTime()
+        if self.oracle:
+            self.scheduler.schedulePeriodic(self.clientSendRate,
+                                            self.checkRoutes)
         for router in self.routers.values():
             thread = router_thread(router)
             thread.start()
@@ -147,6 +256,190 @@ class Network:
             self.joinAll()
 
 
+    def runVirtual(self, printRoutes=True):
+        """Run the network on the virtual clock.  Inbox drains, handleTime
+           calls, link deliveries and link changes are all scheduled events,
+           so the run takes only as long as the computation needs.
+           Prints the final routes like run unless printRoutes is False.
+           Also used by runAsync, whose scheduler paces the same events in
+           real time"""
+        if self.workers > 1:
+            self.runPartitioned(printRoutes)
+            return
+        for node in self.routers.values() + self.clients.values():
+            # drain the inbox at the current virtual time whenever
+            # something is put in it
+            node.inboxCallback = (lambda n=node:
+                self.scheduler.schedule(0, n.drainInbox))
+        self.scheduleHandleTime()
+        if self.oracle:
+            self.scheduler.schedulePeriodic(self.clientSendRate,
+                                            self.checkRoutes)
+        if self.warmStart is not None:
+            self.restoreSnapshot(self.warmStart)
+        else:
+            self.addLinks()
+        if self.changes:
+            while not self.changes.empty():
+                changeTime, target, change = self.changes.get()
+                # changes before a warm start are already in the snapshot
+                if changeTime*self.latencyMultiplier >= self.scheduler.now():
+                    self.scheduler.scheduleAt(
+                        changeTime*self.latencyMultiplier,
+                        self.applyChange, change, target)
+        self.runClock(self.endTime)
+        self.resetRoutes()
+        if self.oracle:
+            self.checkRoutes()
+        else:
+            for client in self.clients.values():
+                client.lastSend()
+            self.runClock(self.endTime + 4*self.clientSendRate)
+        if printRoutes:
+            sys.stdout.write("\n"+self.getRouteString()+"\n")
+
+
+    def runClock(self, endTime):
+        """Run the scheduled events up to and including endTime"""
+        self.scheduler.runUntil(endTime)
+
+
+    def runPartitioned(self, printRoutes=True):
+        """Run the network on the virtual clock in self.workers processes,
+           each simulating one partition of the routers, then gather the
+           routes the traceroutes found.  Prints them like runVirtual unless
+           printRoutes is False"""
+        assert self.virtual, "partitioned runs need the virtual clock"
+        assert not (self.oracle or self.metrics or self.warmStart), \
+            "partitioned runs don't support oracle, metrics or snapshots"
+        import parallel
+        parallel.runPartitioned(self)
+        if printRoutes:
+            sys.stdout.write("\n"+self.getRouteString()+"\n")
+
+
+    def scheduleSnapshot(self, path, snapshotTime=None):
+        """Have runVirtual save a snapshot to path at snapshotTime
+           (milliseconds), by default just before the first link change, once
+           the initial topology has converged.  Call before runVirtual"""
+        if snapshotTime is None:
+            if self.changes and not self.changes.empty():
+                snapshotTime = min(self.changes.queue)[0]*self.latencyMultiplier
+            else:
+                snapshotTime = self.endTime
+        # scheduled ahead of runVirtual's events, so it runs before any link
+        # change at the same time
+        self.scheduler.scheduleAt(snapshotTime, self.saveSnapshot, path)
+
+
+    def saveSnapshot(self, path):
+        """Pickle every router's and client's state, which links are up on
+           which ports, and the packets in flight to path, so a run of the
+           same config can resume from this moment (see loadSnapshot).
+           Virtual time only"""
+        # handle anything already delivered at this time first
+        for node in self.routers.values() + self.clients.values():
+            node.drainInbox()
+        linkKeys = {entry[4]: key for key, entry in self.links.iteritems()}
+        inFlight = []
+        for eventTime, _, callback, args in sorted(self.scheduler.events):
+            if getattr(callback, "im_func", None) is Link.deliver.im_func:
+                # packets on links that have since gone down are dropped
+                key = linkKeys.get(callback.im_self)
+                if key is not None:
+                    inFlight.append((eventTime, key) + args)
+        snapshot = {
+            "configHash": self.configHash,
+            "time": self.scheduler.now(),
+            "links": {key: entry[:4] for key, entry in self.links.iteritems()},
+            "routerLinks": {addr: {port: linkKeys[link] for port, link
+                                   in router.links.iteritems()}
+                            for addr, router in self.routers.iteritems()},
+            "clientLinks": {addr: linkKeys[client.link]
+                            for addr, client in self.clients.iteritems()
+                            if client.link is not None},
+            "routers": {addr: router.getState()
+                        for addr, router in self.routers.iteritems()},
+            "clients": {addr: client.getState()
+                        for addr, client in self.clients.iteritems()},
+            "inFlight": inFlight,
+        }
+        with open(path, "wb") as f:
+            pickle.dump(snapshot, f, pickle.HIGHEST_PROTOCOL)
+
+
+    def loadSnapshot(self, path):
+        """Have runVirtual resume from the snapshot at path instead of
+           converging from scratch.  The clock jumps to the snapshot's time,
+           and only link changes from then on are applied"""
+        assert self.virtual, "snapshots need the virtual clock"
+        with open(path, "rb") as f:
+            snapshot = pickle.load(f)
+        assert snapshot["configHash"] == self.configHash, \
+            "snapshot was taken from a different config"
+        self.warmStart = snapshot
+        self.scheduler.currentTime = snapshot["time"]
+        if self.metrics is not None:
+            self.metrics.markStart("warm start")
+
+
+    def restoreSnapshot(self, snapshot):
+        """Recreate the links, router and client state, and packets in
+           flight saved by saveSnapshot"""
+        for (addr1, addr2), (p1, p2, c12, c21) in snapshot["links"].iteritems():
+            link = Link(addr1, addr2, c12, c21, self.latencyMultiplier,
+                        self.scheduler, self.metrics)
+            self.links[(addr1,addr2)] = (p1, p2, c12, c21, link)
+        for addr, state in snapshot["routers"].iteritems():
+            self.routers[addr].setState(state)
+        for addr, ports in snapshot["routerLinks"].iteritems():
+            for port, key in ports.iteritems():
+                self.routers[addr].attachLink(port, self.links[key][4])
+        for addr, state in snapshot["clients"].iteritems():
+            self.clients[addr].setState(state)
+        for addr, key in snapshot["clientLinks"].iteritems():
+            self.clients[addr].attachLink(self.links[key][4])
+        for eventTime, key, packet, dst in snapshot["inFlight"]:
+            self.scheduler.scheduleAt(eventTime, self.links[key][4].deliver,
+                                      packet, dst)
+
+
+    def scheduleHandleTime(self):
+        """Have the scheduler put a handleTime deadline in every router and
+           client inbox at their regular interval.  The tick is periodic
+           rather than per-router deadlines since routers only keep time
+           through handleTime (see Router.HANDLE_TIME_INTERVAL).
+           With a seed, each node's first tick is delayed by a phase drawn
+           from the seed and its address, so heartbeats and traceroute
+           rounds interleave differently from seed to seed, and a node gets
+           the same phase in whichever partition runs it"""
+        for node in self.routers.values() + self.clients.values():
+            tick = lambda n=node: n.putInbox(("time", self.scheduler.now()))
+            if self.seed is None:
+                self.scheduler.schedulePeriodic(node.HANDLE_TIME_INTERVAL, tick)
+                continue
+            phase = random.Random("{} {}".format(self.seed, node.addr)) \
+                .randrange(node.HANDLE_TIME_INTERVAL)
+            self.scheduler.schedule(phase, self.scheduler.schedulePeriodic,
+                                    node.HANDLE_TIME_INTERVAL, tick)
+
+
+    def runAsync(self):
+        """Run the network in real time on a single-threaded event loop.
+           Router and client main loops become callbacks on the loop, links
+           deliver with delayed callbacks, and link changes are scheduled
+           callbacks, so no threads are started.  Router subclasses run
+           unmodified since they only see the handle... hooks"""
+        assert self.eventLoop, "Network must be created with eventLoop=True"
+        self.runVirtual()
+
+
+    def currentTime(self):
+        """Returns the current time in milliseconds, virtual or real"""
+        if self.virtual or self.eventLoop:
+            return self.scheduler.now()
+        return int(round(time.time() * 1000))
+
 
     def addLinks(self):
         """Add links to clients and routers"""
@@ -172,80 +465,118 @@ class Network:
             waitTime = (changeTime*self.latencyMultiplier + startTime) - currentTime
             if waitTime > 0:
                 time.sleep(waitTime/float(1000))
-            # link changes
-            if change == "up":
-                addr1, addr2, p1, p2, c12, c21 = target
-                link = Link(addr1, addr2, c12, c21, self.latencyMultiplier)
-                self.links[(addr1,addr2)] = (p1, p2, c12, c21, link)
-                self.routers[addr1].changeLink(("add", p1, addr2, link, c12))
-                self.routers[addr2].changeLink(("add", p2, addr1, link, c21))
-            elif change == "down":
-                addr1, addr2, = target
-                p1, p2, _, _, link = self.links[(addr1, addr2)]
-                self.routers[addr1].changeLink(("remove", p1))
-                self.routers[addr2].changeLink(("remove", p2))
-            # update visualization
-            if hasattr(Network, "visualizeChangesCallback"):
-                Network.visualizeChangesCallback(change, target)
+            self.applyChange(change, target)
+
+
+    def applyChange(self, change, target):
+        """Bring a link up or down and notify the routers at both ends"""
+        if self.metrics is not None:
+            self.metrics.recordChange(change, target)
+        # link changes
+        if change == "up":
+            addr1, addr2, p1, p2, c12, c21 = target
+            link = Link(addr1, addr2, c12, c21, self.latencyMultiplier,
+                        self.scheduler, self.metrics)
+            self.links[(addr1,addr2)] = (p1, p2, c12, c21, link)
+            self.routers[addr1].changeLink(("add", p1, addr2, link, c12))
+            self.routers[addr2].changeLink(("add", p2, addr1, link, c21))
+        elif change == "down":
+            addr1, addr2, = target
+            p1, p2, _, _, link = self.links[(addr1, addr2)]
+            self.routers[addr1].changeLink(("remove", p1))
+            self.routers[addr2].changeLink(("remove", p2))
+        # update visualization
+        if hasattr(Network, "visualizeChangesCallback"):
+            Network.visualizeChangesCallback(change, target)
 
 
     def updateRoute(self, src, dst, route):
         """Callback function used by clients to update the
            current routes taken by traceroute packets"""
-        self.routesLock.acquire()
-        timeMillisecs = int(round(time.time() * 1000))
-        isGood = route in self.correctRoutes[(src,dst)]
-        try:
-            _, _, currentTime = self.routes[(src,dst)]
-            if timeMillisecs > currentTime:
-                self.routes[(src,dst)] = (route, isGood, timeMillisecs)
-        except KeyError:
-            self.routes[(src,dst)] = (route, isGood, timeMillisecs)
-        finally:
-            self.routesLock.release()
+        isGood = self.routeStore.update(src, dst, route, self.currentTime())
+        if self.metrics is not None:
+            self.metrics.recordRoute(src, dst, route, isGood)
+
+
+    def updateSampledRoute(self, src, dst, route):
+        """Callback used by clients in oracle mode.  Sampled traceroute
+           packets are kept apart from the routes checkRoutes finds"""
+        self.sampledRoutes.update(src, dst, route, self.currentTime())
+
+
+    def checkRoutes(self):
+        """Update the route of every pair of clients by walking the routers'
+           forwarding state, as if traceroute packets were sent and arrived
+           instantly"""
+        for src in self.clients:
+            for dst in self.clients:
+                self.updateRoute(src, dst, self.oracleRoute(src, dst))
+
+
+    def oracleRoute(self, src, dst):
+        """Returns the route a traceroute packet from client src to client
+           dst would take through each router's forwardPort.  If the packet
+           would be dropped or loop, the route stops where it would be"""
+        addr, inPort = self.clientPorts[src]
+        route = [src]
+        for _ in xrange(len(self.routers) + 1):
+            route.append(addr)
+            if addr in self.clients:
+                return route
+            router = self.routers[addr]
+            link = router.links.get(router.forwardPort(src, dst, inPort))
+            if link is None:
+                return route
+            nextAddr = link.e2 if link.e1 == addr else link.e1
+            p1, p2, _, _, _ = self.links[(link.e1, link.e2)]
+            addr, inPort = nextAddr, (p2 if nextAddr == link.e2 else p1)
+        return route
 
 
     def getRouteString(self, labelIncorrect=True):
         """Create a string with all the current routes found by traceroute
            packets and whether they are correct"""
-        self.routesLock.acquire()
+        routes = self.routeStore.snapshot()
         routeStrings = []
         allCorrect = True
-        for src,dst in self.routes:
-            route, isGood, _ = self.routes[(src,dst)]
+        for (src,dst), (route, isGood, _) in routes.iteritems():
             routeStrings.append("{} -> {}: {} {}".format(src, dst, route,
                 "" if (isGood or not labelIncorrect) else "Incorrect Route"))
             if not isGood:
                 allCorrect = False
         routeStrings.sort()
-        if allCorrect and len(self.routes) > 0:
+        if allCorrect and len(routes) > 0:
             routeStrings.append("\nSUCCESS: All Routes correct!")
         else:
             routeStrings.append("\nFAILURE: Not all routes are correct")
-        routeString = "\n".join(routeStrings)
-        self.routesLock.release()
-        return routeString
+        return "\n".join(routeStrings)
+
+
+    def allRoutesCorrect(self):
+        """Returns True if there are routes and every one is correct"""
+        routes = self.routeStore.snapshot()
+        return len(routes) > 0 and all(
+            isGood for _, isGood, _ in routes.itervalues())
 
 
     def getRoutePickle(self):
         """Create a pickle with the current routes
            found by traceroute packets"""
-        self.routesLock.acquire()
-        routePickle = pickle.dumps(self.routes)
-        self.routesLock.release()
-        return routePickle
+        return pickle.dumps(self.routeStore.snapshot())
 
 
     def resetRoutes(self):
         """Reset the routes foudn by traceroute packets"""
-        self.routesLock.acquire()
-        self.routes = {}
-        self.routesLock.release()
+        self.routeStore.reset()
 
 
     def finalRoutes(self):
-        """Have the clients send one final batch of traceroute packets"""
+        """Have the clients send one final batch of traceroute packets, or
+           check the routes once more in oracle mode"""
         self.resetRoutes()
+        if self.oracle:
+            self.checkRoutes()
+            return
         for client in self.clients.values():
             client.lastSend()
         time.sleep(4*self.clientSendRate/float(1000))
@@ -255,6 +586,7 @@ class Network:
             self.handleChangesThread.join()
         for thread in self.threads:
             thread.join()
+        self.scheduler.join()
 
     def handleInterrupt(self, signum, _):
         self.joinAll()
@@ -265,20 +597,39 @@ class Network:
 
 def main():
     """Main function parses command line arguments and runs network"""
-    if len(sys.argv) < 2:
-        print "Usage: python network.py [networkSimulationFile.json] [DV|LS (router class, optional)]"
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    flags = [arg for arg in sys.argv[1:] if arg.startswith("--")]
+    if len(args) < 1:
+        print "Usage: python network.py [networkSimulationFile.json] [DV|LS|HLS|PV (router class, optional)] [--virtual|--async] [--json-payloads] [--oracle] [--report=metrics.json|metrics.csv] [--snapshot=FILE|--warm-start=FILE] [--parallel=N] [--seed=N]"
         return
-    netCfgFilepath = sys.argv[1]
+    netCfgFilepath = args[0]
     routerClass = Router
-    if len(sys.argv) >= 3:
-        if sys.argv[2] == "DV":
-            from DVrouter import DVrouter
-            routerClass = DVrouter
-        elif sys.argv[2] == "LS":
-            from LSrouter import LSrouter
-            routerClass = LSrouter
-    net = Network(netCfgFilepath, routerClass, visualize=False)
+    if len(args) >= 2 and args[1] in ROUTER_CLASSES:
+        routerClass = loadRouterClass(args[1])
+    flagValues = lambda name: [flag.split("=", 1)[1] for flag in flags
+                               if flag.startswith(name + "=")]
+    reports = flagValues("--report")
+    snapshots = flagValues("--snapshot")
+    warmStarts = flagValues("--warm-start")
+    workers = flagValues("--parallel")
+    seeds = flagValues("--seed")
+    net = Network(netCfgFilepath, routerClass, visualize=False,
+                  # snapshots and partitioned runs need the virtual clock
+                  virtual=("--virtual" in flags or bool(snapshots) or
+                           bool(warmStarts) or bool(workers)),
+                  eventLoop="--async" in flags,
+                  jsonPayloads="--json-payloads" in flags,
+                  metrics=bool(reports),
+                  oracle="--oracle" in flags,
+                  workers=int(workers[0]) if workers else 1,
+                  seed=int(seeds[0]) if seeds else None)
+    for path in snapshots:
+        net.scheduleSnapshot(path)
+    for path in warmStarts:
+        net.loadSnapshot(path)
     net.run()
+    for path in reports:
+        net.metrics.writeReport(path)
     return
 
 # Extensions of threading.Thread class
@@ -295,6 +646,7 @@ class router_thread(threading.Thread):
     def join(self, timeout=None):
         # Terrible style (think about changing) but works like a charm
         self.router.keepRunning = False
+        self.router.putInbox(("wakeup",))
         super(router_thread, self).join(timeout)
 
 class client_thread(threading.Thread):
@@ -309,6 +661,7 @@ class client_thread(threading.Thread):
     def join(self, timeout=None):
         # Terrible style (think about changing) but works like a charm
         self.client.keepRunning = False
+        self.client.putInbox(("wakeup",))
         super(client_thread, self).join(timeout)
 
 class handle_changes_thread(threading.Thread):
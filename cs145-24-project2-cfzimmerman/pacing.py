@@ -0,0 +1,86 @@
+class UpdatePacer:
+    """Spaces out a router's triggered routing updates.
+
+       A router asks to send an update whenever its routing state changes.
+       The first request after a quiet period is sent right away, or after
+       delay if one is given, so the rest of a burst joins it; requests
+       arriving less than the current interval after the last update are
+       coalesced into one pending update, which the router sends from
+       handleTime once the interval has passed.  Each update held back by the
+       interval doubles it, up to max_interval, so sustained churn is
+       answered with fewer and fewer updates.  Two intervals without a
+       request reset it to min_interval.  Start-up isn't churn, though:
+       until the router first goes two max_intervals without a request,
+       the interval stays at min_interval so initial convergence isn't
+       slowed down.
+       A min_interval and delay of 0 send every update immediately.
+
+       LSrouter also paces its shortest path computations with one: each
+       changed LSA is a request, and an update is a run over everything
+       that arrived since the last one.
+
+       The pacer only knows the time of the latest tick (handleTime), so
+       intervals are measured at that granularity.  Routers count the
+       requests and updates themselves (Router.countUpdates)."""
+
+    def __init__(self, min_interval, max_interval, delay=0):
+        """Intervals and delay are in milliseconds"""
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.interval = min_interval
+        self.delay = delay
+        self.now = 0
+        self.last_sent = None
+        self.pending = False
+        # When the pending update is due, and whether it was held back by
+        # the interval rather than the delay
+        self.due = None
+        self.held = False
+        # Whether the router has gone two max_intervals without a request
+        # since it started
+        self.settled = False
+
+    def request(self):
+        """Asks to send an update.  Returns True if it should go out now;
+           otherwise it is left pending for tick"""
+        if self.pending:
+            return False
+        if (self.last_sent is not None and
+                self.now - self.last_sent < self.interval):
+            self.pending = True
+            self.due = self.last_sent + self.interval
+            self.held = True
+            return False
+        if self.delay:
+            self.pending = True
+            self.due = self.now + self.delay
+            self.held = False
+            return False
+        self.last_sent = self.now
+        return True
+
+    def tick(self, now):
+        """Advances the clock to now.  Returns True if the pending update
+           is due and should be sent"""
+        self.now = now
+        if not self.pending:
+            if self.last_sent is not None:
+                quiet = now - self.last_sent
+                if quiet >= 2 * self.interval:
+                    self.interval = self.min_interval
+                if quiet >= 2 * self.max_interval:
+                    self.settled = True
+            return False
+        if now < self.due:
+            return False
+        self.pending = False
+        self.last_sent = now
+        if self.held and self.settled:
+            self.interval = min(2 * self.interval, self.max_interval)
+        return True
+
+    def sent(self):
+        """Notes an update that carried everything pending, such as a
+           periodic one, went out by other means"""
+        self.pending = False
+        self.last_sent = self.now
@@ -1,6 +1,4 @@
-from copy import deepcopy
-
-class Packet:
+class Packet(object):
     """Packet class defines packets that clients and routers
        send in the simulated network"""
 
@@ -11,6 +9,8 @@ class Packet:
     # Use Packet.ROUTING as the "kind" field for all packets
     # created by your implementations.
 
+    __slots__ = ("kind", "srcAddr", "dstAddr", "content", "routeTail")
+
 
     def __init__(self, kind, srcAddr, dstAddr, content=None):
         """create a new packet"""
@@ -18,14 +18,19 @@ class Packet:
         self.srcAddr = srcAddr  # address of the source of the packet
         self.dstAddr = dstAddr  # address of the destination of the packet
         self.content = content  # content of the packet (must be a string)
-        self.route = [srcAddr]  # DO NOT access from DSrouter or LSrouter
+        # DO NOT access from DVrouter or LSrouter.  The route is a persistent
+        # linked list of (parent, addr) tuples ending at the latest hop, so
+        # copies share everything but the hops added after copying
+        self.routeTail = (None, srcAddr)
 
 
     def copy(self):
-        """Create a deepcopy of the packet.  This gets called automatically
-           when the packet is sent to avoid aliasing issues"""
-        p = Packet(self.kind, self.srcAddr, self.dstAddr, content=deepcopy(self.content))
-        p.route = list(self.route)
+        """Create a copy of the packet.  This gets called automatically
+           when the packet is sent to avoid aliasing issues.  Content is an
+           immutable string and the route is persistent, so both are shared
+           rather than copied"""
+        p = Packet(self.kind, self.srcAddr, self.dstAddr, content=self.content)
+        p.routeTail = self.routeTail
         return p
 
 
@@ -46,12 +51,18 @@ class Packet:
 
     def addToRoute(self, addr):
         '''DO NOT CALL from DVrouter or LSrouter'''
-        self.route.append(addr)
+        self.routeTail = (self.routeTail, addr)
 
 
     def getRoute(self):
         '''DO NOT CALL from DVRouter or LSrouter'''
-        return self.route
+        route = []
+        node = self.routeTail
+        while node:
+            node, addr = node
+            route.append(addr)
+        route.reverse()
+        return route
 
 
     def animateSend(self, src, dst, latency):
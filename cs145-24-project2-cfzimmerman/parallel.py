@@ -0,0 +1,377 @@
+import time
+import Queue
+import struct
+import cPickle
+import multiprocessing
+from network import Network, json_load_byteified
+from link import Link
+from topogen import assignAreas
+
+
+"""
+Runs one virtual-time simulation across several worker processes.
+
+    python2 network.py big.json LS --parallel=4
+
+The routers are split into connected partitions of similar size (the same
+farthest-first growth topogen.py uses for areas), and each client goes with
+its router. Every worker builds a PartitionNetwork holding only its own
+routers and clients. Links with both ends in one partition are ordinary
+Links. A link between partitions is a RemoteLink at each end: a packet sent
+on it is pickled, with its arrival time, into a shared-memory RingBuffer
+read by the worker at the other end.
+
+Workers stay in step conservatively. The lookahead is the lowest latency of
+any link between partitions, so a packet sent at time t arrives no earlier
+than t + lookahead. Each worker runs its events in windows of one
+lookahead, [T, T + lookahead). It then waits until every worker has
+finished the window, reading its rings as it waits, and schedules the
+packets it received before starting the next window. Nothing received can
+be due in a window already run, so every worker sees the same events as a
+single-process run, and only same-time ties can be ordered differently.
+Cutting only expensive links raises the lookahead, so fewer windows are
+needed.
+
+Each worker's routes are merged into the Network that started the run, so
+its route report and allRoutesCorrect work as usual. Oracle checks,
+metrics and snapshots look at every router at once, so they aren't
+supported here.
+"""
+
+# Bytes in each ring between two partitions
+RING_BYTES = 1 << 20
+# Seconds to sleep between checks while waiting on other workers
+POLL_SECONDS = 0.0002
+
+
+class RingBuffer:
+    """Single-producer, single-consumer queue of strings in shared memory.
+       Messages are framed by a length prefix.  written and read count every
+       byte ever written and read; only the writer moves written, and only
+       the reader moves read, so no lock is needed"""
+
+    LENGTH = struct.Struct("!I")
+
+    def __init__(self, capacity=RING_BYTES):
+        self.capacity = capacity
+        self.data = multiprocessing.RawArray("c", capacity)
+        self.written = multiprocessing.RawValue("L", 0)
+        self.read = multiprocessing.RawValue("L", 0)
+
+
+    def put(self, message):
+        """Append message.  Returns False, writing nothing, if the ring
+           doesn't have room for it"""
+        frame = self.LENGTH.pack(len(message)) + message
+        if len(frame) > self.capacity:
+            raise ValueError("message larger than the ring")
+        written = self.written.value
+        if len(frame) > self.capacity - (written - self.read.value):
+            return False
+        self.copyIn(written, frame)
+        # the frame is in place before the writer moves past it
+        self.written.value = written + len(frame)
+        return True
+
+
+    def getAll(self):
+        """Remove and return every message written so far"""
+        messages = []
+        end = self.written.value
+        pos = self.read.value
+        while pos < end:
+            n, = self.LENGTH.unpack(self.copyOut(pos, self.LENGTH.size))
+            messages.append(self.copyOut(pos + self.LENGTH.size, n))
+            pos += self.LENGTH.size + n
+        self.read.value = pos
+        return messages
+
+
+    def copyIn(self, pos, s):
+        """Write s starting at byte count pos, wrapping around the end"""
+        start = pos % self.capacity
+        first = min(len(s), self.capacity - start)
+        self.data[start:start + first] = s[:first]
+        if first < len(s):
+            self.data[:len(s) - first] = s[first:]
+
+
+    def copyOut(self, pos, n):
+        """Read n bytes starting at byte count pos, wrapping around the
+           end"""
+        start = pos % self.capacity
+        first = min(n, self.capacity - start)
+        s = self.data[start:start + first]
+        if first < n:
+            s += self.data[:n - first]
+        return s
+
+
+class RemoteLink(Link):
+    """The local end of a link to a router or client in another partition.
+       Packets sent from the local end go to the other worker through the
+       network's rings; packets arriving from it are delivered like on a
+       Link.  generation counts how many times the link has come up, so
+       packets sent before it last went down are dropped"""
+
+    def __init__(self, e1, e2, l12, l21, latency, network, generation):
+        Link.__init__(self, e1, e2, l12, l21, latency, network.scheduler)
+        self.network = network
+        self.generation = generation
+
+
+    def schedule_send(self, packet, src):
+        """Sends packet on link FROM src by passing it to the worker holding
+           the other end, with its arrival time"""
+        if src == self.e1:
+            dst, latency = self.e2, self.l12
+        else:
+            dst, latency = self.e1, self.l21
+        packet.addToRoute(dst)
+        self.network.sendRemote(self.scheduler.now() + latency,
+                                (self.e1, self.e2), self.generation, dst,
+                                packet)
+
+
+class PartitionNetwork(Network):
+    """The routers and clients of one partition of a network, run by one
+       worker process on the virtual clock in windows of lookahead
+       milliseconds"""
+
+    def __init__(self, netJsonFilepath, routerClass, partOf, part, rings,
+                 done, lookahead, **kwargs):
+        """partOf maps every router and client to its partition, and part is
+           this worker's.  rings maps (from partition, to partition) to the
+           RingBuffer between them, and done holds the last window each
+           worker finished"""
+        self.partOf = partOf
+        self.part = part
+        self.outRings = {dst: ring for (src, dst), ring in rings.iteritems()
+                         if src == part}
+        self.inRings = sorted((src, ring) for (src, dst), ring
+                              in rings.iteritems() if dst == part)
+        self.done = done
+        self.lookahead = lookahead
+        self.window = 0
+        self.windowStart = 0
+        # times each link has come up, indexed by (addr1, addr2)
+        self.generations = {}
+        Network.__init__(self, netJsonFilepath, routerClass, virtual=True,
+                         **kwargs)
+
+
+    def isLocal(self, addr):
+        return self.partOf[addr] == self.part
+
+
+    def parseRouters(self, routerParams, routerClass):
+        """Create only this partition's routers"""
+        return Network.parseRouters(
+            self, [addr for addr in routerParams if self.isLocal(addr)],
+            routerClass)
+
+
+    def parseClients(self, clientParams, clientSendRate):
+        """Create only this partition's clients, which still send
+           traceroutes to every client"""
+        clients = Network.parseClients(self, clientParams, clientSendRate)
+        return {addr: client for addr, client in clients.iteritems()
+                if self.isLocal(addr)}
+
+
+    def parseLinks(self, linkParams):
+        """Create the links with at least one end in this partition"""
+        links = {}
+        for addr1, addr2, p1, p2, c12, c21 in linkParams:
+            link = self.makeLink(addr1, addr2, c12, c21)
+            if link is not None:
+                links[(addr1,addr2)] = (p1, p2, c12, c21, link)
+        return links
+
+
+    def makeLink(self, addr1, addr2, c12, c21):
+        """A Link if both ends are local, a RemoteLink if one is, else
+           None"""
+        if self.isLocal(addr1) and self.isLocal(addr2):
+            return Link(addr1, addr2, c12, c21, self.latencyMultiplier,
+                        self.scheduler)
+        if self.isLocal(addr1) or self.isLocal(addr2):
+            return RemoteLink(addr1, addr2, c12, c21, self.latencyMultiplier,
+                              self, self.generations.get((addr1, addr2), 0))
+        return None
+
+
+    def applyChange(self, change, target):
+        """Bring a link up or down at its local ends"""
+        if change == "up":
+            addr1, addr2, p1, p2, c12, c21 = target
+            key = (addr1, addr2)
+            self.generations[key] = self.generations.get(key, 0) + 1
+            link = self.makeLink(addr1, addr2, c12, c21)
+            if link is None:
+                return
+            self.links[key] = (p1, p2, c12, c21, link)
+            if addr1 in self.routers:
+                self.routers[addr1].changeLink(("add", p1, addr2, link, c12))
+            if addr2 in self.routers:
+                self.routers[addr2].changeLink(("add", p2, addr1, link, c21))
+        elif change == "down":
+            addr1, addr2, = target
+            if (addr1, addr2) not in self.links:
+                return
+            p1, p2, _, _, _ = self.links[(addr1, addr2)]
+            if addr1 in self.routers:
+                self.routers[addr1].changeLink(("remove", p1))
+            if addr2 in self.routers:
+                self.routers[addr2].changeLink(("remove", p2))
+
+
+    def sendRemote(self, arrival, key, generation, dst, packet):
+        """Pass a packet arriving at dst, in another partition, at time
+           arrival to the worker holding dst.  If its ring is full, read
+           incoming packets until the other worker makes room"""
+        message = cPickle.dumps((arrival, key, generation, dst, packet),
+                                cPickle.HIGHEST_PROTOCOL)
+        ring = self.outRings[self.partOf[dst]]
+        while not ring.put(message):
+            self.receiveRemote()
+            time.sleep(POLL_SECONDS)
+
+
+    def receiveRemote(self):
+        """Schedule the arrival of every packet the other workers sent"""
+        for _, ring in self.inRings:
+            for message in ring.getAll():
+                arrival, key, generation, dst, packet = cPickle.loads(message)
+                self.scheduler.scheduleAt(arrival, self.deliverRemote, key,
+                                          generation, dst, packet)
+
+
+    def deliverRemote(self, key, generation, dst, packet):
+        """Deliver a packet from another worker if its link is still the one
+           it was sent on"""
+        entry = self.links.get(key)
+        if entry is not None and entry[4].generation == generation:
+            entry[4].deliver(packet, dst)
+
+
+    def runClock(self, endTime):
+        """Run the scheduled events up to and including endTime, one window
+           at a time, trading packets with the other workers after each"""
+        while self.windowStart < endTime:
+            windowEnd = min(self.windowStart + self.lookahead, endTime)
+            self.scheduler.runBefore(windowEnd)
+            self.finishWindow()
+            self.windowStart = windowEnd
+        self.scheduler.runUntil(endTime)
+
+
+    def finishWindow(self):
+        """Wait until every worker has finished the current window, then
+           receive everything they sent in it"""
+        self.window += 1
+        self.done[self.part] = self.window
+        while min(self.done) < self.window:
+            self.receiveRemote()
+            time.sleep(POLL_SECONDS)
+        self.receiveRemote()
+
+
+def allLinks(netJson):
+    """Every link in the config, including those brought up by changes"""
+    return netJson["links"] + [target for _, target, change
+                               in netJson.get("changes", [])
+                               if change == "up"]
+
+
+def partition(netJson, parts):
+    """Returns {addr: partition number} splitting the routers into up to
+       parts connected partitions, with each client in its router's"""
+    routers = netJson["routers"]
+    isRouter = set(routers)
+    links = allLinks(netJson)
+    edges = [(link[0], link[1]) for link in links
+             if link[0] in isRouter and link[1] in isRouter]
+    partOf = assignAreas(routers, edges, parts)
+    # routers only reachable through links that never come up
+    for router in routers:
+        partOf.setdefault(router, 0)
+    for link in links:
+        for client, router in ((link[0], link[1]), (link[1], link[0])):
+            if client not in isRouter:
+                partOf[client] = partOf[router]
+    return partOf
+
+
+def lookahead(netJson, partOf, latencyMultiplier):
+    """The lowest latency in milliseconds of any link between partitions,
+       or None if there are none"""
+    costs = [min(c12, c21) for addr1, addr2, _, _, c12, c21
+             in allLinks(netJson)
+             if partOf[addr1] != partOf[addr2]]
+    if not costs:
+        return None
+    return min(costs) * latencyMultiplier
+
+
+def runWorker(network, part, partOf, rings, done, windowLength, results):
+    """Run one partition of network and put its routes in results"""
+    worker = PartitionNetwork(network.netJsonFilepath, network.routerClass,
+                              partOf, part, rings, done, windowLength,
+                              jsonPayloads=network.jsonPayloads,
+                              latencyMultiplier=network.latencyMultiplier,
+                              seed=network.seed)
+    worker.runVirtual(printRoutes=False)
+    results.put(worker.routeStore.snapshot())
+
+
+def runPartitioned(network):
+    """Run network's simulation in network.workers processes and record the
+       routes they found in network's route store"""
+    with open(network.netJsonFilepath) as f:
+        netJson = json_load_byteified(f)
+    partOf = partition(netJson, network.workers)
+    parts = max(partOf.values()) + 1
+    windowLength = lookahead(netJson, partOf, network.latencyMultiplier)
+    if windowLength is None:
+        # nothing crosses partitions, so each worker can run straight through
+        windowLength = float("inf")
+    assert windowLength > 0, "links between partitions need a latency"
+    # a ring each way between partitions that share a link
+    rings = {}
+    for link in allLinks(netJson):
+        a, b = partOf[link[0]], partOf[link[1]]
+        if a != b and (a, b) not in rings:
+            rings[(a, b)] = RingBuffer()
+            rings[(b, a)] = RingBuffer()
+    done = multiprocessing.RawArray("l", parts)
+    results = multiprocessing.Queue()
+    # workers are forked, so network and the router class aren't pickled
+    workers = [multiprocessing.Process(
+                   target=runWorker,
+                   args=(network, part, partOf, rings, done, windowLength,
+                         results))
+               for part in range(parts)]
+    for worker in workers:
+        worker.start()
+    snapshots = []
+    try:
+        while len(snapshots) < len(workers):
+            try:
+                snapshots.append(results.get(timeout=1))
+            except Queue.Empty:
+                # the others would wait forever on a worker that died
+                if any(worker.exitcode for worker in workers):
+                    raise RuntimeError("a partition worker failed")
+    finally:
+        for worker in workers:
+            if worker.exitcode:
+                for other in workers:
+                    other.terminate()
+                break
+        for worker in workers:
+            worker.join()
+    network.resetRoutes()
+    for routes in snapshots:
+        for (src, dst), (route, _, timeMillisecs) in routes.iteritems():
+            network.routeStore.update(src, dst, route, timeMillisecs)
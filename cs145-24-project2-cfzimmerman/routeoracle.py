@@ -0,0 +1,271 @@
+import sys
+import json
+import heapq
+import argparse
+from collections import OrderedDict
+
+try:
+    import numpy
+    from scipy.sparse import csr_matrix
+    from scipy.sparse.csgraph import dijkstra
+except ImportError:
+    numpy = None
+
+
+"""
+Computes the correct routes of a network simulation config from its links
+and changes: every lowest-cost route, with all equal-cost alternatives,
+between each pair of clients, for each phase of the change timeline.
+
+    python2 routeoracle.py 04_pg244_net_events.json --check
+    python2 routeoracle.py big.json --write
+
+For each client the distance from every node to it is found in one batch:
+scipy's Dijkstra over a sparse matrix when numpy and scipy are installed,
+otherwise repeated Dijkstra in pure Python (or with --pure-python). A route
+then follows the edges whose cost plus the distance left equals the distance
+before them. Clients never forward, so routes only pass through routers.
+
+Every lowest-cost route is listed. Unit-cost grids and fat-trees can have
+exponentially many per pair, so --max-paths caps them for size and speed:
+a pair with more routes than the cap is an error rather than a silently
+shorter list, since Network would then grade correct routers as failing.
+
+--write stores the final phase's routes as correctRoutes, which is what
+Network checks at the end of a run, along with every phase's routes as
+phaseRoutes and the most expensive route's cost as maxPathCost. --check
+compares correctRoutes already in the config with the computed ones, after
+parsing both with Network.parseCorrectRoutes.
+"""
+
+
+def phases(config):
+    """Yields (startTime, links) for each phase of the change timeline, links
+       being the config's link lists that are up during it"""
+    links = OrderedDict(((link[0], link[1]), link) for link in config["links"])
+    changes = sorted(config.get("changes", []), key=lambda change: change[0])
+    startTime = 0
+    for changeTime, target, change in changes:
+        if changeTime != startTime:
+            yield startTime, links.values()
+            startTime = changeTime
+        if change == "up":
+            links[(target[0], target[1])] = target
+        elif change == "down":
+            links.pop((target[0], target[1]), None)
+    yield startTime, links.values()
+
+
+def edgeArrays(nodes, clients, links):
+    """Returns (tails, heads, costs) of the directed edges of links, and
+       {client: [(router index, cost)]} of the clients' outgoing edges, which
+       are kept apart so no route passes through a client"""
+    index = {addr: i for i, addr in enumerate(nodes)}
+    edges = {}
+    uplinks = {client: [] for client in clients}
+    for addr1, addr2, _, _, c12, c21 in links:
+        for tail, head, cost in ((addr1, addr2, c12), (addr2, addr1, c21)):
+            if tail in uplinks:
+                uplinks[tail].append((index[head], cost))
+            else:
+                key = (index[tail], index[head])
+                edges[key] = min(cost, edges.get(key, cost))
+    tails = [tail for tail, _ in edges]
+    heads = [head for _, head in edges]
+    return tails, heads, edges.values(), uplinks
+
+
+def distancesToPython(n, tails, heads, costs, targets):
+    """Returns, for each target, the list of distances from every node to it,
+       by Dijkstra over the reversed edges"""
+    reverse = [[] for _ in xrange(n)]
+    for tail, head, cost in zip(tails, heads, costs):
+        reverse[head].append((tail, cost))
+    rows = []
+    for target in targets:
+        dist = [float("inf")] * n
+        dist[target] = 0
+        heap = [(0, target)]
+        while heap:
+            d, node = heapq.heappop(heap)
+            if d > dist[node]:
+                continue
+            for tail, cost in reverse[node]:
+                if d + cost < dist[tail]:
+                    dist[tail] = d + cost
+                    heapq.heappush(heap, (d + cost, tail))
+        rows.append(dist)
+    return rows
+
+
+def tightEdgesPython(tails, heads, costs, dist):
+    """Returns {node: [next nodes]} of the edges on shortest paths to the
+       target dist was computed for"""
+    tight = {}
+    for tail, head, cost in zip(tails, heads, costs):
+        if dist[head] + cost == dist[tail] < float("inf"):
+            tight.setdefault(tail, []).append(head)
+    return tight
+
+
+def distancesToNumpy(n, tails, heads, costs, targets):
+    """distancesToPython in one batched scipy call"""
+    # reversed, so each target's row holds the distances to it
+    graph = csr_matrix((numpy.array(costs, dtype=float), (heads, tails)),
+                       shape=(n, n))
+    return dijkstra(graph, directed=True, indices=targets)
+
+
+def tightEdgesNumpy(tails, heads, costs, dist):
+    """tightEdgesPython with the edge test vectorized"""
+    tails, heads = numpy.asarray(tails), numpy.asarray(heads)
+    mask = ((dist[heads] + numpy.asarray(costs) == dist[tails]) &
+            numpy.isfinite(dist[tails]))
+    tight = {}
+    for tail, head in zip(tails[mask].tolist(), heads[mask].tolist()):
+        tight.setdefault(tail, []).append(head)
+    return tight
+
+
+def computeRoutes(routers, clients, links, maxPaths=None, purePython=False):
+    """Returns (correctRoutes, maxPathCost) for the topology made by links:
+       every lowest-cost route between each pair of clients, and the cost of
+       the most expensive pair.  Raises ValueError if a pair has more than
+       maxPaths routes (None for no limit)"""
+    nodes = list(routers) + list(clients)
+    tails, heads, costs, uplinks = edgeArrays(nodes, clients, links)
+    targets = range(len(routers), len(nodes))
+    if numpy is None or purePython:
+        distancesTo, tightEdges = distancesToPython, tightEdgesPython
+    else:
+        distancesTo, tightEdges = distancesToNumpy, tightEdgesNumpy
+    allDist = distancesTo(len(nodes), tails, heads, costs, targets)
+
+    routes = []
+    maxPathCost = 0
+    for target, dist in zip(targets, allDist):
+        tight = tightEdges(tails, heads, costs, dist)
+        for src in sorted(clients):
+            best = min([cost + dist[r] for r, cost in uplinks[src]] or
+                       [float("inf")])
+            if best == float("inf"):
+                continue
+            maxPathCost = max(maxPathCost, int(best))
+            paths = []
+            for first, cost in uplinks[src]:
+                if cost + dist[first] == best:
+                    walkPaths(tight, first, target, [first], paths, maxPaths)
+            if maxPaths is not None and len(paths) > maxPaths:
+                raise ValueError(
+                    "{} -> {}: more than {} lowest-cost routes; raise "
+                    "--max-paths".format(src, nodes[target], maxPaths))
+            routes.extend([src] + [nodes[i] for i in path] for path in paths)
+    routes.sort()
+    return routes, maxPathCost
+
+
+def walkPaths(tight, node, target, path, paths, maxPaths):
+    """Appends to paths every path from node to target along tight edges,
+       stopping once there are more than maxPaths (None for no limit)"""
+    if node == target:
+        paths.append(list(path))
+        return
+    for nxt in tight.get(node, ()):
+        if maxPaths is not None and len(paths) > maxPaths:
+            return
+        path.append(nxt)
+        walkPaths(tight, nxt, target, path, paths, maxPaths)
+        path.pop()
+
+
+def phaseRoutes(config, maxPaths=None, purePython=False):
+    """Returns [(startTime, correctRoutes, maxPathCost)] for each phase of
+       the config's change timeline"""
+    return [(startTime,) + computeRoutes(config["routers"], config["clients"],
+                                         links, maxPaths, purePython)
+            for startTime, links in phases(config)]
+
+
+def checkRoutes(config, computed):
+    """Compares the config's correctRoutes with computed routes, both parsed
+       by Network.parseCorrectRoutes.  Returns a list of problems"""
+    from network import Network
+    expected = Network.parseCorrectRoutes(config["correctRoutes"])
+    actual = Network.parseCorrectRoutes(computed)
+    problems = []
+    for src in config["clients"]:
+        for dst in config["clients"]:
+            if (src, dst) not in actual:
+                problems.append("{} -> {}: unreachable".format(src, dst))
+            elif expected.get((src, dst)) != actual[(src, dst)]:
+                problems.append("{} -> {}: config has {}, computed {}".format(
+                    src, dst, sorted(expected.get((src, dst), ())),
+                    sorted(actual[(src, dst)])))
+    return problems
+
+
+def formatConfig(config):
+    """json for config in the layout of the bundled configs: one key per
+       line, lists of lists with one item per line"""
+    entries = []
+    for key, value in config.iteritems():
+        if isinstance(value, list) and value and isinstance(value[0], list):
+            items = ",\n".join("    " + json.dumps(item) for item in value)
+            text = "[\n{}\n  ]".format(items)
+        elif isinstance(value, dict):
+            text = json.dumps(value, indent=2).replace("\n", "\n  ")
+        else:
+            text = json.dumps(value)
+        entries.append("  {}: {}".format(json.dumps(key), text))
+    return "{\n" + ",\n\n".join(entries) + "\n}\n"
+
+
+def parseArgs(argv):
+    parser = argparse.ArgumentParser(
+        description="Compute the correct routes of a network config")
+    parser.add_argument("config")
+    parser.add_argument("--write", action="store_true",
+                        help="store the routes in the config")
+    parser.add_argument("--check", action="store_true",
+                        help="compare with the config's correctRoutes")
+    parser.add_argument("--max-paths", type=int, default=None,
+                        help="fail if a client pair has more equal-cost "
+                        "routes than this (default: list them all)")
+    parser.add_argument("--pure-python", action="store_true",
+                        help="do not use numpy and scipy")
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parseArgs(sys.argv[1:])
+    with open(args.config) as f:
+        config = json.load(f, object_pairs_hook=OrderedDict)
+    try:
+        results = phaseRoutes(config, args.max_paths, args.pure_python)
+    except ValueError as e:
+        sys.exit("{}: {}".format(args.config, e))
+    for startTime, routes, maxPathCost in results:
+        print "phase from t={}: {} routes, max cost {}".format(
+            startTime, len(routes), maxPathCost)
+    _, finalRoutes, maxPathCost = results[-1]
+    status = 0
+    if args.check:
+        problems = checkRoutes(config, finalRoutes)
+        for problem in problems:
+            print problem
+        print "{}: correctRoutes {}".format(
+            args.config, "differ" if problems else "match")
+        status = 1 if problems else 0
+    if args.write:
+        config["correctRoutes"] = finalRoutes
+        config["phaseRoutes"] = [{"startTime": startTime,
+                                  "correctRoutes": routes}
+                                 for startTime, routes, _ in results]
+        config["maxPathCost"] = maxPathCost
+        with open(args.config, "w") as f:
+            f.write(formatConfig(config))
+    sys.exit(status)
+
+
+if __name__ == "__main__":
+    main()
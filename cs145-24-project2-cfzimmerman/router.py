@@ -2,6 +2,8 @@ import time
 import sys
 import thread
 import Queue
+import zlib
+from codec import JsonCodec
 
 
 class Router:
@@ -10,12 +12,28 @@ class Router:
        Subclass this class and override the "handle..." methods
        to implement routing algorithm functionality"""
 
+    # Milliseconds between ("time", timeMillisecs) inbox entries, which
+    # the network schedules to drive handleTime.  Packets and link changes
+    # wake the router as soon as they arrive, but handleTime keeps this
+    # regular tick rather than running only at heartbeat deadlines: the
+    # router API promises it is called regularly, and routers keep their
+    # timers (heartbeats, pacing, damping, LSA aging) by checking the time
+    # it is given instead of telling the network when they next need it
+    HANDLE_TIME_INTERVAL = 100
+
+    # Encodes and decodes routing payloads (see codec.py).  Network replaces
+    # this with a StructCodec built from its config unless asked for json
+    codec = JsonCodec()
+
 
     def __init__(self, addr, heartbeatTime=None):
-        """Initialize Router address and threadsafe queue for link changes"""
+        """Initialize Router address and threadsafe inbox for link changes
+           and arriving packets"""
         self.addr = addr       # address of router
         self.links = {}        # links indexed by port
-        self.linkChanges = Queue.Queue()
+        self.inbox = Queue.Queue()
+        self.inboxCallback = None  # called after each inbox put if set
+        self.metrics = None  # metrics.Metrics timing the handlers, if set
         self.keepRunning = True
 
 
@@ -23,49 +41,133 @@ class Router:
         """Add, remove, or change the cost of a link.
            The change argument is a tuple with first element
            'add', or 'remove' """
-        self.linkChanges.put(change)
+        self.putInbox(("change", change))
+
+
+    def putInbox(self, item):
+        """Queue a link change or arriving packet for the main loop"""
+        self.inbox.put(item)
+        if self.inboxCallback:
+            self.inboxCallback()
 
 
     def addLink(self, port, endpointAddr, link, cost):
         """Add new link to router"""
         if port in self.links:
             self.removeLink(port)
-        self.links[port] = link
+        self.attachLink(port, link)
         self.handleNewLink(port, endpointAddr, cost)
 
 
+    def attachLink(self, port, link):
+        """Put link on port and have its packets arrive in the inbox, without
+           telling the routing algorithm"""
+        self.links[port] = link
+        link.setReceiver(self.addr, lambda packet:
+                         self.putInbox(("packet", port, link, packet)))
+
+
     def removeLink(self, port):
         """Remove link from router"""
+        if port in self.links:
+            self.links[port].setReceiver(self.addr, None)
         self.links = {p:link for p,link in self.links.iteritems() if p != port}
         self.handleRemoveLink(port)
 
 
+    # fields that belong to the running simulation rather than the routing
+    # algorithm, left out of getState
+    RUNTIME_FIELDS = ("links", "inbox", "inboxCallback", "metrics", "codec",
+                      "keepRunning")
+
+    def getState(self):
+        """Returns the routing algorithm's state as a picklable dict, for
+           network snapshots.  Links are saved by the network"""
+        return {name: value for name, value in vars(self).iteritems()
+                if name not in self.RUNTIME_FIELDS}
+
+
+    def setState(self, state):
+        """Restore state from getState"""
+        self.__dict__.update(state)
+
+
     def runRouter(self):
-        """Main loop of router"""
+        """Main loop of router.  Blocks on the inbox until a link change,
+           packet, or handleTime deadline arrives, then handles everything
+           pending"""
         while self.keepRunning:
-            time.sleep(0.1)
-            timeMillisecs = int(round(time.time() * 1000))
+            self.handleInboxItem(self.inbox.get())
+            self.drainInbox()
+
+
+    def drainInbox(self):
+        """Apply every pending link change and handle every pending packet.
+           Called by runRouter, or by the network in virtual-time mode"""
+        while True:
             try:
-                change = self.linkChanges.get_nowait()
-                if change[0] == "add":
-                    self.addLink(*change[1:])
-                elif change[0] == "remove":
-                    self.removeLink(*change[1:])
+                item = self.inbox.get_nowait()
             except Queue.Empty:
-                pass
-            for port in self.links.keys():
-                packet = self.links[port].recv(self.addr)
-                if packet:
+                return
+            self.handleInboxItem(item)
+
+
+    def handleInboxItem(self, item):
+        """Dispatch one inbox entry to the link change, packet or time
+           handlers"""
+        if item[0] == "time":
+            if self.metrics is None:
+                self.handleTime(item[1])
+            else:
+                self.timeHandler("handleTime", self.handleTime, item[1])
+        elif item[0] == "change":
+            change = item[1]
+            if change[0] == "add":
+                self.addLink(*change[1:])
+            elif change[0] == "remove":
+                self.removeLink(*change[1:])
+        elif item[0] == "packet":
+            _, port, link, packet = item
+            # drop packets from links that went down while in flight
+            if self.links.get(port) is link:
+                if self.metrics is None:
                     self.handlePacket(port, packet)
-            self.handleTime(timeMillisecs)
+                else:
+                    self.timeHandler("handlePacket", self.handlePacket,
+                                     port, packet)
+            else:
+                self.countDrop(packet)
+
+
+    def timeHandler(self, name, handler, *args):
+        """Call handler(*args) and record how long it took in metrics"""
+        start = time.time()
+        handler(*args)
+        self.metrics.recordHandler(self.addr, name, time.time() - start)
+
+
+    def countUpdates(self, requests, sent):
+        """Record routing updates the algorithm asked to send and ones it
+           sent in metrics, if set"""
+        if self.metrics is not None:
+            self.metrics.countUpdates(self.addr, requests, sent)
+
+
+    def countDrop(self, packet):
+        """Record a dropped packet in metrics, if set.  Only traceroutes
+           count"""
+        if self.metrics is not None and packet.isTraceroute():
+            self.metrics.countDrop()
 
 
     def send(self, port, packet):
         """Send a packet out given port"""
         try:
-            self.links[port].send(packet, self.addr)
+            link = self.links[port]
         except KeyError:
-            pass
+            self.countDrop(packet)
+            return
+        link.send(packet, self.addr)
 
 
     def handlePacket(self, port, packet):
@@ -74,6 +176,25 @@ class Router:
         self.send(port, packet)
 
 
+    def forwardPort(self, srcAddr, dstAddr, inPort):
+        """Returns the port a traceroute packet from srcAddr to dstAddr that
+           arrived on inPort is sent out of, or None if it is dropped.
+           Read-only: the network calls this to walk routes through the
+           forwarding state without sending packets"""
+        # default implementation sends packet back out the port it arrived
+        return inPort
+
+
+    def pickPort(self, srcAddr, dstAddr, ports):
+        """Returns one of ports, equal-cost next hops to dstAddr, for
+           traceroutes from srcAddr: always the same one for a (src, dst)
+           pair, spread across pairs by a hash.  The hash includes this
+           router's address so routers along a path don't all make the
+           same choice"""
+        key = "{} {} {}".format(srcAddr, dstAddr, self.addr)
+        return ports[zlib.crc32(key) % len(ports)]
+
+
     def handleNewLink(self, port, endpoint, cost):
         """handle new link"""
         pass
@@ -0,0 +1,85 @@
+import threading
+
+
+class NoLock:
+    """Stands in for a lock when only one thread uses the store"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class RouteStore:
+    """Latest route found for each (src, dst) pair of clients, and whether
+       it is one of the correct routes.
+
+       Correct routes are kept as sets of tuples, so checking a route is a
+       hash lookup rather than a comparison against every correct route.
+       Routes are sharded by source client, each shard with its own lock, so
+       clients reporting routes from different sources do not wait on each
+       other.  When the network runs on a single thread (virtual time or the
+       event loop) the locks are skipped entirely.
+
+       A route only replaces one recorded at the same millisecond if the
+       store is ordered, i.e. updates are made in the order they happen, as
+       on a single thread.  Threaded clients read the clock before taking
+       the lock, so there the first route recorded in a millisecond is
+       kept, as the simulator always did"""
+
+    def __init__(self, correctRoutes, sources, locking=True, ordered=False):
+        """correctRoutes maps (src, dst) to a set of route tuples.  sources
+           are the client addresses routes can start from"""
+        self.correctRoutes = correctRoutes
+        self.locking = locking
+        self.ordered = ordered
+        # : Dict[Addr, (lock, Dict[Addr, (route, isGood, timeMillisecs)])]
+        self.shards = {}
+        for src in sources:
+            self.shards[src] = (self.newLock(), {})
+
+
+    def newLock(self):
+        return threading.Lock() if self.locking else NoLock()
+
+
+    def pairs(self):
+        """Returns the (src, dst) pairs that have correct routes"""
+        return self.correctRoutes.keys()
+
+
+    def isCorrect(self, src, dst, route):
+        return tuple(route) in self.correctRoutes.get((src, dst), ())
+
+
+    def update(self, src, dst, route, timeMillisecs):
+        """Record route unless a newer one is already recorded.  Returns
+           whether route is correct"""
+        isGood = self.isCorrect(src, dst, route)
+        lock, routes = self.shards[src]
+        with lock:
+            current = routes.get(dst)
+            if (current is None or timeMillisecs > current[2] or
+                    self.ordered and timeMillisecs == current[2]):
+                routes[dst] = (route, isGood, timeMillisecs)
+        return isGood
+
+
+    def snapshot(self):
+        """Returns {(src, dst): (route, isGood, timeMillisecs)}, copying one
+           shard at a time"""
+        routes = {}
+        for src, (lock, shard) in self.shards.iteritems():
+            with lock:
+                items = shard.items()
+            for dst, entry in items:
+                routes[(src, dst)] = entry
+        return routes
+
+
+    def reset(self):
+        """Forget every recorded route"""
+        for lock, shard in self.shards.itervalues():
+            with lock:
+                shard.clear()
@@ -0,0 +1,269 @@
+import sys
+import os
+import json
+import time
+import random
+import hashlib
+import inspect
+import resource
+import argparse
+import multiprocessing
+from collections import defaultdict
+from network import Network, ROUTER_CLASSES, loadRouterClass
+
+
+"""
+Runs a matrix of scenarios, configs x router classes x seeds x latency
+multipliers, in a process pool on the virtual clock, and prints one table of
+pass rates, convergence times and routing overhead.  A seed sets the phase of
+each router's and client's handleTime ticks (see Network.scheduleHandleTime).
+
+    python2 runner.py 0*_net*.json --routers DV LS --seeds 1 2 3 \\
+        --latency 50 100 --jobs 4 --csv results.csv
+
+Each scenario's result is cached under --cache, keyed by a hash of the
+config, the source of the simulator (this file, network.py and every
+project module it uses), the source of the router class and every project
+module it uses, the seed, the latency multiplier and the oracle setting, so
+rerunning after changing one router only reruns that router's scenarios,
+and changing the simulator or its metrics reruns everything.
+"""
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def withInfinity(routerClass, infinity):
+    """Returns routerClass, or a subclass with INF raised to infinity when
+       the router has an INF below it.  Generated configs record their most
+       expensive route as maxPathCost, which can exceed the INF of 16"""
+    if getattr(routerClass, "INF", infinity) >= infinity:
+        return routerClass
+
+    class Router(routerClass):
+        INF = infinity
+    return Router
+
+
+def runVirtual(config, routerClass, **kwargs):
+    """Runs config in virtual time with routerClass (or the name of one),
+       its INF raised above the config's maxPathCost, passing kwargs on to
+       Network.  Returns the finished Network"""
+    if isinstance(routerClass, str):
+        routerClass = loadRouterClass(routerClass)
+    with open(config) as f:
+        maxPathCost = json.load(f).get("maxPathCost", 0)
+    net = Network(config, withInfinity(routerClass, maxPathCost + 1),
+                  virtual=True, **kwargs)
+    net.runVirtual(printRoutes=False)
+    return net
+
+
+def slowestChange(report):
+    """Returns the slowest convergence after a link change in a metrics
+       report, or None if there were no changes or one never converged"""
+    converged = [change["convergedMs"] for change in report["changes"][1:]]
+    if not converged or None in converged:
+        return None
+    return max(converged)
+
+
+def projectModules(module, seen=None):
+    """Returns the project modules module uses, itself included, following
+       the modules and classes in each one's globals"""
+    seen = set() if seen is None else seen
+    path = getattr(module, "__file__", None)
+    if (module.__name__ in seen or path is None or
+            os.path.dirname(os.path.abspath(path)) != PROJECT_DIR):
+        return seen
+    seen.add(module.__name__)
+    for value in vars(module).values():
+        used = inspect.getmodule(value)
+        if used is not None:
+            projectModules(used, seen)
+    return seen
+
+
+def sourceHash(routerName):
+    """Hash of the source of this runner, of the simulator and of the router
+       class, with the project modules each uses"""
+    routerClass = loadRouterClass(routerName)
+    names = projectModules(sys.modules[Network.__module__])
+    projectModules(sys.modules[routerClass.__module__], names)
+    paths = set(inspect.getsourcefile(sys.modules[name]) for name in names)
+    paths.add(inspect.getsourcefile(sys.modules[__name__]))
+    digest = hashlib.sha1()
+    for path in sorted(paths, key=os.path.basename):
+        with open(path) as f:
+            digest.update(os.path.basename(path) + "\0" + f.read())
+    return digest.hexdigest()
+
+
+def scenarioKey(scenario, routerHash):
+    """Cache key for one scenario"""
+    with open(scenario["config"]) as f:
+        configHash = hashlib.sha1(f.read()).hexdigest()
+    key = [configHash, routerHash, scenario["router"], scenario["seed"],
+           scenario["latency"], scenario["oracle"]]
+    return hashlib.sha1(json.dumps(key)).hexdigest()
+
+
+def runScenario(scenario):
+    """Runs one scenario on the virtual clock with metrics.  Returns a result
+       dict"""
+    # the seed sets the phase of every node's handleTime ticks, and which
+    # clients are sampled in oracle mode
+    random.seed(scenario["seed"])
+    start = time.time()
+    net = runVirtual(scenario["config"], scenario["router"], metrics=True,
+                     oracle=scenario["oracle"],
+                     latencyMultiplier=scenario["latency"],
+                     seed=scenario["seed"])
+    report = net.metrics.report()
+    result = dict(scenario)
+    result.update({
+        "routers": len(net.routers),
+        "passed": net.allRoutesCorrect(),
+        "startMs": report["changes"][0]["convergedMs"],
+        "changeMs": slowestChange(report),
+        "messages": report["totals"]["packets"] / float(len(net.routers)),
+        "bytes": report["totals"]["bytes"] / float(len(net.routers)),
+        # triggered updates coalesced by the routers' pacing
+        "savedUpdates": report["totals"]["savedUpdates"] /
+            float(len(net.routers)),
+        "handlerSeconds": report["totals"]["handlerSeconds"],
+        "wallSeconds": time.time() - start,
+        "peakRssMb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0,
+    })
+    return result
+
+
+def runAll(scenarios, jobs, cacheDir):
+    """Runs scenarios in a pool of jobs processes, skipping those with a
+       cached result.  Returns results in scenario order"""
+    routerHashes = {name: sourceHash(name)
+                    for name in set(s["router"] for s in scenarios)}
+    results = [None] * len(scenarios)
+    pending = []
+    for i, scenario in enumerate(scenarios):
+        key = scenarioKey(scenario, routerHashes[scenario["router"]])
+        path = os.path.join(cacheDir, key + ".json") if cacheDir else None
+        if path and os.path.exists(path):
+            with open(path) as f:
+                results[i] = json.load(f)
+                results[i]["cached"] = True
+        else:
+            pending.append((i, path))
+    # a fresh process per scenario keeps each peak RSS separate
+    pool = multiprocessing.Pool(jobs, maxtasksperchild=1)
+    try:
+        runs = pool.imap(runScenario, [scenarios[i] for i, _ in pending])
+        for (i, path), result in zip(pending, runs):
+            result["cached"] = False
+            results[i] = result
+            if path:
+                with open(path, "w") as f:
+                    json.dump(result, f)
+    finally:
+        pool.close()
+        pool.join()
+    return results
+
+
+def mean(values):
+    return sum(values) / float(len(values)) if values else None
+
+
+def aggregate(results):
+    """Groups results by (config, router, latency) over seeds.  Returns a
+       sorted list of summary rows"""
+    groups = defaultdict(list)
+    for r in results:
+        groups[(os.path.basename(r["config"]), r["router"],
+                r["latency"])].append(r)
+    rows = []
+    for (config, router, latency), runs in sorted(groups.items()):
+        changeMs = [r["changeMs"] for r in runs if r["changeMs"] is not None]
+        rows.append({
+            "config": config, "router": router, "latency": latency,
+            "passed": sum(1 for r in runs if r["passed"]), "runs": len(runs),
+            "startMs": mean([r["startMs"] for r in runs
+                             if r["startMs"] is not None]),
+            "changeMs": mean(changeMs),
+            "maxChangeMs": max(changeMs) if changeMs else None,
+            "messages": mean([r["messages"] for r in runs]),
+            "bytes": mean([r["bytes"] for r in runs]),
+            "savedUpdates": mean([r["savedUpdates"] for r in runs]),
+            "wallSeconds": sum(r["wallSeconds"] for r in runs),
+            "cached": sum(1 for r in runs if r["cached"]),
+        })
+    return rows
+
+
+def formatTable(rows):
+    fmt = "{:<26}{:<4}{:>8}{:>8}{:>10}{:>11}{:>10}{:>10}{:>11}{:>11}{:>9}{:>8}"
+    show = lambda v: "-" if v is None else "{:.0f}".format(v)
+    lines = [fmt.format("config", "", "latency", "passed", "start ms",
+                        "change ms", "max ms", "msgs/rtr", "bytes/rtr",
+                        "saved/rtr", "wall s", "cached")]
+    for row in rows:
+        lines.append(fmt.format(
+            row["config"], row["router"], row["latency"],
+            "{}/{}".format(row["passed"], row["runs"]), show(row["startMs"]),
+            show(row["changeMs"]), show(row["maxChangeMs"]),
+            show(row["messages"]), show(row["bytes"]),
+            show(row["savedUpdates"]),
+            "{:.1f}".format(row["wallSeconds"]), row["cached"]))
+    return "\n".join(lines)
+
+
+def writeCsv(results, path):
+    """One row per scenario"""
+    columns = ["config", "router", "seed", "latency", "oracle", "routers",
+               "passed", "startMs", "changeMs", "messages", "bytes",
+               "savedUpdates", "handlerSeconds", "wallSeconds", "peakRssMb", "cached"]
+    with open(path, "wb") as f:
+        f.write(",".join(columns) + "\n")
+        for r in results:
+            f.write(",".join(str(r[c]) for c in columns) + "\n")
+
+
+def parseArgs(argv):
+    parser = argparse.ArgumentParser(
+        description="Run network simulations in parallel")
+    parser.add_argument("configs", nargs="+")
+    parser.add_argument("--routers", nargs="+", default=["DV", "LS"],
+                        choices=sorted(ROUTER_CLASSES))
+    parser.add_argument("--seeds", nargs="+", type=int, default=[0],
+                        help="seeds for the phase of the nodes' ticks")
+    parser.add_argument("--latency", nargs="+", type=int, default=[100],
+                        help="latency multipliers (ms per unit of cost)")
+    parser.add_argument("--oracle", action="store_true",
+                        help="check routes through forwarding state")
+    parser.add_argument("--jobs", type=int,
+                        default=multiprocessing.cpu_count())
+    parser.add_argument("--cache", default=".runcache",
+                        help="result cache directory ('' to disable)")
+    parser.add_argument("--csv", help="also write every scenario to this file")
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parseArgs(sys.argv[1:])
+    scenarios = [{"config": os.path.abspath(config), "router": router,
+                  "seed": seed, "latency": latency, "oracle": args.oracle}
+                 for config in args.configs
+                 for router in args.routers
+                 for seed in args.seeds
+                 for latency in args.latency]
+    if args.cache and not os.path.isdir(args.cache):
+        os.makedirs(args.cache)
+    results = runAll(scenarios, args.jobs, args.cache)
+    print formatTable(aggregate(results))
+    if args.csv:
+        writeCsv(results, args.csv)
+    if not all(r["passed"] for r in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import heapq
+import threading
+import time
+
+
+class DelayScheduler(threading.Thread):
+    """Real-time counterpart of eventsim.EventScheduler.  Holds delayed
+       callbacks (e.g. packets in flight on links) in a deadline heap and
+       runs each one on this single thread once its deadline passes, so
+       sending a packet does not need a thread of its own"""
+
+    def __init__(self):
+        """Create an empty deadline heap.  Call start() to begin servicing it"""
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.events = []
+        self.counter = 0
+        self.cond = threading.Condition()
+        self.keepRunning = True
+
+
+    def now(self):
+        """Returns the current time in milliseconds"""
+        return int(round(time.time() * 1000))
+
+
+    def schedule(self, delay, callback, *args):
+        """Run callback(*args) delay milliseconds from now"""
+        deadline = time.time() + delay/float(1000)
+        self.cond.acquire()
+        heapq.heappush(self.events, (deadline, self.counter, callback, args))
+        self.counter += 1
+        # only the earliest deadline changes how long run() should sleep
+        if self.events[0][1] == self.counter - 1:
+            self.cond.notify()
+        self.cond.release()
+
+
+    def schedulePeriodic(self, period, callback, *args):
+        """Run callback(*args) every period milliseconds, starting one
+           period from now"""
+        def fire():
+            callback(*args)
+            self.schedule(period, fire)
+        self.schedule(period, fire)
+
+
+    def run(self):
+        """Wait for the earliest deadline, then run its callback"""
+        self.cond.acquire()
+        while self.keepRunning:
+            if not self.events:
+                self.cond.wait()
+                continue
+            waitTime = self.events[0][0] - time.time()
+            if waitTime > 0:
+                self.cond.wait(waitTime)
+                continue
+            _, _, callback, args = heapq.heappop(self.events)
+            self.cond.release()
+            callback(*args)
+            self.cond.acquire()
+        self.cond.release()
+
+
+    def pending(self):
+        """Returns the number of callbacks waiting to run"""
+        return len(self.events)
+
+
+    def join(self, timeout=None):
+        self.cond.acquire()
+        self.keepRunning = False
+        self.cond.notify()
+        self.cond.release()
+        super(DelayScheduler, self).join(timeout)
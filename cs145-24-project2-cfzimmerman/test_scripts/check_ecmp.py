@@ -0,0 +1,77 @@
+import sys
+import os
+from collections import defaultdict
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))  # noqa: E402
+sys.path.insert(0, parent_dir)  # noqa: E402
+import topogen
+from network import Network, loadRouterClass
+
+# python2 test_scripts/check_ecmp.py [k]
+# Runs DVrouter and LSrouter on a unit-cost k-ary fat-tree (k = 4 by
+# default) in virtual time, with and without equal-cost multipath, and
+# records the route of every traceroute that arrives in the second half of
+# the run, once routing has converged. Checks that each (source,
+# destination) pair takes the same route on every one of its traceroutes,
+# and that multipath spreads the pairs over more links than single-path
+# forwarding does.
+# Exits with an AssertionError on the first failure.
+
+
+class RecordingNetwork(Network):
+    """Network that keeps every route traceroutes took after half of
+       endTime"""
+
+    def __init__(self, *args, **kwargs):
+        Network.__init__(self, *args, **kwargs)
+        # : Dict[(Addr, Addr), Set[Tuple[Addr, ...]]]
+        self.seen = defaultdict(set)
+        self.traceroutes = 0
+
+    def updateRoute(self, src, dst, route):
+        Network.updateRoute(self, src, dst, route)
+        # clients record an empty route when they send a traceroute
+        if route and self.currentTime() >= self.endTime / 2:
+            self.seen[(src, dst)].add(tuple(route))
+            self.traceroutes += 1
+
+
+def run(config, name, ecmp):
+    """Returns the RecordingNetwork after running config with the router
+       class called name"""
+    class Router(loadRouterClass(name)):
+        USE_ECMP = ecmp
+    net = RecordingNetwork(config, Router, virtual=True)
+    net.runVirtual(printRoutes=False)
+    return net
+
+
+def links(routes):
+    """Returns the links the routes cross"""
+    return set(hop for route in routes for hop in zip(route, route[1:]))
+
+
+def main():
+    k = sys.argv[1] if len(sys.argv) > 1 else "4"
+    config, = topogen.writeConfigs([["fattree", "-k", k, "--max-cost", "1"]])
+    for name in ("DV", "LS"):
+        used = {}
+        for ecmp in (False, True):
+            net = run(config, name, ecmp)
+            assert net.allRoutesCorrect(), (name, ecmp)
+            # sendRate ticks in the second half, so at least two rounds
+            pairs = len(net.clients) ** 2
+            assert len(net.seen) == pairs, (name, ecmp, len(net.seen))
+            assert net.traceroutes >= 2 * pairs, (name, ecmp)
+            for pair, routes in net.seen.iteritems():
+                assert len(routes) == 1, (name, ecmp, pair, routes)
+            used[ecmp] = links(
+                route for routes in net.seen.itervalues() for route in routes)
+        assert len(used[True]) > len(used[False]), (name, used)
+        print "{}: every pair kept one route over {} traceroutes; {} links " \
+            "used with ECMP, {} without".format(
+                name, net.traceroutes, len(used[True]), len(used[False]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+import sys
+import os
+import heapq
+import pickle
+import random
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))  # noqa: E402
+sys.path.insert(0, parent_dir)  # noqa: E402
+from lsdb import CompactSpt, Row, node_id, node_addr, UNREACHABLE
+
+# python2 test_scripts/check_spt.py [seed] [trials]
+# Checks lsdb.CompactSpt against a plain Dijkstra over the same graph on
+# random graphs: edges changed one at a time (set_edge, remove_edge,
+# set_row) and rows replaced in batches (set_rows), with the tree pickled
+# and restored now and then. After every change it checks distances, next
+# hops, the tree's parent and child links, that every node whose next hop
+# moved was reported as changed, equal_cost_hops and alternates against
+# their definitions, and that update_equal_cost_hops reported every node
+# whose equal-cost hops changed. Exits with an AssertionError on the first
+# mismatch.
+
+
+def dijkstra(graph, src):
+    """Returns {node: distance} from src over graph {node: {node: cost}}"""
+    dist = {src: 0}
+    heap = [(0, src)]
+    while heap:
+        d, node = heapq.heappop(heap)
+        if d > dist[node]:
+            continue
+        for nxt, cost in graph.get(node, {}).iteritems():
+            if d + cost < dist.get(nxt, UNREACHABLE):
+                dist[nxt] = d + cost
+                heapq.heappush(heap, (d + cost, nxt))
+    return dist
+
+
+def check(spt, graph, nodes, prevHops, changed, prevEcmp):
+    """Checks spt against graph.  Returns the next hops and equal-cost
+       hops, for the next check's moved nodes"""
+    root = spt.root
+    dist = dijkstra(graph, root)
+    hops = {}
+    for node in nodes:
+        assert spt.dist[node] == dist.get(node, UNREACHABLE), node
+        parent = spt.parent[node]
+        if parent == -1:
+            assert node == root or node not in dist, node
+            assert spt.next_hop[node] == -1, node
+            continue
+        hops[node] = spt.next_hop[node]
+        assert spt.dist[node] == spt.dist[parent] + graph[parent][node]
+        assert hops[node] == (node if parent == root
+                              else spt.next_hop[parent]), node
+        children = []
+        child = spt.first_child[parent]
+        while child != -1:
+            children.append(child)
+            child = spt.next_sibling[child]
+        assert node in children, node
+    moved = set(node for node in set(hops) | set(prevHops)
+                if hops.get(node) != prevHops.get(node))
+    assert moved <= changed, moved - changed
+
+    # every neighbor on a shortest path, and the cheapest neighbor whose
+    # shortest path doesn't come back through the root
+    nbDist = {nb: dijkstra(graph, nb) for nb in graph.get(root, {})}
+    ecmpChanged = spt.update_equal_cost_hops()
+    ecmp = spt.equal_cost_hops()
+    for node in nodes:
+        assert (ecmp[node] == prevEcmp.get(node, ()) or
+                node in ecmpChanged), node
+    lfa = spt.alternates()
+    for node in nodes:
+        if node == root or node not in dist:
+            assert ecmp[node] == (), node
+            assert lfa[node] == -1, node
+            continue
+        want = set(nb for nb, cost in graph[root].iteritems()
+                   if cost + nbDist[nb].get(node, UNREACHABLE) == dist[node])
+        assert set(ecmp[node]) == want, node
+        best = None
+        for nb, cost in graph[root].iteritems():
+            d = nbDist[nb].get(node, UNREACHABLE)
+            if (nb == hops[node] or d == UNREACHABLE or
+                    d >= nbDist[nb].get(root, UNREACHABLE) + dist[node]):
+                continue
+            if best is None or cost + d < best:
+                best = cost + d
+        if best is None:
+            assert lfa[node] == -1, node
+        else:
+            assert lfa[node] != -1, node
+            assert (graph[root][lfa[node]] +
+                    nbDist[lfa[node]][node] == best), node
+    return hops, {node: ecmp[node] for node in nodes}
+
+
+def randomRow(rng, node, nodes, maxCost):
+    """Returns {node: cost} of up to 5 random edges out of node"""
+    return {nxt: rng.randint(1, maxCost)
+            for nxt in rng.sample(nodes, rng.randint(0, min(5, len(nodes))))
+            if nxt != node}
+
+
+def trial(rng, name, steps):
+    nodes = [node_id("{}.{}".format(name, i))
+             for i in range(rng.randint(2, 30))]
+    spt = CompactSpt(node_addr(nodes[0]))
+    graph = {}
+    hops = {}
+    ecmp = {}
+    # low costs make ties, and so equal-cost paths, common
+    maxCost = rng.choice([2, 9])
+    for step in range(steps):
+        if rng.random() < 0.5:
+            # replace a few rows at once
+            batch = {}
+            for _ in range(rng.randint(1, 6)):
+                node = rng.choice(nodes)
+                row = {} if rng.random() < 0.2 else randomRow(
+                    rng, node, nodes, maxCost)
+                graph[node] = row
+                batch[node] = Row(row.items()) if row else None
+            changed = spt.set_rows(batch)
+        else:
+            # change one row edge by edge, or all at once
+            node = rng.choice(nodes)
+            old = graph.get(node, {})
+            row = randomRow(rng, node, nodes, maxCost)
+            graph[node] = row
+            if rng.random() < 0.5:
+                changed = set()
+                for nxt in old:
+                    if nxt not in row:
+                        changed |= spt.remove_edge(node, nxt)
+                for nxt, cost in row.iteritems():
+                    changed |= spt.set_edge(node, nxt, cost)
+            else:
+                changed = spt.set_row(node, Row(row.items()) if row else None)
+        hops, ecmp = check(spt, graph, nodes, hops, changed, ecmp)
+        if step % 25 == 24:
+            spt = pickle.loads(pickle.dumps(spt, 2))
+            hops, ecmp = check(spt, graph, nodes, hops, set(nodes), ecmp)
+
+
+def main():
+    seed = int(sys.argv[1]) if len(sys.argv) > 1 else 0
+    trials = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    rng = random.Random(seed)
+    for i in range(trials):
+        trial(rng, "t{}.{}".format(seed, i), 100)
+    print "CompactSpt matches Dijkstra: {} trials, seed {}".format(
+        trials, seed)
+
+
+if __name__ == "__main__":
+    main()
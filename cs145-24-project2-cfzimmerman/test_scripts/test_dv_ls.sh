@@ -11,10 +11,10 @@
 # parse command line arguments
 if [ $# -eq 0 ]; then
   ROUTER="BOTH"
-elif [[ ( $# -eq 1 ) && ( $1 == "DV" || $1 == "LS" || $1 == "BOTH" ) ]]; then
+elif [[ ( $# -eq 1 ) && ( $1 == "DV" || $1 == "LS" || $1 == "HLS" || $1 == "PV" || $1 == "BOTH" ) ]]; then
   ROUTER=$1
 else
-  printf "Usage: $0 [DV|LS|BOTH]\n"
+  printf "Usage: $0 [DV|LS|HLS|PV|BOTH]\n"
   exit 1
 fi
 
@@ -28,7 +28,7 @@ RESULT_FILE=test_result
 
 # testing functions
 
-# $1 = DV|LS, $2 = network simulation file, $3 = print separator (no if 0, yes otherwise)
+# $1 = DV|LS|HLS|PV, $2 = network simulation file, $3 = print separator (no if 0, yes otherwise)
 function test {
   timeOut=0
   printf "\n$testNum. Testing $2 with $1router\n"
@@ -53,10 +53,14 @@ function test {
   printf "\n"
 }
 
-# $1 = DV|LS
+# $1 = DV|LS|HLS|PV
 function testAll {
   if [[ $1 == DV ]]; then
     testMessage="Testing Distance Vector routing implementation"
+  elif [[ $1 == HLS ]]; then
+    testMessage="Testing area-based Link State routing implementation"
+  elif [[ $1 == PV ]]; then
+    testMessage="Testing Path Vector routing implementation"
   else
     testMessage="Testing Link State routing implementation"
   fi
@@ -82,11 +86,8 @@ trap "rm -rf $WORKSPACE; exit 1" SIGINT
 rm -rf $WORKSPACE
 mkdir $WORKSPACE
 
-if [ $ROUTER == "DV" ]; then
-  testAll DV
-
-elif [ $ROUTER == "LS" ]; then
-  testAll LS
+if [ $ROUTER != "BOTH" ]; then
+  testAll $ROUTER
 
 else
   testAll DV
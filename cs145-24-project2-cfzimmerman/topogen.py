@@ -0,0 +1,342 @@
+import os
+import sys
+import json
+import math
+import random
+import tempfile
+import collections
+import argparse
+import routeoracle
+
+
+"""
+Generates network simulation configs in the same JSON schema as the bundled
+0*_net*.json files, for topologies far larger than the hand-written ones.
+
+    python2 topogen.py grid --rows 40 --cols 50 -o grid2000.json
+    python2 topogen.py geometric -n 2000 --flaps 20 -o geo2000.json
+    python2 topogen.py waxman -n 1000 --alpha 0.15 --beta 0.4 -o wax.json
+    python2 topogen.py fattree -k 8 -o ft8.json
+
+Routers are named R0, R1, ... (fat-tree: core/aggregation/edge names) and
+clients h0, h1, ... each hang off one router. Links get symmetric random
+costs. With --flaps, random router-router links go down and come back up
+during the run, --flap-repeats times each for churn; the config ends with
+every link up. correctRoutes lists every equal-cost shortest path between
+each pair of clients in that final topology (see routeoracle.py);
+unit-cost grids and fat-trees can have exponentially many, and
+--max-paths makes generation fail fast instead of listing them.
+maxPathCost records the most expensive one so distance vector runs can
+pick a large enough infinity. Warmup, endTime and clientSendRate grow
+with maxPathCost so routing can converge and the final traceroutes can
+cross the most expensive route. With --areas, routers are also split into
+connected areas for the area-based HLSrouter, recorded as "areas".
+"""
+
+
+def grid(rows, cols, rng):
+    """Returns (routers, edges) for a rows x cols grid"""
+    name = lambda r, c: "R%d" % (r * cols + c)
+    routers = [name(r, c) for r in range(rows) for c in range(cols)]
+    edges = []
+    for r in range(rows):
+        for c in range(cols):
+            if c + 1 < cols:
+                edges.append((name(r, c), name(r, c + 1)))
+            if r + 1 < rows:
+                edges.append((name(r, c), name(r + 1, c)))
+    return routers, edges
+
+
+def randomPoints(n, rng):
+    return [(rng.random(), rng.random()) for _ in range(n)]
+
+
+def geometric(n, radius, rng):
+    """Returns (routers, edges) for a random geometric graph on the unit
+       square: routers within radius of each other are linked"""
+    if radius is None:
+        radius = 1.5 * math.sqrt(math.log(n) / (math.pi * n))
+    points = randomPoints(n, rng)
+    # bucket points into radius-sized cells so only nearby cells are compared
+    cells = {}
+    for i, (x, y) in enumerate(points):
+        cells.setdefault((int(x / radius), int(y / radius)), []).append(i)
+    edges = set()
+    for (cx, cy), members in cells.items():
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for j in cells.get((cx + dx, cy + dy), ()):
+                    for i in members:
+                        if i < j and dist(points[i], points[j]) <= radius:
+                            edges.add((i, j))
+    return connect(n, sorted(edges), points)
+
+
+def waxman(n, alpha, beta, rng):
+    """Returns (routers, edges) for a Waxman graph: routers u and v are linked
+       with probability beta * exp(-d(u, v) / (alpha * L))"""
+    points = randomPoints(n, rng)
+    maxDist = math.sqrt(2)
+    edges = []
+    for i in range(n):
+        for j in range(i + 1, n):
+            d = dist(points[i], points[j])
+            if rng.random() < beta * math.exp(-d / (alpha * maxDist)):
+                edges.append((i, j))
+    return connect(n, edges, points)
+
+
+def fattree(k):
+    """Returns (routers, edges, hostRouters) for a k-ary fat-tree.  Each edge
+       switch has k/2 host slots, listed in hostRouters"""
+    half = k / 2
+    cores = ["c%d" % i for i in range(half * half)]
+    routers = list(cores)
+    edges = []
+    hostRouters = []
+    for pod in range(k):
+        aggs = ["a%d_%d" % (pod, i) for i in range(half)]
+        tors = ["e%d_%d" % (pod, i) for i in range(half)]
+        routers.extend(aggs + tors)
+        for i, agg in enumerate(aggs):
+            for tor in tors:
+                edges.append((agg, tor))
+            for j in range(half):
+                edges.append((cores[i * half + j], agg))
+        for tor in tors:
+            hostRouters.extend([tor] * half)
+    return routers, edges, hostRouters
+
+
+def dist(p, q):
+    return math.hypot(p[0] - q[0], p[1] - q[1])
+
+
+def connect(n, edges, points):
+    """Names routers R0..Rn-1 and links each connected component to its
+       nearest other component until the graph is connected"""
+    parent = range(n)
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j in edges:
+        parent[find(i)] = find(j)
+    edges = list(edges)
+    components = {}
+    for i in range(n):
+        components.setdefault(find(i), []).append(i)
+    groups = sorted(components.values(), key=len, reverse=True)
+    main = list(groups[0])
+    for group in groups[1:]:
+        i, j = min(((i, j) for i in group for j in main),
+                   key=lambda pair: dist(points[pair[0]], points[pair[1]]))
+        edges.append((min(i, j), max(i, j)))
+        main.extend(group)
+    return ["R%d" % i for i in range(n)], [("R%d" % i, "R%d" % j)
+                                         for i, j in edges]
+
+
+def hopDistances(adj, sources):
+    """Breadth-first hop counts from the nearest of sources.  Returns
+       {router: (hops, source)}"""
+    reached = {source: (0, source) for source in sources}
+    frontier = list(sources)
+    while frontier:
+        nextFrontier = []
+        for u in frontier:
+            hops, source = reached[u]
+            for v in adj[u]:
+                if v not in reached:
+                    reached[v] = (hops + 1, source)
+                    nextFrontier.append(v)
+        frontier = nextFrontier
+    return reached
+
+
+def assignAreas(routers, edges, count):
+    """Splits routers into count connected areas for HLSrouter.  Area seeds
+       are picked farthest-first by hops, then the areas take turns claiming
+       one unclaimed neighbor each, so they grow to similar sizes.  Returns
+       {router: area number}"""
+    adj = {router: [] for router in routers}
+    for u, v in edges:
+        adj[u].append(v)
+        adj[v].append(u)
+    seeds = [routers[0]]
+    while len(seeds) < min(count, len(routers)):
+        reached = hopDistances(adj, seeds)
+        seeds.append(max(routers, key=lambda r: reached[r][0]))
+    areas = {seed: i for i, seed in enumerate(seeds)}
+    # each area's members that may still have unclaimed neighbors
+    frontiers = [collections.deque([seed]) for seed in seeds]
+    while any(frontiers):
+        for i, frontier in enumerate(frontiers):
+            while frontier:
+                unclaimed = [v for v in adj[frontier[0]] if v not in areas]
+                if unclaimed:
+                    areas[unclaimed[0]] = i
+                    frontier.append(unclaimed[0])
+                    break
+                frontier.popleft()
+    return areas
+
+
+def build(routers, edges, hostRouters, args, rng):
+    """Assembles the config dict from a router graph"""
+    ports = {}
+
+    def nextPort(addr):
+        ports[addr] = ports.get(addr, 0) + 1
+        return ports[addr]
+
+    links = []
+    for addr1, addr2 in edges:
+        cost = rng.randint(1, args.max_cost)
+        links.append([addr1, addr2, nextPort(addr1), nextPort(addr2),
+                      cost, cost])
+    routerLinks = list(links)
+
+    numClients = min(args.clients, len(hostRouters))
+    clientRouters = {}
+    for i, router in enumerate(rng.sample(hostRouters, numClients)):
+        client = "h%d" % i
+        clientRouters[client] = router
+        links.append([client, router, 1, nextPort(router), 1, 1])
+
+    # every flapped link is back up by the end, so the final topology is
+    # the one generated
+    routes, maxPathCost = routeoracle.computeRoutes(
+        routers, sorted(clientRouters), links, args.max_paths)
+    # traffic crosses a link in cost ticks, so scale the warmup, settle time
+    # and traceroute interval to the most expensive route
+    warmup = max(args.warmup, 2 * maxPathCost)
+    changes = []
+    flapped = rng.sample(routerLinks, min(args.flaps, len(routerLinks)))
+    for link in flapped:
+        down = rng.randint(warmup, warmup + args.flap_window)
+        for i in range(args.flap_repeats):
+            up = down + rng.randint(1, args.flap_length)
+            changes.append([down, link[:2], "down"])
+            changes.append([up, link, "up"])
+            if i + 1 < args.flap_repeats:
+                down = up + rng.randint(1, args.flap_length)
+    lastChange = max([change[0] for change in changes] or [0])
+    endTime = max(args.end_time, warmup,
+                  lastChange + args.settle_time + 2 * maxPathCost)
+    # the final traceroutes get 4 send intervals to arrive
+    clientSendRate = max(args.client_send_rate, maxPathCost / 3 + 1)
+    config = {
+        "routers": routers,
+        "clients": sorted(clientRouters),
+        "clientSendRate": clientSendRate,
+        "endTime": endTime,
+        "links": links,
+        "changes": sorted(changes),
+        "correctRoutes": routes,
+        "maxPathCost": maxPathCost,
+    }
+    if args.areas:
+        config["areas"] = assignAreas(routers, edges, args.areas)
+    return config
+
+
+def generate(args):
+    """Returns the config dict described by parsed command line args"""
+    rng = random.Random(args.seed)
+    if args.topology == "grid":
+        routers, edges = grid(args.rows, args.cols, rng)
+        hostRouters = routers
+    elif args.topology == "geometric":
+        routers, edges = geometric(args.n, args.radius, rng)
+        hostRouters = routers
+    elif args.topology == "waxman":
+        routers, edges = waxman(args.n, args.alpha, args.beta, rng)
+        hostRouters = routers
+    elif args.topology == "fattree":
+        routers, edges, hostRouters = fattree(args.k)
+    return build(routers, edges, hostRouters, args, rng)
+
+
+def writeConfigs(topologies, outDir=None):
+    """Generates a config for each list of command line args in topologies
+       into outDir (a new temporary directory by default).  Returns their
+       paths, named after the topology, numbered if it repeats"""
+    outDir = outDir or tempfile.mkdtemp(prefix="topogen")
+    names = [argv[0] for argv in topologies]
+    paths = []
+    for argv in topologies:
+        name = argv[0]
+        if names.count(name) > 1:
+            name += str(len(paths))
+        path = os.path.join(outDir, name + ".json")
+        with open(path, "w") as f:
+            json.dump(generate(parseArgs(argv)), f)
+        paths.append(path)
+    return paths
+
+
+def parseArgs(argv):
+    parser = argparse.ArgumentParser(
+        description="Generate a network simulation config")
+    parser.add_argument("topology",
+                        choices=["grid", "geometric", "waxman", "fattree"])
+    parser.add_argument("-o", "--output", help="file to write (default stdout)")
+    parser.add_argument("--seed", type=int, default=145)
+    parser.add_argument("-n", type=int, default=1000,
+                        help="routers (geometric, waxman)")
+    parser.add_argument("--rows", type=int, default=30)
+    parser.add_argument("--cols", type=int, default=30)
+    parser.add_argument("--radius", type=float, default=None,
+                        help="link radius (geometric)")
+    parser.add_argument("--alpha", type=float, default=0.1)
+    parser.add_argument("--beta", type=float, default=0.4)
+    parser.add_argument("-k", type=int, default=8, help="fat-tree arity")
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--max-cost", type=int, default=10)
+    parser.add_argument("--max-paths", type=int, default=None,
+                        help="fail if a client pair has more equal-cost "
+                        "routes than this, bounding config size and "
+                        "generation time (default: list them all)")
+    parser.add_argument("--flaps", type=int, default=0,
+                        help="router links that go down and back up")
+    parser.add_argument("--warmup", type=int, default=30,
+                        help="ticks before the first flap")
+    parser.add_argument("--flap-window", type=int, default=40,
+                        help="ticks over which flaps start")
+    parser.add_argument("--flap-length", type=int, default=10,
+                        help="most ticks a flapped link stays down")
+    parser.add_argument("--flap-repeats", type=int, default=1,
+                        help="times each flapped link goes down, at most "
+                        "--flap-length ticks apart")
+    parser.add_argument("--settle-time", type=int, default=60,
+                        help="ticks after the last change before the end")
+    parser.add_argument("--end-time", type=int, default=100)
+    parser.add_argument("--client-send-rate", type=int, default=10)
+    parser.add_argument("--areas", type=int, default=0,
+                        help="split routers into this many areas (HLS)")
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parseArgs(sys.argv[1:])
+    try:
+        config = generate(args)
+    except ValueError as e:
+        sys.exit(str(e))
+    out = open(args.output, "w") if args.output else sys.stdout
+    json.dump(config, out)
+    if args.output:
+        out.close()
+        print "{}: {} routers, {} clients, {} links, {} changes, {} routes".format(
+            args.output, len(config["routers"]), len(config["clients"]),
+            len(config["links"]), len(config["changes"]),
+            len(config["correctRoutes"]))
+
+
+if __name__ == "__main__":
+    main()